@@ -0,0 +1,82 @@
+"""Benchmark of the album edition classifier used by album_selection_vol1.
+
+Builds a synthetic table of album names and compares the previous implementation
+(repeated str.contains scans plus a per-row re.search) with album_selection_vol1.
+
+Usage:
+    python benchmarks/album_selection_benchmark.py [n_albums]
+"""
+import os
+import re
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extract_transform_data import album_selection_vol1, classify_album_edition
+
+
+BASE_NAMES = ['The Wall', 'Delivered', 'The Demon Album', 'Remixed Feelings', 'Back In Black',
+              'Rumours', 'Nevermind', 'Oliver\'s Army', 'Alive', 'Deluxed']
+SUFFIXES = ['', ' (Live)', ' - Live at Wembley', ' (Deluxe Edition)', ' (Remastered)',
+            ' [Remix]', ' Demos', ' (Demo Version)', ' (Demos)', ' - Remix 2011']
+
+
+def synthetic_albums(n_albums, seed=0):
+    rng = np.random.default_rng(seed)
+    base = np.array(BASE_NAMES, dtype=object)[rng.integers(0, len(BASE_NAMES), n_albums)]
+    suffix = np.array(SUFFIXES, dtype=object)[rng.integers(0, len(SUFFIXES), n_albums)]
+    return pd.DataFrame({'album_id': np.arange(n_albums), 'album_name': base + suffix})
+
+
+# the implementation replaced by classify_album_edition
+def legacy_album_selection_vol1(df):
+    def check_album_conditions(string, pattern):
+        return bool(re.search(pattern, string, re.IGNORECASE))
+
+    df_cont = df[(df['album_name'].str.contains('live', case=False)) |
+                 (df['album_name'].str.contains('demo', case=False)) |
+                 (df['album_name'].str.contains('deluxe', case=False)) |
+                 (df['album_name'].str.contains('remix', case=False))].copy()
+    df_to_keep = df[~((df['album_name'].str.contains('live', case=False)) |
+                      (df['album_name'].str.contains('demo', case=False)) |
+                      (df['album_name'].str.contains('deluxe', case=False)) |
+                      (df['album_name'].str.contains('remix', case=False)))].copy()
+    pattern = r'(.*live[a-z].*|.*[a-z]live.*)|(.*demo[a-z].*|.*[a-z]demo.*)|(.*remix[a-z].*|.*[a-z]remix.*)|(.*deluxe[a-z].*|.*[a-z]deluxe.*)'
+    df_cont['matches_condition'] = df_cont['album_name'].apply(check_album_conditions, pattern=pattern)
+    df_cont = df_cont[df_cont['matches_condition'] == True].drop(columns=['matches_condition'], axis=1)
+    df_alb = pd.concat([df_to_keep, df_cont], axis=0)
+
+    df_cont = df_alb[df_alb['album_name'].str.contains('demos', case=False)].copy()
+    df_to_keep = df_alb[~df_alb['album_name'].str.contains('demos', case=False)].copy()
+    pattern = r'\bdemos\b(?![\w\'()])'
+    df_cont['matches_condition'] = df_cont['album_name'].apply(check_album_conditions, pattern=pattern)
+    df_cont = df_cont[df_cont['matches_condition'] == False].drop(columns=['matches_condition'], axis=1)
+    return pd.concat([df_to_keep, df_cont], axis=0)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_albums=1_000_000):
+    df = synthetic_albums(n_albums)
+    print(f'{n_albums:,} album names')
+
+    legacy, legacy_time = timed(legacy_album_selection_vol1, df)
+    print(f'legacy album_selection_vol1:    {legacy_time:8.2f} s')
+    selected, new_time = timed(album_selection_vol1, df)
+    print(f'album_selection_vol1:           {new_time:8.2f} s  ({legacy_time / new_time:.1f}x)')
+    editions, label_time = timed(classify_album_edition, df['album_name'])
+    print(f'classify_album_edition only:    {label_time:8.2f} s')
+
+    # both implementations must keep the same albums
+    assert set(legacy['album_id']) == set(selected['album_id'])
+    print(editions.value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
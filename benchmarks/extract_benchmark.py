@@ -0,0 +1,114 @@
+"""Benchmark of the extract functions, get_static_tables and the daily pipeline
+against the local mock Spotify API in mock_spotify.py.
+
+Reports wall time, requests, requests per second, 429 responses and peak Python memory
+of every step. The daily pipeline loads into a temporary SQLite database.
+
+Usage:
+    python benchmarks/extract_benchmark.py --artists 100 --latency 0.02 --burst-every 200
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_spotify import Catalog, MockSpotify
+
+
+def requests_so_far(metrics):
+    endpoints = metrics.to_dict()['endpoints'].values()
+    return sum(stats['requests'] for stats in endpoints), sum(stats['throttled'] for stats in endpoints)
+
+
+def timed(name, fn, *args, **kwargs):
+    from metrics import get_metrics
+    requests_before, throttled_before = requests_so_far(get_metrics())
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    requests_after, throttled_after = requests_so_far(get_metrics())
+    requests = requests_after - requests_before
+    print(f'{name:<36} {seconds:8.2f} s {requests:7d} req {requests / seconds:8.1f} req/s '
+          f'{throttled_after - throttled_before:5d} 429 {peak / 2**20:8.1f} MiB')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--artists', type=int, default=30)
+    parser.add_argument('--albums-per-artist', type=int, default=16)
+    parser.add_argument('--tracks-per-album', type=int, default=12)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--burst-every', type=int, default=0, help='a burst of 429s every N requests')
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--max-rps', type=float, default=1000)
+    parser.add_argument('--max-in-flight', type=int, default=8)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.artists, args.albums_per_artist, args.tracks_per_album)
+    mock = MockSpotify(catalog, latency=args.latency, burst_every=args.burst_every,
+                       retry_after=args.retry_after).start()
+    os.environ.update(mock.environ)
+    os.environ.update({'SPOTIFY_MAX_RPS': str(args.max_rps), 'SPOTIFY_MAX_IN_FLIGHT': str(args.max_in_flight),
+                       # cold runs, every response comes from the mock API
+                       'SPOTIFY_CACHE_PATH': ''})
+    warnings.simplefilter('ignore')
+    # 429 responses are expected, spotipy logs every one of them
+    logging.getLogger('spotipy').setLevel(logging.CRITICAL)
+
+    import pandas as pd
+    from spotify_client import reset_spotify_client
+    from request_engine import reset_request_engine
+    from metrics import reset_metrics
+    from db_loader import create_db_engine
+    from daily_pipeline import run_daily_pipeline
+    import extract_transform_data as etd
+    reset_spotify_client()
+    reset_request_engine()
+    reset_metrics()
+
+    artist_names = [artist['name'] for artist in catalog.artists.values()]
+    print(f'{len(catalog.artists)} artists, {len(catalog.albums)} albums, {len(catalog.tracks)} tracks, '
+          f'latency {args.latency * 1000:.0f} ms, max {args.max_rps:g} req/s, {args.max_in_flight} in flight')
+
+    artists_table = timed('extract_artists_table', etd.extract_artists_table, artist_names)
+    artist_ids = artists_table['artist_id'].to_list()
+    timed('extract_artists_snapshot', etd.extract_artists_snapshot, artist_ids)
+    albums_table = timed('extract_albums_table', etd.extract_albums_table, artist_ids)
+    albums_table = etd.album_selection_vol1(albums_table)
+    selected = timed('album_selection_vol2', etd.album_selection_vol2, albums_table, artists_table,
+                     album_cache=etd.AlbumCache())
+    tracks_table = timed('extract_tracks_data', etd.extract_tracks_data, selected['album_id'].to_list())
+    album_ids = list(catalog.albums)
+    track_ids = list(catalog.tracks)
+    timed('extract_albums_popularity_table', etd.extract_albums_popularity_table, album_ids)
+    timed('extract_tracks_popularity_table', etd.extract_tracks_popularity_table, track_ids)
+    timed('extract_tracks_acoustic_features', etd.extract_tracks_acoustic_features, tracks_table['track_id'].to_list())
+
+    static_tables = timed('get_static_tables', etd.get_static_tables, artist_names)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f'sqlite:///{os.path.join(tmp, "benchmark.db")}')
+        for table_name, table in zip(['artists_table', 'albums_table', 'tracks_table'], static_tables):
+            table.to_sql(table_name, engine, index=False)
+        # every album and track of the catalog is refreshed daily
+        pd.DataFrame({'album_id': album_ids}).to_sql('albums_table', engine, index=False, if_exists='replace')
+        pd.DataFrame({'track_id': track_ids}).to_sql('tracks_table', engine, index=False, if_exists='replace')
+        rows_written = timed('run_daily_pipeline (daily main.py)', run_daily_pipeline, engine)
+        print(f'rows written: {rows_written}')
+        engine.dispose()
+
+    print(f'mock API: {mock.request_cnt} requests, {mock.throttled_cnt} answered with 429')
+    mock.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Local stand-in for the Spotify Web API endpoints used by extract_transform_data.
+
+Serves a synthetic catalog of configurable size, with optional latency per request
+and bursts of 429 responses. Point the Spotify client at it with SPOTIFY_API_URL
+and SPOTIFY_TOKEN_URL, see MockSpotify.environ.
+
+Usage:
+    python benchmarks/mock_spotify.py [n_artists]
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+ALBUM_SUFFIXES = ['', ' (Remastered)', ' (Live)', ' (Deluxe Edition)', ' [Remix]', '', '', ' Demos']
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+
+def spotify_id(kind, *numbers):
+    """Deterministic 22 character base62 id."""
+    digest = int.from_bytes(hashlib.sha1(f'{kind}:{numbers}'.encode()).digest(), 'big')
+    chars = []
+    for _ in range(22):
+        digest, rest = divmod(digest, 62)
+        chars.append(BASE62[rest])
+    return ''.join(chars)
+
+
+class Catalog:
+    """Synthetic catalog: n_artists artists with albums_per_artist albums of tracks_per_album tracks.
+
+    Args:
+        n_artists (int): number of artists
+        albums_per_artist (int): albums of every artist
+        tracks_per_album (int): tracks of every album, above 50 the tracklist is paginated
+    """
+
+    def __init__(self, n_artists=30, albums_per_artist=16, tracks_per_album=12):
+        self.artists = {}
+        self.artist_names = {}
+        self.artist_albums = {}
+        self.albums = {}
+        self.tracks = {}
+        for a in range(n_artists):
+            artist_id = spotify_id('artist', a)
+            name = f'Artist {a:05d}'
+            self.artists[artist_id] = {'id': artist_id, 'name': name, 'type': 'artist',
+                                       'popularity': (a * 7) % 101, 'followers': {'href': None, 'total': 1000 * a},
+                                       'genres': ['rock'], 'images': []}
+            self.artist_names[name.lower()] = artist_id
+            self.artist_albums[artist_id] = []
+            for b in range(albums_per_artist):
+                album_id = spotify_id('album', a, b)
+                track_ids = [spotify_id('track', a, b, t) for t in range(tracks_per_album)]
+                self.albums[album_id] = {
+                    'id': album_id, 'album_type': 'album', 'type': 'album',
+                    'name': f'Album {a}.{b // 2}{ALBUM_SUFFIXES[b % len(ALBUM_SUFFIXES)]}',
+                    'release_date': f'{1970 + b % 40}-01-01', 'release_date_precision': 'day',
+                    'total_tracks': tracks_per_album, 'popularity': (a + b * 13) % 101,
+                    'images': [{'url': f'https://i.scdn.co/image/{album_id}/{size}', 'height': size, 'width': size}
+                               for size in (640, 300, 64)],
+                    'artists': [{'id': artist_id, 'name': name}],
+                    'track_ids': track_ids,
+                }
+                self.artist_albums[artist_id].append(album_id)
+                for t, track_id in enumerate(track_ids):
+                    self.tracks[track_id] = {
+                        'id': track_id, 'type': 'track', 'name': f'Song {t}' + (' - Live' if b % 8 == 2 else ''),
+                        'duration_ms': 120000 + 1000 * t, 'popularity': (a + b + t) % 101,
+                        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+                        'preview_url': None, 'track_number': t + 1, 'album_id': album_id,
+                    }
+
+    def simple_album(self, album_id):
+        album = self.albums[album_id]
+        return {key: value for key, value in album.items() if key not in ('popularity', 'track_ids')}
+
+    def simple_track(self, track_id):
+        return {key: value for key, value in self.tracks[track_id].items() if key not in ('popularity', 'album_id')}
+
+    def track_page(self, album_id, base_url, limit=50, offset=0):
+        track_ids = self.albums[album_id]['track_ids']
+        items = [self.simple_track(track_id) for track_id in track_ids[offset:offset + limit]]
+        has_next = offset + limit < len(track_ids)
+        return {'href': f'{base_url}/albums/{album_id}/tracks?offset={offset}&limit={limit}',
+                'items': items, 'limit': limit, 'offset': offset, 'total': len(track_ids), 'previous': None,
+                'next': f'{base_url}/albums/{album_id}/tracks?offset={offset + limit}&limit={limit}' if has_next else None}
+
+    def full_album(self, album_id, base_url):
+        album = dict(self.simple_album(album_id), popularity=self.albums[album_id]['popularity'])
+        album['tracks'] = self.track_page(album_id, base_url)
+        return album
+
+    def full_track(self, track_id):
+        track = dict(self.tracks[track_id])
+        track['album'] = self.simple_album(track.pop('album_id'))
+        return track
+
+    def audio_features(self, track_id):
+        n = int.from_bytes(track_id.encode()[:4], 'big')
+        return {'danceability': (n % 1000) / 1000, 'energy': (n % 997) / 997, 'key': n % 12,
+                'loudness': -(n % 60) / 2, 'mode': n % 2, 'speechiness': (n % 89) / 89,
+                'acousticness': (n % 83) / 83, 'instrumentalness': (n % 79) / 79, 'liveness': (n % 73) / 73,
+                'valence': (n % 71) / 71, 'tempo': 60 + n % 120, 'type': 'audio_features', 'id': track_id,
+                'uri': f'spotify:track:{track_id}',
+                'track_href': f'https://api.spotify.com/v1/tracks/{track_id}',
+                'analysis_url': f'https://api.spotify.com/v1/audio-analysis/{track_id}',
+                'duration_ms': self.tracks[track_id]['duration_ms'], 'time_signature': 4}
+
+
+class MockSpotify:
+    """Mock Spotify API server running in a background thread.
+
+    Args:
+        catalog (Catalog): catalog to serve
+        latency (float): seconds added to every response
+        burst_every (int): every burst_every-th request starts a burst of 429 responses, 0 disables bursts
+        burst_length (int): 429 responses per burst
+        retry_after (float): Retry-After header of the 429 responses, in seconds
+        bad_ids (set): ids answered with 400, also when requested with other ids, like invalid ids
+        outage_every (int): every outage_every-th request starts an outage of 502 responses, 0 disables outages
+        outage_length (int): 502 responses per outage
+    """
+
+    def __init__(self, catalog=None, latency=0.0, burst_every=0, burst_length=3, retry_after=1, bad_ids=(),
+                 outage_every=0, outage_length=10):
+        self.catalog = catalog or Catalog()
+        self.latency = latency
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.bad_ids = set(bad_ids)
+        self.outage_every = outage_every
+        self.outage_length = outage_length
+        self.request_cnt = 0
+        self.throttled_cnt = 0
+        self.failed_cnt = 0
+        self._burst_left = 0
+        self._outage_left = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    @property
+    def environ(self):
+        """Environment variables pointing the Spotify client at the mock server."""
+        return {'SPOTIFY_API_URL': f'{self.url}/v1/', 'SPOTIFY_TOKEN_URL': f'{self.url}/api/token',
+                'CLIENT_ID': 'benchmark', 'CLIENT_SECRET': 'benchmark'}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _throttle(self):
+        with self._lock:
+            self.request_cnt += 1
+            if self._burst_left == 0 and self.burst_every and self.request_cnt % self.burst_every == 0:
+                self._burst_left = self.burst_length
+            if self._burst_left:
+                self._burst_left -= 1
+                self.throttled_cnt += 1
+                return True
+        return False
+
+    def _outage(self):
+        with self._lock:
+            if self._outage_left == 0 and self.outage_every and self.request_cnt % self.outage_every == 0:
+                self._outage_left = self.outage_length
+            if self._outage_left:
+                self._outage_left -= 1
+                self.failed_cnt += 1
+                return True
+        return False
+
+    def route(self, path, query):
+        """Returns (status, body) of a GET request."""
+        catalog = self.catalog
+        base_url = f'{self.url}/v1'
+        parts = [part for part in path.split('/') if part][1:]
+        ids = query.get('ids', [''])[0].split(',') if 'ids' in query else None
+        limit = int(query.get('limit', ['20'])[0])
+        offset = int(query.get('offset', ['0'])[0])
+        if self.bad_ids & set((ids or []) + parts):
+            return 400, None
+
+        if parts == ['search']:
+            artist_id = catalog.artist_names.get(query.get('q', [''])[0].lower())
+            items = [catalog.artists[artist_id]] if artist_id else []
+            return 200, {'artists': {'items': items, 'total': len(items), 'limit': limit, 'offset': offset}}
+        if parts == ['artists'] and ids is not None:
+            return 200, {'artists': [catalog.artists.get(artist_id) for artist_id in ids]}
+        if len(parts) == 2 and parts[0] == 'artists':
+            return (200, catalog.artists[parts[1]]) if parts[1] in catalog.artists else (404, None)
+        if len(parts) == 3 and parts[0] == 'artists' and parts[2] == 'albums':
+            album_ids = catalog.artist_albums.get(parts[1])
+            if album_ids is None:
+                return 404, None
+            items = [catalog.simple_album(album_id) for album_id in album_ids[offset:offset + limit]]
+            return 200, {'items': items, 'total': len(album_ids), 'limit': limit, 'offset': offset}
+        if parts == ['albums'] and ids is not None:
+            return 200, {'albums': [catalog.full_album(album_id, base_url) if album_id in catalog.albums else None
+                                    for album_id in ids]}
+        if len(parts) == 2 and parts[0] == 'albums':
+            return (200, catalog.full_album(parts[1], base_url)) if parts[1] in catalog.albums else (404, None)
+        if len(parts) == 3 and parts[0] == 'albums' and parts[2] == 'tracks':
+            if parts[1] not in catalog.albums:
+                return 404, None
+            return 200, catalog.track_page(parts[1], base_url, limit=limit, offset=offset)
+        if parts == ['tracks'] and ids is not None:
+            return 200, {'tracks': [catalog.full_track(track_id) if track_id in catalog.tracks else None
+                                    for track_id in ids]}
+        if parts == ['audio-features'] and ids is not None:
+            return 200, {'audio_features': [catalog.audio_features(track_id) if track_id in catalog.tracks else None
+                                            for track_id in ids]}
+        return 404, None
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body if body is not None else
+                                     {'error': {'status': status, 'message': 'mock error'}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self._send(200, {'access_token': 'mock-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+            def do_GET(self):
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if mock._throttle():
+                    self._send(429, None, {'Retry-After': str(mock.retry_after)})
+                    return
+                if mock._outage():
+                    self._send(502, None)
+                    return
+                parsed = urlparse(self.path)
+                status, body = mock.route(parsed.path, parse_qs(parsed.query))
+                self._send(status, body)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    with MockSpotify(Catalog(n_artists=int(sys.argv[1]) if len(sys.argv) > 1 else 30)) as mock:
+        print(f'mock Spotify API at {mock.url}/v1/, Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,70 @@
+"""Micro-benchmark of the name and duration transforms of the static build (final_trans_tracks_table,
+final_trans_albums_table, album_selection_vol2), per-row .apply as before against the column
+operations of original_names and duration_display, with and without pyarrow.
+
+Usage:
+    python benchmarks/normalization_benchmark.py [n_rows]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import extract_transform_data
+from extract_transform_data import original_names, duration_display
+
+NAMES = ['Rumours', 'Rumours (Super Deluxe)', 'Tusk [2015 Remaster]', 'Go Your Own Way - 2004 Remaster',
+         'Dreams - Live', 'Landslide (Live) [Remastered]', ' Albatross ', 'Über (Édition)']
+
+
+def ms_to_minutes_seconds(duration):
+    duration_tuple = divmod(duration // 1000, 60)
+    return f"{duration_tuple[0]}:{duration_tuple[1]}"
+
+
+def previous(names, durations):
+    return [durations.apply(ms_to_minutes_seconds),
+            names.apply(lambda x: x.split('-')[0].strip()),
+            names.apply(lambda x: str(x.split('(')[0].strip())).apply(lambda x: x.split('[')[0].strip())]
+
+
+def vectorized(names, durations):
+    return [duration_display(durations), original_names(names, '-'), original_names(names, ['(', '['])]
+
+
+def timed(function, *args, repeat=3):
+    # best of repeat runs
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    # every other row, like the filtered tables of the static build
+    index = np.arange(0, 2 * n_rows, 2)
+    names = pd.Series(np.array(NAMES, dtype=object)[rng.integers(0, len(NAMES), n_rows)]
+                      + rng.integers(0, 1000, n_rows).astype(str).astype(object), index=index)
+    durations = pd.Series(rng.integers(30_000, 900_000, n_rows), index=index, dtype='int32')
+
+    expected, previous_seconds = timed(previous, names, durations)
+    print(f'{n_rows} rows, duration display and track and album name cleanup')
+    print(f'.apply per row:       {previous_seconds:6.2f} s')
+    result, seconds = timed(vectorized, names, durations)
+    print(f'column operations:    {seconds:6.2f} s, {previous_seconds / seconds:.1f}x faster, '
+          f'pyarrow {extract_transform_data.pa is not None}, same result {all(map(pd.Series.equals, expected, result))}')
+    pa, extract_transform_data.pa = extract_transform_data.pa, None
+    result, seconds = timed(vectorized, names, durations)
+    extract_transform_data.pa = pa
+    print(f'without pyarrow:      {seconds:6.2f} s, {previous_seconds / seconds:.1f}x faster, '
+          f'same result {all(map(pd.Series.equals, expected, result))}')
+
+
+if __name__ == '__main__':
+    main()
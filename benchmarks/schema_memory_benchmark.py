@@ -0,0 +1,49 @@
+"""Memory of a popularity history held in memory, e.g. by a backfill job, with the previous
+dtypes (object ids, int64 popularity, python dates) and with the compact schema of schema.py.
+
+Usage:
+    python benchmarks/schema_memory_benchmark.py [n_tracks] [n_days]
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_spotify import spotify_id
+from schema import apply_schema, concat_tables
+
+
+def daily_snapshot(track_ids, day, rng):
+    return pd.DataFrame({'track_id': track_ids,
+                         'track_popularity': rng.integers(0, 101, len(track_ids)),
+                         'date': day})
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    rng = np.random.default_rng(0)
+    track_ids = [spotify_id('track', i) for i in range(n_tracks)]
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(n_days)]
+
+    start = time.perf_counter()
+    previous = pd.concat([daily_snapshot(track_ids, day, rng) for day in days], ignore_index=True)
+    previous_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    compact = concat_tables([apply_schema(daily_snapshot(track_ids, day, rng), 'tracks_popularity_table')
+                             for day in days], 'tracks_popularity_table')
+    compact_seconds = time.perf_counter() - start
+
+    previous_bytes = previous.memory_usage(deep=True).sum()
+    compact_bytes = compact.memory_usage(deep=True).sum()
+    print(f'{len(previous)} rows ({n_tracks} tracks x {n_days} days)')
+    print(f'previous dtypes: {previous_bytes / 2**20:8.1f} MiB, built in {previous_seconds:.2f} s')
+    print(f'compact schema:  {compact_bytes / 2**20:8.1f} MiB, built in {compact_seconds:.2f} s')
+    print(f'{previous_bytes / compact_bytes:.1f}x smaller, dtypes: {dict(compact.dtypes.astype(str))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark of the track similarity index: build time, latency of one lookup, throughput of
+batched lookups and of incremental adds, compared with scoring every track per request
+in pandas. The results are checked against an exact float64 ranking.
+
+Usage:
+    python benchmarks/similarity_benchmark.py [n_tracks] [k]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mock_spotify import spotify_id
+from schema import apply_schema
+from track_similarity import FEATURE_COLUMNS, SimilarityIndex
+
+
+def features_table(track_ids, rng):
+    n = len(track_ids)
+    df = pd.DataFrame({'track_id': track_ids})
+    for column in FEATURE_COLUMNS:
+        df[column] = rng.random(n)
+    df['loudness'] = rng.normal(-8, 4, n)
+    df['tempo'] = rng.normal(120, 30, n)
+    return apply_schema(df, 'tracks_features_table')
+
+
+def per_request(df, track_id, k):
+    # what a lookup without an index does: standardize and score every track for one query
+    features = df.set_index('track_id')[FEATURE_COLUMNS].astype('float64')
+    features = (features - features.mean()) / features.std(ddof=0)
+    features = features.div(np.sqrt((features ** 2).sum(axis=1)), axis=0)
+    scores = features @ features.loc[track_id]
+    return scores.drop(track_id).nlargest(k)
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 150_000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rng = np.random.default_rng(0)
+    df = features_table([spotify_id('track', i) for i in range(n_tracks)], rng)
+    new_tracks = features_table([spotify_id('track', n_tracks + i) for i in range(n_tracks // 10)], rng)
+
+    start = time.perf_counter()
+    index = SimilarityIndex.from_table(df)
+    build_seconds = time.perf_counter() - start
+    print(f'{n_tracks} tracks, {len(FEATURE_COLUMNS)} features, k={k}')
+    print(f'build:                {build_seconds:8.3f} s')
+
+    queries = df['track_id'].sample(min(1000, n_tracks), random_state=0).tolist()
+    start = time.perf_counter()
+    for track_id in queries[:100]:
+        index.most_similar(track_id, k)
+    one_seconds = (time.perf_counter() - start) / 100
+    print(f'one track:            {one_seconds * 1000:8.2f} ms per lookup')
+
+    start = time.perf_counter()
+    result = index.most_similar(queries, k)
+    batch_seconds = time.perf_counter() - start
+    print(f'{len(queries)} tracks at once:  {batch_seconds:8.3f} s ({len(queries) / batch_seconds:.0f} lookups/s)')
+
+    start = time.perf_counter()
+    for track_id in queries[:5]:
+        per_request(df, track_id, k)
+    baseline_seconds = (time.perf_counter() - start) / 5
+    print(f'per request (pandas): {baseline_seconds * 1000:8.2f} ms per lookup, '
+          f'{baseline_seconds / one_seconds:.0f}x slower than one indexed lookup')
+
+    start = time.perf_counter()
+    added = index.add(new_tracks)
+    add_seconds = time.perf_counter() - start
+    print(f'add {added} tracks:     {add_seconds:8.3f} s, index holds {len(index)} tracks')
+
+    # exact ranking in float64 with the same standardization
+    matrix = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    vectors = (matrix - index.mean) / index.std
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = {track_id: row for row, track_id in enumerate(df['track_id'].astype(str))}
+    found = result.groupby('track_id', sort=False)['similar_track_id'].apply(list)
+    overlap = []
+    for track_id in queries[:50]:
+        scores = vectors[:n_tracks] @ vectors[rows[track_id]]
+        scores[rows[track_id]] = -np.inf
+        exact = set(df['track_id'].astype(str).to_numpy()[np.argsort(-scores)[:k]])
+        overlap.append(len(exact & set(found[track_id])) / k)
+    print(f'recall@{k} against the exact ranking: {np.mean(overlap):.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import date
+
+
+# checkpoint file, in the temp directory so it is writable wherever the job runs,
+# overridden by env CHECKPOINT_PATH
+CHECKPOINT_PATH = os.path.join(tempfile.gettempdir(), 'spotify_checkpoints.sqlite')
+
+
+def batch_key(ids):
+    """Stable key of a batch of ids."""
+    return hashlib.sha1(','.join(map(str, ids)).encode()).hexdigest()
+
+
+class CheckpointStore:
+    """SQLite store of completed extraction batches, keyed by run id, run date, stage and batch key.
+    Extract functions save the rows extracted from every completed batch, so a failed run that is
+    started again with the same run id on the same date skips the batches already done.
+    The store is a local file for one process: a run resumes only when it is started again on the
+    same machine, and instances running in parallel, e.g. the shards of the daily run, need
+    a file each, SQLite files must not be shared over network storage.
+
+    Args:
+        path (str, optional): SQLite file, defaults to env CHECKPOINT_PATH or CHECKPOINT_PATH
+    """
+
+    def __init__(self, path=None):
+        path = path or os.getenv('CHECKPOINT_PATH') or CHECKPOINT_PATH
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS checkpoints ('
+            'run_id TEXT NOT NULL, run_date TEXT NOT NULL, stage TEXT NOT NULL, '
+            'batch_key TEXT NOT NULL, payload TEXT NOT NULL, '
+            'PRIMARY KEY (run_id, run_date, stage, batch_key))')
+        self._conn.commit()
+
+    def run(self, run_id, run_date=None):
+        """Returns the checkpoint of one run.
+
+        Args:
+            run_id (str): e.g. 'static' or 'daily'
+            run_date (datetime.date, optional): defaults to today
+
+        Returns:
+            RunCheckpoint: checkpoint passed to the extract functions
+        """
+        return RunCheckpoint(self, run_id, (run_date or date.today()).isoformat())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RunCheckpoint:
+    """Completed batches of one run, see CheckpointStore.run."""
+
+    def __init__(self, store, run_id, run_date):
+        self.store = store
+        self.run_id = run_id
+        self.run_date = run_date
+
+    def load_many(self, stage, keys):
+        """Returns the saved payloads of the given batch keys.
+
+        Returns:
+            dict: batch key -> payload, only for completed batches
+        """
+        keys = list(keys)
+        found = {}
+        with self.store._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self.store._conn.execute(
+                    f'SELECT batch_key, payload FROM checkpoints '
+                    f'WHERE run_id = ? AND run_date = ? AND stage = ? '
+                    f'AND batch_key IN ({", ".join("?" * len(chunk))})',
+                    [self.run_id, self.run_date, stage, *chunk]).fetchall()
+                found.update((key, json.loads(payload)) for key, payload in rows)
+        return found
+
+    def save(self, stage, key, payload):
+        """Saves the payload of a completed batch."""
+        self.save_many(stage, {key: payload})
+
+    def save_many(self, stage, payloads):
+        """Saves the payloads of completed batches with one commit.
+
+        Args:
+            stage (str): extraction stage
+            payloads (dict): batch key -> JSON serializable payload
+        """
+        rows = [(self.run_id, self.run_date, stage, key, json.dumps(payload)) for key, payload in payloads.items()]
+        with self.store._lock:
+            self.store._conn.executemany('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)', rows)
+            self.store._conn.commit()
+
+    def clear(self):
+        """Deletes every batch of the run, e.g. after the run has finished."""
+        with self.store._lock:
+            self.store._conn.execute('DELETE FROM checkpoints WHERE run_id = ? AND run_date = ?',
+                                     (self.run_id, self.run_date))
+            self.store._conn.commit()
@@ -0,0 +1,492 @@
+import logging
+import os
+import queue
+import threading
+import zlib
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+import sqlalchemy
+# imort functions to extract dat from Spotify API
+from extract_transform_data import (extract_artists_snapshot, extract_artists_followers_table,
+                                    extract_artists_popularity_table, extract_albums_popularity_table,
+                                    extract_tracks_popularity_table)
+from db_loader import bulk_load, LoadStats
+from schema import ID_LENGTH, SNAPSHOT_KEYS, TABLE_SCHEMAS, apply_schema
+from metrics import stage
+
+
+# ids read from the database at a time
+ID_CHUNKSIZE = 5000
+# extracted chunks waiting to be written, bounds memory use
+QUEUE_SIZE = 4
+# one row per finished shard of a daily run
+SHARD_MARKERS_TABLE = 'daily_shard_markers'
+# ids of a shard of a daily run still failing after the retries, with the stage and the last error
+FAILED_IDS_TABLE = 'daily_failed_ids'
+# last known row per id of a daily table in change-only mode, e.g. tracks_popularity_table_latest
+LATEST_TABLE_SUFFIX = '_latest'
+# ids per query of the last known rows, SQL Server allows 2100 parameters
+LATEST_IDS_PER_QUERY = 1000
+
+_DONE = object()
+
+logger = logging.getLogger(__name__)
+
+
+def read_ids_in_chunks(con, table_name, id_column, chunksize=ID_CHUNKSIZE):
+    """Reads the ids of a static table in chunks, ordered by id. Every chunk is a separate
+    short query, so no cursor is held open while the chunks are being written.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): e.g. 'tracks_table'
+        id_column (str): e.g. 'track_id'
+        chunksize (int): ids per chunk
+
+    Yields:
+        list: ids
+    """
+    column = sqlalchemy.column(id_column)
+    table = sqlalchemy.table(table_name, column)
+    last_id = None
+    while True:
+        query = sqlalchemy.select(column).order_by(column).limit(chunksize)
+        if last_id is not None:
+            query = query.where(column > last_id)
+        with con.connect() as conn:
+            ids = conn.execute(query.select_from(table)).scalars().all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def shard_of(id_, shard_count):
+    """Stable shard of an id, the same in every process and python version."""
+    return zlib.crc32(id_.encode()) % shard_count
+
+
+def shard_reader(read_ids, shard_index, shard_count):
+    """Wraps a read_ids function so it yields only the ids of one shard, in chunks of the requested size.
+
+    Args:
+        read_ids (callable): e.g. read_ids_in_chunks
+        shard_index (int): shard of this instance, from 0 to shard_count - 1
+        shard_count (int): number of instances sharing the daily run
+
+    Returns:
+        callable: read_ids(con, table_name, id_column, chunksize) for run_daily_pipeline
+    """
+    def read_shard_ids(con, table_name, id_column, chunksize=ID_CHUNKSIZE):
+        shard_ids = []
+        for ids in read_ids(con, table_name, id_column, chunksize=chunksize):
+            shard_ids.extend(id_ for id_ in ids if shard_of(id_, shard_count) == shard_index)
+            while len(shard_ids) >= chunksize:
+                yield shard_ids[:chunksize]
+                shard_ids = shard_ids[chunksize:]
+        if shard_ids:
+            yield shard_ids
+    return read_shard_ids
+
+
+def _shard_markers_table():
+    return sqlalchemy.Table(
+        SHARD_MARKERS_TABLE, sqlalchemy.MetaData(),
+        sqlalchemy.Column('run_date', sqlalchemy.Date, nullable=False),
+        sqlalchemy.Column('shard_index', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('shard_count', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('rows_written', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('completed_at', sqlalchemy.DateTime, nullable=False))
+
+
+def mark_shard_complete(con, shard_index, shard_count, rows_written=0, run_date=None):
+    """Records that a shard of the daily run has landed. Marking the same shard again replaces its row.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        shard_index (int): shard of this instance
+        shard_count (int): number of shards of the run
+        rows_written (int): rows loaded by the shard
+        run_date (datetime.date, optional): defaults to today
+    """
+    markers = _shard_markers_table()
+    run_date = run_date or date.today()
+    with con.begin() as conn:
+        markers.create(conn, checkfirst=True)
+        conn.execute(markers.delete().where(markers.c.run_date == run_date, markers.c.shard_count == shard_count,
+                                            markers.c.shard_index == shard_index))
+        conn.execute(markers.insert().values(run_date=run_date, shard_index=shard_index, shard_count=shard_count,
+                                             rows_written=rows_written, completed_at=datetime.now()))
+
+
+def completed_shards(con, shard_count, run_date=None):
+    """Returns the indices of the shards of a daily run that have landed.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        shard_count (int): number of shards of the run
+        run_date (datetime.date, optional): defaults to today
+
+    Returns:
+        set: shard indices
+    """
+    markers = _shard_markers_table()
+    with con.connect() as conn:
+        if not sqlalchemy.inspect(conn).has_table(SHARD_MARKERS_TABLE):
+            return set()
+        query = sqlalchemy.select(markers.c.shard_index).where(markers.c.run_date == (run_date or date.today()),
+                                                               markers.c.shard_count == shard_count)
+        return set(conn.execute(query).scalars())
+
+
+def all_shards_complete(con, shard_count, run_date=None):
+    """True when every shard of the daily run has landed, e.g. for a final step after the shards."""
+    return len(completed_shards(con, shard_count, run_date)) == shard_count
+
+
+def read_shard_markers(con, start, end):
+    """Reads the shards of the daily runs that landed between two dates.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        start (datetime.date): first date, inclusive
+        end (datetime.date): last date, inclusive
+
+    Returns:
+        pandas.DataFrame: run_date, shard_index and shard_count of every landed shard,
+        None when no run has recorded markers
+    """
+    markers = _shard_markers_table()
+    with con.connect() as conn:
+        if not sqlalchemy.inspect(conn).has_table(SHARD_MARKERS_TABLE):
+            return None
+        query = (sqlalchemy.select(markers.c.run_date, markers.c.shard_index, markers.c.shard_count)
+                 .where(markers.c.run_date.between(start, end)))
+        df = pd.read_sql(query, conn)
+    return df.assign(run_date=pd.to_datetime(df['run_date']).astype('datetime64[ns]'))
+
+
+def _failed_ids_table():
+    return sqlalchemy.Table(
+        FAILED_IDS_TABLE, sqlalchemy.MetaData(),
+        sqlalchemy.Column('run_date', sqlalchemy.Date, nullable=False),
+        sqlalchemy.Column('shard_index', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('shard_count', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('stage', sqlalchemy.String(50), nullable=False),
+        sqlalchemy.Column('id', sqlalchemy.String(ID_LENGTH), nullable=False),
+        sqlalchemy.Column('error', sqlalchemy.Text))
+
+
+def save_failed_ids(con, failures, shard_index, shard_count, run_date=None):
+    """Records the ids a shard of the daily run could not extract, so they can be found and
+    requested again. Saving the same shard again replaces its rows, so a re-run that extracted
+    the ids leaves none behind.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        failures (extract_transform_data.FailedIds): failed ids of the run
+        shard_index (int): shard of this instance
+        shard_count (int): number of shards of the run
+        run_date (datetime.date, optional): defaults to today
+
+    Returns:
+        int: number of saved ids
+    """
+    table = _failed_ids_table()
+    run_date = run_date or date.today()
+    rows = [{'run_date': run_date, 'shard_index': shard_index, 'shard_count': shard_count,
+             'stage': row.stage, 'id': row.id, 'error': row.error} for row in failures.to_frame().itertuples()]
+    with con.begin() as conn:
+        table.create(conn, checkfirst=True)
+        conn.execute(table.delete().where(table.c.run_date == run_date, table.c.shard_count == shard_count,
+                                          table.c.shard_index == shard_index))
+        if rows:
+            conn.execute(table.insert(), rows)
+    return len(rows)
+
+
+def read_failed_ids(con, run_date=None):
+    """Reads the ids the shards of a daily run could not extract.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        run_date (datetime.date, optional): defaults to today
+
+    Returns:
+        pandas.DataFrame: shard_index, shard_count, stage, id and error of every failed id
+    """
+    table = _failed_ids_table()
+    with con.connect() as conn:
+        if not sqlalchemy.inspect(conn).has_table(FAILED_IDS_TABLE):
+            return pd.DataFrame(columns=['shard_index', 'shard_count', 'stage', 'id', 'error'])
+        query = (sqlalchemy.select(table.c.shard_index, table.c.shard_count, table.c.stage, table.c.id, table.c.error)
+                 .where(table.c.run_date == (run_date or date.today())))
+        return pd.read_sql(query, conn)
+
+
+def extract_artists_tables(artist_ids, checkpoint=None, failures=None):
+    # one batched artist fetch feeds both artist tables
+    artists_snapshot = extract_artists_snapshot(artist_ids=artist_ids, checkpoint=checkpoint, failures=failures)
+    return [('artists_followers_table',
+             extract_artists_followers_table(artist_ids=artist_ids, artists_snapshot=artists_snapshot)),
+            ('artists_popularity_table',
+             extract_artists_popularity_table(artist_ids=artist_ids, artists_snapshot=artists_snapshot))]
+
+
+def extract_albums_tables(album_ids, checkpoint=None, failures=None):
+    return [('albums_popularity_table', extract_albums_popularity_table(album_ids=album_ids, checkpoint=checkpoint,
+                                                                        failures=failures))]
+
+
+def extract_tracks_tables(track_ids, checkpoint=None, failures=None):
+    return [('tracks_popularity_table', extract_tracks_popularity_table(track_ids=track_ids, checkpoint=checkpoint,
+                                                                        failures=failures))]
+
+
+# a daily table row is identified by id and date, so same-day re-runs replace rows
+DAILY_TABLE_KEYS = SNAPSHOT_KEYS
+
+
+def load_daily_table(df, table_name, con):
+    """Upserts a chunk of a daily table, keyed by DAILY_TABLE_KEYS."""
+    return bulk_load(df, table_name, con, key_columns=DAILY_TABLE_KEYS.get(table_name))
+
+
+def latest_table_name(table_name):
+    """Table with the last known row of every id of a daily table, kept by load_daily_changes."""
+    return f'{table_name}{LATEST_TABLE_SUFFIX}'
+
+
+def read_latest_values(con, table_name, ids):
+    """Reads the last known row of the given ids of a daily table, written by load_daily_changes.
+    Ids are sent in batches, below the parameter limit of SQL Server.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): daily table, e.g. 'tracks_popularity_table'
+        ids (list): ids to read
+
+    Returns:
+        pandas.DataFrame: one row per id with a known value, empty when nothing is known yet
+    """
+    id_column = DAILY_TABLE_KEYS[table_name][0]
+    latest_name = latest_table_name(table_name)
+    ids = [str(id_) for id_ in ids]
+    frames = []
+    with con.connect() as conn:
+        if sqlalchemy.inspect(conn).has_table(latest_name):
+            latest = sqlalchemy.Table(latest_name, sqlalchemy.MetaData(), autoload_with=conn)
+            for i in range(0, len(ids), LATEST_IDS_PER_QUERY):
+                query = latest.select().where(latest.c[id_column].in_(ids[i:i + LATEST_IDS_PER_QUERY]))
+                frames.append(pd.read_sql(query, conn))
+    if not frames:
+        return pd.DataFrame(columns=list(TABLE_SCHEMAS[table_name]))
+    return apply_schema(pd.concat(frames, ignore_index=True), table_name)
+
+
+def changed_rows(df, latest, table_name):
+    """Rows of a fresh snapshot whose values differ from the last known values, or whose id
+    has no known value yet.
+
+    Args:
+        df (pandas.DataFrame): fresh snapshot of a daily table
+        latest (pandas.DataFrame): last known rows, as returned by read_latest_values
+        table_name (str): daily table, e.g. 'tracks_popularity_table'
+
+    Returns:
+        pandas.DataFrame: the changed rows of df
+    """
+    keys = DAILY_TABLE_KEYS[table_name]
+    id_column = keys[0]
+    value_columns = [column for column in df.columns if column not in keys]
+    if latest.empty:
+        return df
+    known = latest.set_index(latest[id_column].astype(str))[value_columns]
+    known = known.reindex(df[id_column].astype(str))
+    changed = known.isna().any(axis=1).to_numpy()
+    for column in value_columns:
+        changed |= known[column].to_numpy() != df[column].to_numpy()
+    return df[changed]
+
+
+def load_daily_changes(df, table_name, con):
+    """Change-only load of a chunk of a daily table. Only rows whose values differ from the last
+    known values of their id are upserted, and the last known values are updated with them.
+    On the first change-only run every id is new, so every row is written once.
+    read_daily_series reconstructs the full daily series of a table loaded this way.
+
+    Args:
+        df (pandas.DataFrame): fresh snapshot of a daily table
+        table_name (str): daily table, e.g. 'tracks_popularity_table'
+        con (sqlalchemy.engine.Engine): database engine
+
+    Returns:
+        db_loader.LoadStats: stats of the load into the daily table, rows are the changed rows
+    """
+    keys = DAILY_TABLE_KEYS[table_name]
+    changes = changed_rows(df, read_latest_values(con, table_name, df[keys[0]].tolist()), table_name)
+    logger.info(f'{table_name}: {len(changes)} of {len(df)} rows changed')
+    if changes.empty:
+        return LoadStats(table_name, 0, 0.0, 0.0)
+    stats = bulk_load(changes, table_name, con, key_columns=keys)
+    # after the daily table, so a failed run writes the same changes again when it is retried
+    bulk_load(changes, latest_table_name(table_name), con, key_columns=keys[:1])
+    return stats
+
+
+# load function of run_daily_pipeline for every DAILY_WRITE_MODE
+DAILY_LOADS = {'full': load_daily_table, 'changes': load_daily_changes}
+
+
+def get_daily_load():
+    """Returns the load function of the DAILY_WRITE_MODE environment variable,
+    'full' (default, one row per id and day) or 'changes' (only changed rows).
+    """
+    mode = os.getenv('DAILY_WRITE_MODE', 'full')
+    if mode not in DAILY_LOADS:
+        raise ValueError(f'DAILY_WRITE_MODE must be one of {list(DAILY_LOADS)}, got {mode}')
+    return DAILY_LOADS[mode]
+
+
+def read_daily_series(con, table_name, start, end, ids=None):
+    """Reconstructs the full daily series of a daily table between two dates, one row per id and day.
+    Every day gets the last row written on or before it, so tables loaded by load_daily_changes
+    read the same as tables loaded in full. Only the last row of every id before start and the rows
+    between start and end are read.
+    Values are carried forward only to the days on which the daily run landed for the id, as
+    recorded by mark_shard_complete, so days without a run are left out. Without recorded runs every
+    day is filled. Ids removed from the static tables keep their last value, pass ids to leave them out.
+    Ids without a row on or before a day are left out of it.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): daily table, e.g. 'tracks_popularity_table'
+        start (datetime.date): first date, inclusive
+        end (datetime.date): last date, inclusive
+        ids (list, optional): ids to read, defaults to every id
+
+    Returns:
+        pandas.DataFrame: rows ordered by date and id, with the compact dtypes of schema.py
+    """
+    keys = DAILY_TABLE_KEYS[table_name]
+    id_column = keys[0]
+    with con.connect() as conn:
+        table = sqlalchemy.Table(table_name, sqlalchemy.MetaData(), autoload_with=conn)
+        id_filter = table.c[id_column].in_([str(id_) for id_ in ids]) if ids is not None else sqlalchemy.true()
+        # the value of every id on the day before start
+        before = (sqlalchemy.select(table.c[id_column], sqlalchemy.func.max(table.c['date']).label('date'))
+                  .where(table.c['date'] < start, id_filter).group_by(table.c[id_column]).subquery())
+        carried = sqlalchemy.select(table).join(
+            before, sqlalchemy.and_(table.c[id_column] == before.c[id_column], table.c['date'] == before.c['date']))
+        in_range = sqlalchemy.select(table).where(table.c['date'].between(start, end), id_filter)
+        rows = pd.read_sql(sqlalchemy.union_all(carried, in_range), conn)
+    rows = apply_schema(rows, table_name)
+    columns = keys + [column for column in rows.columns if column not in keys]
+    rows = rows.assign(**{id_column: rows[id_column].astype(str)}).sort_values([id_column, 'date'], ignore_index=True)
+    markers = read_shard_markers(con, start, end)
+
+    # days to fill: the days of a run or of a written row, or every day without recorded runs
+    first, last = np.datetime64(start, 'ns'), np.datetime64(end, 'ns')
+    changed = rows['date'].to_numpy(dtype='datetime64[ns]')
+    if markers is None:
+        days = pd.date_range(start, end, freq='D').to_numpy(dtype='datetime64[ns]')
+    else:
+        days = np.union1d(markers['run_date'].to_numpy(dtype='datetime64[ns]'), changed[changed >= first])
+    # every row holds from its day, or start, until the next row of its id
+    same_id = (rows[id_column].shift(-1) == rows[id_column]).to_numpy()
+    until = np.where(same_id, np.roll(changed, -1), last + np.timedelta64(1, 'D'))
+    lo = np.searchsorted(days, np.maximum(changed, first), side='left')
+    counts = np.maximum(np.searchsorted(days, until, side='left') - lo, 0)
+    positions = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(len(positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+    series = rows.iloc[positions].reset_index(drop=True)
+    series['date'] = days[np.repeat(lo, counts) + offsets]
+
+    if markers is not None and len(series):
+        # a carried value needs a run of the id's shard on that day, written rows are always kept
+        keep = series['date'].to_numpy() == changed[positions]
+        for shard_count, shard_markers in markers.groupby('shard_count'):
+            shards = np.array([shard_of(id_, shard_count) for id_ in rows[id_column]], dtype=np.int64)[positions]
+            landed = pd.MultiIndex.from_frame(shard_markers[['run_date', 'shard_index']])
+            keep |= pd.MultiIndex.from_arrays([series['date'], shards]).isin(landed)
+        series = series[keep]
+    series = series[columns].sort_values(['date', id_column], ignore_index=True)
+    return apply_schema(series, table_name)
+
+
+# static table, id column, function returning (daily table, DataFrame) pairs for a chunk of ids
+# extract functions take the ids, an optional checkpoint and an optional FailedIds
+DAILY_STAGES = [
+    ('artists_table', 'artist_id', extract_artists_tables),
+    ('albums_table', 'album_id', extract_albums_tables),
+    ('tracks_table', 'track_id', extract_tracks_tables),
+]
+
+
+def run_daily_pipeline(con, load=load_daily_table, stages=DAILY_STAGES, id_chunksize=ID_CHUNKSIZE,
+                       queue_size=QUEUE_SIZE, checkpoint=None, snapshot_store=None, read_ids=read_ids_in_chunks,
+                       failures=None):
+    """Extracts and loads the daily tables as a producer-consumer pipeline.
+    Ids are read in chunks and every chunk is extracted and handed to a writer thread,
+    which loads it into the database while the next chunk is being extracted.
+    At most queue_size extracted chunks are held in memory. Chunks are upserted by (id, date),
+    so running the job twice on the same day does not duplicate rows.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        load (callable): load(df, table_name, con), writes one chunk and returns its
+            db_loader.LoadStats, e.g. load_daily_changes to write only changed rows
+        stages (list): (static table, id column, extract function) for every daily stage
+        id_chunksize (int): ids extracted at a time
+        queue_size (int): extracted chunks waiting to be written
+        checkpoint (checkpoint.RunCheckpoint, optional): checkpoint of the run. Batches completed by
+            an earlier attempt on the same day are not requested again.
+        snapshot_store (snapshot_store.SnapshotStore, optional): every loaded chunk is also
+            written to this Parquet store
+        read_ids (callable): read_ids(con, table_name, id_column, chunksize), yields chunks of ids,
+            e.g. ids cached across invocations
+        failures (extract_transform_data.FailedIds, optional): ids whose requests still failed after
+            the retries are recorded in it, the rest of the chunk is loaded
+
+    Returns:
+        dict: rows written per daily table
+    """
+    chunks = queue.Queue(maxsize=queue_size)
+    rows_written = {}
+    errors = []
+
+    def writer():
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                return
+            table_name, df = item
+            # keep draining after a failure, so the producer never blocks
+            if errors:
+                continue
+            try:
+                stats = load(df, table_name, con)
+                if snapshot_store is not None:
+                    snapshot_store.write(df, table_name)
+                rows_written[table_name] = rows_written.get(table_name, 0) + stats.rows
+            except Exception as e:
+                errors.append(e)
+
+    writer_thread = threading.Thread(target=writer, name='daily-writer', daemon=True)
+    writer_thread.start()
+    try:
+        for table_name, id_column, extract in stages:
+            for ids in read_ids(con, table_name, id_column, chunksize=id_chunksize):
+                if errors:
+                    break
+                with stage(f'daily:{extract.__name__}'):
+                    extracted = extract(ids, checkpoint=checkpoint, failures=failures)
+                for daily_table_name, df in extracted:
+                    chunks.put((daily_table_name, df))
+    finally:
+        chunks.put(_DONE)
+        writer_thread.join()
+    if errors:
+        raise errors[0]
+    return rows_written
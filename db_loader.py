@@ -0,0 +1,165 @@
+import logging
+import time
+import uuid
+from collections import namedtuple
+import pandas as pd
+import sqlalchemy
+from metrics import get_metrics
+# compact dtypes of the extracted tables
+from schema import apply_schema, to_sql_frame
+
+
+# rows sent per executemany call
+CHUNKSIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+LoadStats = namedtuple('LoadStats', ['table_name', 'rows', 'seconds', 'rows_per_second'])
+
+# album ids looked at by static runs, selected or rejected, so incremental runs skip them
+PROCESSED_ALBUMS_TABLE = 'processed_albums_table'
+
+
+def create_db_engine(connection_url, **kwargs):
+    """Creates a SQLAlchemy engine. For SQL Server over pyodbc, parameters of
+    executemany calls are sent in one round trip (fast_executemany).
+
+    Args:
+        connection_url (str): SQLAlchemy database URL.
+
+    Returns:
+        sqlalchemy.engine.Engine: database engine
+    """
+    if connection_url.startswith('mssql+pyodbc'):
+        kwargs.setdefault('fast_executemany', True)
+    return sqlalchemy.create_engine(connection_url, **kwargs)
+
+
+def _quote(con, name):
+    return con.dialect.identifier_preparer.quote(name)
+
+
+def bulk_load(df, table_name, con, chunksize=CHUNKSIZE, staging=False, key_columns=None):
+    """Appends a DataFrame to a database table in chunks, each chunk sent with one executemany call.
+    With staging=True the rows are first written to a staging table and then copied into
+    table_name with one INSERT ... SELECT, in a single transaction.
+    With key_columns, e.g. ['track_id', 'date'], the load goes through the staging table and
+    target rows with the same key are deleted first, so loading the same snapshot twice
+    replaces the rows instead of duplicating them. A target table created by the load gets an
+    index on key_columns. Tables created before need one too, see create_key_index, otherwise
+    every load scans the whole table.
+    Tables with compact dtypes (see schema.py) are written with the same column types as before.
+    Rows per second are logged and returned.
+
+    Args:
+        df (pandas.DataFrame): rows to load
+        table_name (str): target table
+        con (sqlalchemy.engine.Engine): database engine
+        chunksize (int): rows per executemany call
+        staging (bool): load through a staging table
+        key_columns (list, optional): columns identifying a row, e.g. id and date
+
+    Returns:
+        LoadStats: table name, number of rows, seconds and rows per second
+    """
+    start = time.perf_counter()
+    rows = len(df)
+    # string keys get a bounded length in both tables, SQL Server cannot index VARCHAR(max)
+    df, dtype = to_sql_frame(df, key_columns or ())
+    if staging or key_columns:
+        # unique name, so concurrent loads into the same table do not collide
+        staging_name = f'{table_name}_staging_{uuid.uuid4().hex[:8]}'
+        target = _quote(con, table_name)
+        source = _quote(con, staging_name)
+        columns = ', '.join(_quote(con, column) for column in df.columns)
+        with con.begin() as conn:
+            # create the target table on the first load, with an index on the key columns, so the
+            # DELETE of every keyed load looks the keys up instead of scanning the whole table
+            if not sqlalchemy.inspect(conn).has_table(table_name):
+                df.head(0).to_sql(table_name, con=conn, index=False, dtype=dtype)
+                if key_columns:
+                    create_key_index(conn, table_name, key_columns)
+            df.to_sql(staging_name, con=conn, if_exists='replace', index=False, chunksize=chunksize, dtype=dtype)
+            if key_columns:
+                keys = ', '.join(_quote(con, column) for column in key_columns)
+                conn.execute(sqlalchemy.text(
+                    f'CREATE INDEX {_quote(con, "ix_" + staging_name)} ON {source} ({keys})'))
+                condition = ' AND '.join(f'{source}.{_quote(con, column)} = {target}.{_quote(con, column)}'
+                                         for column in key_columns)
+                conn.execute(sqlalchemy.text(
+                    f'DELETE FROM {target} WHERE EXISTS (SELECT 1 FROM {source} WHERE {condition})'))
+            conn.execute(sqlalchemy.text(
+                f'INSERT INTO {target} ({columns}) SELECT {columns} FROM {source}'))
+            conn.execute(sqlalchemy.text(f'DROP TABLE {source}'))
+    else:
+        with con.begin() as conn:
+            df.to_sql(table_name, con=conn, if_exists='append', index=False, chunksize=chunksize, dtype=dtype)
+    seconds = time.perf_counter() - start
+    rows_per_second = rows / seconds if seconds > 0 else float('inf')
+    logger.info(f'{table_name}: loaded {rows} rows in {seconds:.2f} s ({rows_per_second:.0f} rows/s)')
+    get_metrics().record_load(table_name, rows, seconds)
+    return LoadStats(table_name, rows, seconds, rows_per_second)
+
+
+def create_key_index(con, table_name, key_columns):
+    """Creates the index on the key columns of a table that keyed loads look rows up with,
+    e.g. for a daily table created before bulk_load created it:
+
+        with engine.begin() as conn:
+            create_key_index(conn, 'tracks_popularity_table', ['track_id', 'date'])
+
+    Args:
+        con (sqlalchemy.engine.Connection): database connection, in a transaction
+        table_name (str): e.g. 'tracks_popularity_table'
+        key_columns (list): columns identifying a row, e.g. id and date
+    """
+    keys = ', '.join(_quote(con, column) for column in key_columns)
+    con.execute(sqlalchemy.text(
+        f'CREATE INDEX {_quote(con, "ix_" + table_name + "_keys")} ON {_quote(con, table_name)} ({keys})'))
+
+
+def read_table(table_name, con, columns=None):
+    """Reads a table back from the database with the compact dtypes of schema.py.
+
+    Args:
+        table_name (str): e.g. 'tracks_popularity_table'
+        con (sqlalchemy.engine.Engine): database engine
+        columns (list, optional): columns to read, defaults to every column
+
+    Returns:
+        pandas.DataFrame: the table
+    """
+    selected = ', '.join(_quote(con, column) for column in columns) if columns else '*'
+    with con.connect() as conn:
+        df = pd.read_sql(sqlalchemy.text(f'SELECT {selected} FROM {_quote(con, table_name)}'), conn)
+    return apply_schema(df, table_name)
+
+
+def read_processed_album_ids(con, table_name=PROCESSED_ALBUMS_TABLE):
+    """Reads the album ids processed by earlier static runs, see get_static_tables(seen_album_ids=...).
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): table of processed album ids
+
+    Returns:
+        set: album ids, empty before the first run
+    """
+    if not sqlalchemy.inspect(con).has_table(table_name):
+        return set()
+    return set(read_table(table_name, con, columns=['album_id'])['album_id'].astype(str))
+
+
+def save_processed_album_ids(album_ids, con, table_name=PROCESSED_ALBUMS_TABLE):
+    """Saves the album ids processed by a static run. Ids saved before are replaced, not duplicated.
+
+    Args:
+        album_ids (iterable): processed album ids
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): table of processed album ids
+
+    Returns:
+        LoadStats: table name, number of rows, seconds and rows per second
+    """
+    df = apply_schema(pd.DataFrame({'album_id': sorted(album_ids)}, dtype=object), table_name)
+    return bulk_load(df, table_name, con, key_columns=['album_id'])
@@ -1,177 +1,655 @@
 import pandas as pd
+import numpy as np
+from array import array
 from datetime import date
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import logging
 import re
-import time
 from datetime import datetime
-from dotenv import load_dotenv
-import os
+import queue
+import threading
+import time
+# shared Spotify client, one token and connection pool per process
+from spotify_client import get_spotify_client
+# rate limited, concurrent execution of batched requests
+from request_engine import get_request_engine, batches
+# persistent cache of static responses (albums, audio features)
+from response_cache import get_response_cache
+# completed batches of a run, for resuming failed runs
+from checkpoint import batch_key
+# wall time per pipeline stage, retried ids, errors
+from metrics import stage, get_metrics
+# compact dtypes of the extracted tables
+from schema import apply_schema, concat_tables
+
+logger = logging.getLogger(__name__)
+
+# retry rounds after errors other than client errors, and seconds before the first one, doubled for every next one
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 2.0
+# completed batches saved to the checkpoint with one commit
+CHECKPOINT_FLUSH_BATCHES = 50
+
+# vectorized string kernels for the name and duration transforms, python loops otherwise
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+
+# column types for ColumnAccumulator: 'b' int8, 'h' int16, 'i' int32, 'f' float32, None for python objects,
+# the same sizes as schema.TABLE_SCHEMAS
+ALBUMS_COLUMNS = {'album_id': None, 'artist_id': None, 'album_name': None, 'album_release_date': None,
+                  'album_total_tracks': 'h', 'album_image_large': None, 'album_image_medium': None,
+                  'album_image_small': None}
+POPULARITY_COLUMNS = {'id': None, 'popularity': 'b'}
+AUDIO_FEATURES_COLUMNS = {'danceability': 'f', 'energy': 'f', 'key': 'b', 'loudness': 'f', 'mode': 'b',
+                          'speechiness': 'f', 'acousticness': 'f', 'instrumentalness': 'f',
+                          'liveness': 'f', 'valence': 'f', 'tempo': 'f', 'type': None, 'id': None,
+                          'uri': None, 'track_href': None, 'analysis_url': None, 'duration_ms': 'i',
+                          'time_signature': 'b'}
+
+
+class ColumnAccumulator:
+    """Collects records into one buffer per column and builds a single DataFrame at the end,
+    instead of concatenating a DataFrame per batch. Numeric columns are stored in typed
+    arrays, which become the DataFrame columns without another copy.
+
+    Args:
+        columns (dict): column name -> array typecode (e.g. 'b' int8, 'i' int32, 'f' float32),
+            or None for columns of python objects such as strings.
+    """
+
+    def __init__(self, columns):
+        self._buffers = {name: array(typecode) if typecode else []
+                         for name, typecode in columns.items()}
+
+    def __len__(self):
+        return len(next(iter(self._buffers.values()), []))
+
+    def append(self, record):
+        """Appends one record, a dict with a value for every column.
+        If a value does not fit its column, nothing is appended and the error is raised.
+        """
+        values = [record[name] for name in self._buffers]
+        appended = []
+        try:
+            for buffer, value in zip(self._buffers.values(), values):
+                buffer.append(value)
+                appended.append(buffer)
+        except (TypeError, OverflowError):
+            for buffer in appended:
+                buffer.pop()
+            raise
+
+    def extend(self, records):
+        """Appends many records, either all of them or, if one does not fit, none of them.
+        """
+        length = len(self)
+        try:
+            for record in records:
+                self.append(record)
+        except Exception:
+            for buffer in self._buffers.values():
+                del buffer[length:]
+            raise
+
+    def to_frame(self):
+        """Builds the DataFrame. The accumulator should not be appended to afterwards.
+
+        Returns:
+            pandas.DataFrame: one column per accumulator column, object columns stay object
+            columns when there are no records, so string operations work on empty tables too.
+        """
+        data = {name: np.frombuffer(buffer, dtype=buffer.typecode) if isinstance(buffer, array)
+                else buffer if buffer else pd.Series([], dtype=object)
+                for name, buffer in self._buffers.items()}
+        return pd.DataFrame(data, copy=False)
+
+
+class FailedIds:
+    """Ids whose requests still failed after the retries, by extraction stage, with the last error.
+    Extract functions record into it when given one, so a run knows which rows are missing
+    instead of dropping them silently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failed = {}
+
+    def add(self, stage, ids, error):
+        with self._lock:
+            self._failed.setdefault(stage, {}).update((id_, str(error)) for id_ in ids)
+
+    def ids(self, stage=None):
+        """Returns the failed ids of a stage, or of every stage."""
+        with self._lock:
+            stages = [stage] if stage is not None else list(self._failed)
+            return [id_ for name in stages for id_ in self._failed.get(name, {})]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(failed) for failed in self._failed.values())
+
+    def to_frame(self):
+        """Returns one row per failed id, with columns stage, id and error."""
+        with self._lock:
+            rows = [(stage, id_, error) for stage, failed in self._failed.items() for id_, error in failed.items()]
+        return pd.DataFrame(rows, columns=['stage', 'id', 'error'])
+
+
+# extraction errors are logged and counted per stage, the run goes on without the failed rows
+def log_extraction_error(stage_name, message):
+    logger.warning(f'{stage_name}: {message}')
+    get_metrics().record_error(stage_name)
+
 
+def is_client_error(error):
+    """True for 4xx responses other than 429, e.g. an invalid id in the batch. Retrying the same
+    batch gives the same error, while 429 responses are retried by the request engine, and the
+    429 errors spotipy raises once the session is out of retries after server errors are transient.
+    """
+    status = getattr(error, 'http_status', None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _batch_ids(batch):
+    # batches are lists of ids, or a single item, e.g. an artist name
+    return batch if isinstance(batch, list) else [batch]
+
+
+# batched requests, skipping batches completed by an earlier attempt of the run
+def map_batches(fn, id_batches, stage, checkpoint=None, failures=None, retry_attempts=RETRY_ATTEMPTS, rows=None):
+    """Runs fn on every batch with the shared request engine. With rows, only the rows extracted
+    from a response are kept, e.g. the id and popularity of every track instead of the full objects.
+    With a checkpoint, batches completed by an earlier attempt of the same run are read from it
+    instead of being requested, and the rows of newly completed batches are saved to it,
+    CHECKPOINT_FLUSH_BATCHES batches per commit.
+    Failed batches are requested again once the other batches are done, so one failure does not
+    drop a whole batch. Only the failed ids are requested again:
+    - after a client error, e.g. one invalid id failing the whole batch, the batch is split in
+      halves right away, until the failing ids are left on their own
+    - after any other error, e.g. a 5xx response, the ids are re-batched and requested again with
+      exponential backoff, up to retry_attempts times
+
+    Args:
+        fn (callable): e.g. sp.tracks
+        id_batches (list): batches of ids
+        stage (str): name of the extraction stage in the checkpoint
+        checkpoint (checkpoint.RunCheckpoint, optional): checkpoint of the current run
+        failures (FailedIds, optional): ids that could not be extracted are recorded in it
+        retry_attempts (int): backoff rounds after errors other than client errors
+        rows (callable, optional): takes a response and returns the JSON serializable rows kept from it.
+            Batches whose response it cannot read are given up.
+
+    Yields:
+        tuple: (batch, result, error) as given by RequestEngine.map, with the rows as result when
+            rows is given. Batches that could not be extracted are yielded with their last error
+            once the retries are over.
+    """
+    request_engine = get_request_engine()
+    remaining = list(id_batches)
+    if checkpoint is not None:
+        completed = checkpoint.load_many(stage, [batch_key(batch) for batch in remaining])
+        for batch in remaining:
+            if batch_key(batch) in completed:
+                yield batch, completed[batch_key(batch)], None
+        remaining = [batch for batch in remaining if batch_key(batch) not in completed]
+    size = max([len(batch) for batch in remaining if isinstance(batch, list)], default=1)
+    # retries after errors other than client errors, per batch
+    attempts = [0] * len(remaining)
+    given_up = []
+    unsaved = {}
+    try:
+        while remaining:
+            failed = []
+            for (batch, result, e), attempt in zip(request_engine.map(fn, remaining), attempts):
+                if e is None and rows is not None:
+                    try:
+                        result = rows(result)
+                    except Exception as error:
+                        given_up.append((batch, error))
+                        continue
+                if e is not None:
+                    failed.append((batch, e, attempt))
+                    continue
+                if checkpoint is not None:
+                    unsaved[batch_key(batch)] = result
+                    if len(unsaved) >= CHECKPOINT_FLUSH_BATCHES:
+                        checkpoint.save_many(stage, unsaved)
+                        unsaved = {}
+                yield batch, result, None
+            remaining, attempts = _retry_batches(stage, failed, given_up, size, retry_attempts)
+    finally:
+        # also when the caller stops early
+        if unsaved:
+            checkpoint.save_many(stage, unsaved)
+    if given_up:
+        get_metrics().record_retry(stage, 0, sum(len(_batch_ids(batch)) for batch, e in given_up))
+    for batch, e in given_up:
+        if failures is not None:
+            failures.add(stage, _batch_ids(batch), e)
+        yield batch, None, e
+
+
+def _retry_batches(stage, failed, given_up, size, retry_attempts):
+    """Batches of the next round of map_batches and their attempts. Batches failing with a client
+    error are split in halves, the other ones are re-batched after a backoff, and batches out of
+    attempts are added to given_up.
+    """
+    remaining, attempts = [], []
+    transient = {}
+    for batch, e, attempt in failed:
+        if is_client_error(e) and isinstance(batch, list) and len(batch) > 1:
+            middle = (len(batch) + 1) // 2
+            remaining.extend([batch[:middle], batch[middle:]])
+            attempts.extend([attempt, attempt])
+        elif not is_client_error(e) and attempt < retry_attempts:
+            transient.setdefault(attempt + 1, []).append(batch)
+        else:
+            given_up.append((batch, e))
+    if transient:
+        time.sleep(RETRY_BACKOFF * 2 ** (min(transient) - 1))
+    for attempt, transient_batches in transient.items():
+        retry_batches = batches([id_ for batch in transient_batches if isinstance(batch, list) for id_ in batch], size)
+        retry_batches += [batch for batch in transient_batches if not isinstance(batch, list)]
+        remaining.extend(retry_batches)
+        attempts.extend([attempt] * len(retry_batches))
+    if remaining:
+        get_metrics().record_retry(stage, sum(len(_batch_ids(batch)) for batch in remaining))
+    return remaining, attempts
+
+
+# fields of the API objects that are used, the rest of a response is not kept in checkpoints
+def track_fields(track):
+    return {'id': track['id'], 'name': track['name'], 'duration_ms': track['duration_ms'],
+            'external_urls': {'spotify': track['external_urls']['spotify']}, 'preview_url': track['preview_url']}
+
+
+def album_fields(album):
+    return {'id': album['id'], 'name': album['name'], 'release_date': album['release_date'],
+            'popularity': album['popularity'],
+            'tracks': {'total': album['tracks']['total'],
+                       'items': [track_fields(track) for track in album['tracks']['items']]}}
+
+
+def popularity_rows(items):
+    # unknown ids come back as None, see record_missing_ids
+    return [{'id': item['id'], 'popularity': item['popularity']} for item in items if item is not None]
+
+
+# error of the ids a multi-id endpoint answered with None, e.g. removed tracks
+NOT_FOUND = 'not found'
+
+
+def record_missing_ids(stage_name, batch, found_ids, failures=None):
+    """Logs and records the ids of a batch missing from its response, which multi-id endpoints
+    answer with None instead of an error, so they are not dropped silently.
+
+    Args:
+        stage_name (str): extraction stage, e.g. 'tracks_popularity'
+        batch (list): requested ids
+        found_ids (iterable): ids in the response
+        failures (FailedIds, optional): the missing ids are recorded in it with the error NOT_FOUND
+    """
+    found_ids = set(found_ids)
+    missing = [id_ for id_ in batch if id_ not in found_ids]
+    if not missing:
+        return
+    log_extraction_error(stage_name, f'ids {missing}: {NOT_FOUND}')
+    if failures is not None:
+        failures.add(stage_name, missing, NOT_FOUND)
+
+
+class AlbumCache:
+    """Full album objects of a static run, keyed by album id. Albums are fetched 20 at a time
+    with the multi-album endpoint, and the album tracklist is completed with album_tracks
+    only when the album has more tracks than the first page holds.
+    Album selection and track extraction both read from the cache, so every album is fetched once.
+
+    Args:
+        checkpoint (checkpoint.RunCheckpoint, optional): checkpoint of the current run
+        failures (FailedIds, optional): albums that could not be fetched are recorded in it
+    """
+
+    def __init__(self, checkpoint=None, failures=None):
+        self._albums = {}
+        self.checkpoint = checkpoint
+        self.failures = failures
+
+    def __contains__(self, album_id):
+        return album_id in self._albums
+
+    def __len__(self):
+        return len(self._albums)
+
+    def get(self, album_id):
+        """Returns the cached album object, or None if the album was not fetched."""
+        return self._albums.get(album_id)
+
+    def fetch(self, album_ids):
+        """Fetches the albums that are not cached yet, including every page of their tracks.
+
+        Args:
+            album_ids (list): A list of album IDs
+        """
+        # acces spotipy
+        sp = get_spotify_client()
 
+        missing_ids = [album_id for album_id in dict.fromkeys(album_ids) if album_id not in self._albums]
+        # albums stored by earlier runs
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            self._albums.update(response_cache.get_many('albums', missing_ids))
+            missing_ids = [album_id for album_id in missing_ids if album_id not in self._albums]
+        fetched = []
+        # we can use a maximum of 20 album ids each time
+        for album_batch, albums, e in map_batches(
+                sp.albums, batches(missing_ids, 20), 'albums', self.checkpoint, self.failures,
+                # unknown ids come back as None
+                rows=lambda response: [album_fields(album) for album in response['albums'] if album is not None]):
+            if e is not None:
+                log_extraction_error('albums', f'album_ids {album_batch}: {e}')
+                continue
+            record_missing_ids('albums', album_batch, [album['id'] for album in albums], self.failures)
+            fetched.extend(albums)
+
+        # remaining track pages of long albums, 50 tracks each
+        pages = [(album['id'], offset)
+                 for album in fetched
+                 for offset in range(len(album['tracks']['items']), album['tracks']['total'], 50)]
+        fetched_by_id = {album['id']: album for album in fetched}
+        incomplete = set()
+        # retried pages come after the others, tracks are added by offset once every page is in
+        album_pages = {}
+        for (album_id, offset), tracks, e in map_batches(
+                lambda page: sp.album_tracks(page[0], limit=50, offset=page[1]), pages,
+                'album_tracks', self.checkpoint,
+                rows=lambda response: [track_fields(track) for track in response['items']]):
+            if e is not None:
+                log_extraction_error('album_tracks', f'album_id \'{album_id}\', offset {offset}: {e}')
+                incomplete.add(album_id)
+                if self.failures is not None:
+                    self.failures.add('album_tracks', [album_id], e)
+                continue
+            album_pages.setdefault(album_id, []).append((offset, tracks))
+        for album_id, album_tracks in album_pages.items():
+            for offset, tracks in sorted(album_tracks, key=lambda page: page[0]):
+                fetched_by_id[album_id]['tracks']['items'].extend(tracks)
+
+        # albums with missing track pages are left out, so a later fetch retries them
+        complete = {album['id']: album for album in fetched if album['id'] not in incomplete}
+        self._albums.update(complete)
+        if response_cache is not None:
+            response_cache.set_many('albums', complete)
+
+
+# artist names compared without case, spaces and punctuation, e.g. "Guns N' Roses" and "guns n'roses"
+def normalize_artist_name(name):
+    return re.sub(r'[\W_]+', '', name.casefold())
+
+
+# pick the searched artist among the search results
+def match_artist(items, artist_name):
+    """Returns the search result whose name equals artist_name, ignoring case, or else whose name is
+    equal after normalize_artist_name. The first result is not taken when no name matches,
+    it is often another artist.
 
-# access Spotify
-def get_spotify_client():
-    """Creates a Spotify client object using the provided client_id and client_secret.
+    Args:
+        items (list): artist objects of a search response
+        artist_name (str): searched name
 
     Returns:
-        spotipy.Spotify: Spotify client object.
+        dict: the artist object, or None when no result matches
     """
-    load_dotenv()
-    client_id = os.getenv("CLIENT_ID")
-    client_secret = os.getenv("CLIENT_SECRET")
-    client_credentials_manager = SpotifyClientCredentials(
-        client_id=client_id, client_secret=client_secret
-    )
-    sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-    return sp
+    for item in items:
+        if item['name'].casefold() == artist_name.casefold():
+            return item
+    for item in items:
+        if normalize_artist_name(item['name']) == normalize_artist_name(artist_name):
+            return item
+    return None
 
 
 # artists_table
-def extract_artists_table(artists_list):
+def extract_artists_table(artists_list, failures=None):
     """Takes an artist list as an input and extracts data from Spotify API
     Returns a pandas DataFrame, containing the data in tabular form.
+    Names resolved by earlier runs are read from the response cache, the other names are
+    searched concurrently and only an artist whose name matches is taken, see match_artist.
 
     Args:
         artists_list (list): A list of artist names.
+        failures (FailedIds, optional): names whose search failed or found no matching artist
+            are recorded in it.
 
     Returns:
         pandas.DataFrame: dataframe containing artist id, followers, and name. 
     """
     # acces spotipy
     sp = get_spotify_client()
-    
+    # artists resolved by earlier runs, keyed by the normalized name
+    response_cache = get_response_cache()
+    resolved = {}
+    if response_cache is not None:
+        resolved = response_cache.get_many('search', [normalize_artist_name(artist) for artist in artists_list])
+    missing = [artist for artist in dict.fromkeys(artists_list) if normalize_artist_name(artist) not in resolved]
+
+    fetched = {}
+    # Search for artist
+    for artist, results, e in map_batches(lambda artist: sp.search(q=artist, type='artist'), missing, 'search',
+                                          failures=failures):
+        if e is not None:
+            log_extraction_error('search', f'artist \'{artist}\': {e}')
+            continue
+        match = match_artist(results['artists']['items'], artist)
+        if match is None:
+            log_extraction_error('search', f'artist \'{artist}\': no artist with a matching name found')
+            # not cached, so the next run searches the name again
+            if failures is not None:
+                failures.add('search', [artist], 'no artist with a matching name found')
+            continue
+        fetched[normalize_artist_name(artist)] = {'id': match['id'], 'name': match['name']}
+    if response_cache is not None:
+        response_cache.set_many('search', fetched)
+    resolved.update(fetched)
+
     artist_id_list = []
     artist_name_list = []
     for artist in artists_list:
-        try:
-            # Search for artist
-            results = sp.search(q=artist, type='artist')
-            # Get artist ID, name, followers 
-            artist_id_list.append(results['artists']['items'][0]['id'])
-            artist_name_list.append(results['artists']['items'][0]['name'])
-        except Exception as e:
-            print(f'Error in data extraction for artist \'{artist}\': {e}')
+        match = resolved.get(normalize_artist_name(artist))
+        if match is None:
+            continue
+        # Get artist ID, name
+        artist_id_list.append(match['id'])
+        artist_name_list.append(match['name'])
     # make DataFrame
     artists_table = pd.DataFrame(data={'artist_id': artist_id_list,
                                       'artist_name': artist_name_list,
                                       })
-    return artists_table
+    return apply_schema(artists_table, 'artists_table')
 
 
-# extract artist followers
-def extract_artists_followers_table(artist_ids):
-    sp = get_spotify_client()
+# artists snapshot, one fetch for followers and popularity
+def extract_artists_snapshot(artist_ids, checkpoint=None, failures=None):
+    """Takes a list of artist IDs and extracts followers and popularity from Spotify API,
+    using the multi-id artists endpoint. Both daily artist tables are built from this snapshot,
+    so they always come from the same fetch.
 
-    data = {'artist_id': [], 'followers': []}
-    for artist_id in artist_ids:
-        # Get artist details including followers
-        artist = sp.artist(artist_id)
-        followers = artist['followers']['total']
+    Args:
+        artist_ids (list): A list of Spotify artist IDs.
+        checkpoint (checkpoint.RunCheckpoint, optional): completed batches are saved to and skipped from it.
+        failures (FailedIds, optional): ids that could not be extracted are recorded in it.
 
-        # Store the data
-        data['artist_id'].append(artist_id)
-        data['followers'].append(followers)
+    Returns:
+        pandas.DataFrame: DataFrame containing artist ID, followers, popularity and the current date.
+    """
+    # acces spotipy
+    sp = get_spotify_client()
 
-    # Create a DataFrame from the collected data
-    df = pd.DataFrame(data)
+    data = {'artist_id': [], 'followers': [], 'artist_popularity': []}
+    # we can use a maximum of 50 artist ids each time
+    for artist_batch, artist_rows, e in map_batches(
+            sp.artists, batches(artist_ids, 50), 'artists', checkpoint, failures,
+            # unknown ids come back as None
+            rows=lambda response: [[artist['id'], artist['followers']['total'], artist['popularity']]
+                                   for artist in response['artists'] if artist is not None]):
+        if e is not None:
+            log_extraction_error('artists', f'artist_ids {artist_batch}: {e}')
+            continue
+        record_missing_ids('artists', artist_batch, [row[0] for row in artist_rows], failures)
+        for artist_id, followers, popularity in artist_rows:
+            data['artist_id'].append(artist_id)
+            data['followers'].append(followers)
+            data['artist_popularity'].append(popularity)
+
+    artists_snapshot = pd.DataFrame(data)
     # add date
-    df['date'] = date.today()
-    return df
+    artists_snapshot['date'] = pd.Timestamp(date.today())
+    return apply_schema(artists_snapshot, 'artists_snapshot')
+
+
+# extract artist followers
+def extract_artists_followers_table(artist_ids, artists_snapshot=None):
+    """Takes a list of artist IDs as input and returns artist followers and the current date.
+
+    Args:
+        artist_ids (list): A list of Spotify artist IDs.
+        artists_snapshot (pandas.DataFrame, optional): Output of extract_artists_snapshot.
+            If not given, a new snapshot is extracted.
+
+    Returns:
+        pandas.DataFrame: DataFrame containing artist ID, followers, and the current date.
+    """
+    if artists_snapshot is None:
+        artists_snapshot = extract_artists_snapshot(artist_ids)
+    return artists_snapshot[['artist_id', 'followers', 'date']].copy()
 
 
 # artists_popularity_table
-def extract_artists_popularity_table(artist_ids):
+def extract_artists_popularity_table(artist_ids, artists_snapshot=None):
     """Takes a list of artist IDs as input and extracts artist popularity from Spotify API.
     Returns a pandas DataFrame containing artist popularity and the current date.
 
     Args:
         artist_ids (list): A list of Spotify artist IDs.
+        artists_snapshot (pandas.DataFrame, optional): Output of extract_artists_snapshot.
+            If not given, a new snapshot is extracted.
 
     Returns:
         pandas.DataFrame: DataFrame containing artist ID, popularity, and the current date.
     """
-    # Access spotipy
-    sp = get_spotify_client()
-    
-    artist_popularity_list = []
-    for artist_id in artist_ids:
-        try:
-            # Get artist information
-            artist_info = sp.artist(artist_id)
-            artist_popularity_list.append(artist_info['popularity'])
-        except Exception as e:
-            print(f'Error in data extraction for artist ID \'{artist_id}\': {e}')
-
-    # Make DataFrame
-    artists_popularity_table = pd.DataFrame(data={
-        'date': date.today(),
-        'artist_id': artist_ids,
-        'artist_popularity': artist_popularity_list
-    })
-
-    return artists_popularity_table
+    if artists_snapshot is None:
+        artists_snapshot = extract_artists_snapshot(artist_ids)
+    return artists_snapshot[['date', 'artist_id', 'artist_popularity']].copy()
 
 
 # albums_table initial form, without proper album selection
-def extract_albums_table(artist_id_list):
+def extract_albums_table(artist_id_list, checkpoint=None, failures=None):
     """Extracting all albums of the artists contained in artist_id_list
 
     Args:
         artist_id_list (list): List of artist ids
+        checkpoint (checkpoint.RunCheckpoint, optional): completed artists are saved to and skipped from it.
+        failures (FailedIds, optional): artists whose albums could not be listed are recorded in it.
 
     Returns:
         pandas.DataFrame: every album of corresponging to the given artist ids
     """
     # acces spotipy
     sp = get_spotify_client()
-    
-    albums_table = pd.DataFrame()
+    # album lists stored by recent runs
+    response_cache = get_response_cache()
+    cached = response_cache.get_many('artist_albums', artist_id_list) if response_cache is not None else {}
+
+    # every page of an artist's albums, one artist per batch
+    def list_artist_albums(artist_batch):
+        # extract album data with Spotify API
+        offset = 0
+        limit = 50
+        artist_albums = sp.artist_albums(artist_batch[0], album_type='album', limit=limit, offset=offset)
+        # If there are more albums, use offset to get the next set
+        while len(artist_albums['items']) == limit:
+            offset += limit
+            additional_albums = sp.artist_albums(artist_batch[0], album_type='album', limit=limit, offset=offset)
+            artist_albums['items'].extend(additional_albums['items'])
+        return artist_albums['items']
+
+    # fields of the listed albums that end up in the table
+    def album_list_fields(items):
+        return [{'id': album['id'], 'name': album['name'], 'release_date': album['release_date'],
+                 'total_tracks': album['total_tracks'], 'images': [{'url': image['url']} for image in album['images']]}
+                for album in items]
+
+    # artists completed by an earlier attempt of the run are read from the checkpoint
+    missing = [[artist_id] for artist_id in dict.fromkeys(artist_id_list) if artist_id not in cached]
+    for artist_batch, items, e in map_batches(list_artist_albums, missing, 'artist_albums', checkpoint, failures,
+                                              rows=album_list_fields):
+        if e is not None:
+            log_extraction_error('artist_albums', f'artist_id \'{artist_batch[0]}\': {e}')
+            continue
+        cached[artist_batch[0]] = items
+        if response_cache is not None:
+            response_cache.set('artist_albums', artist_batch[0], items)
+
+    albums = ColumnAccumulator(ALBUMS_COLUMNS)
     for artist_id in artist_id_list:
+        if artist_id not in cached:
+            continue
         try:
-            # extract album data with Spotify API
-            offset = 0
-            limit = 50
-            albums = sp.artist_albums(artist_id, album_type='album', limit=limit, offset=offset) 
-            # If there are more albums, use offset to get the next set
-            while len(albums['items']) == limit:
-                offset += limit
-                additional_albums = sp.artist_albums(artist_id, album_type='album', limit=limit, offset=offset)
-                albums['items'].extend(additional_albums['items'])
-            #artist_id = artist_id
-            album_id_list = []
-            album_name_list = []
-            album_release_date_list = []
-            album_total_tracks_list = []
-            album_image_large_list = []
-            album_image_medium_list = []
-            album_image_small_list = []
-            
-            for album in albums['items']:
-                album_id_list.append(album['id'])
-                album_name_list.append(album['name'])
-                album_release_date_list.append(album['release_date'])
-                album_total_tracks_list.append(album['total_tracks'])
-                album_image_large_list.append(album['images'][0]['url'])
-                album_image_medium_list.append(album['images'][1]['url'])
-                album_image_small_list.append(album['images'][2]['url'])
-                           
-            albums_df = pd.DataFrame(data={'album_id': album_id_list,
-                                         'artist_id': artist_id,
-                                         'album_name': album_name_list,
-                                         'album_release_date': album_release_date_list,
-                                         'album_total_tracks': album_total_tracks_list,
-                                         'album_image_large': album_image_large_list,
-                                         'album_image_medium': album_image_medium_list,
-                                         'album_image_small': album_image_small_list}
-                                   )
-            albums_table = pd.concat([albums_table, albums_df], ignore_index=True)
+            # build every record first, so a failing artist adds no rows
+            records = [{'album_id': album['id'],
+                        'artist_id': artist_id,
+                        'album_name': album['name'],
+                        'album_release_date': album['release_date'],
+                        'album_total_tracks': album['total_tracks'],
+                        'album_image_large': album['images'][0]['url'],
+                        'album_image_medium': album['images'][1]['url'],
+                        'album_image_small': album['images'][2]['url']}
+                       for album in cached[artist_id]]
+            albums.extend(records)
         except Exception as e:
-            print(f'Error in data extraction for artist_id \'{artist_id}\': {e}')
+            log_extraction_error('artist_albums', f'artist_id \'{artist_id}\': {e}')
             
+    albums_table = albums.to_frame()
     # realease date, keep year format
     albums_table['album_release_date'] = pd.to_datetime(albums_table['album_release_date'], format='ISO8601').dt.year
-    return albums_table
+    return apply_schema(albums_table, 'albums_table')
+
+
+# album editions, in the order they are checked
+ALBUM_EDITIONS = ('original', 'live', 'demo', 'deluxe', 'remix')
+# patterns run on lower case album names
+# "live", "demo", "deluxe" or "remix" anywhere in the name
+EDITION_KEYWORD_PATTERN = re.compile(r'(live|demo|deluxe|remix)')
+# the keyword is part of another word, e.g. 'The Demon Album', 'Delivered', 'Remixed Feelings'
+EDITION_IN_WORD_PATTERN = re.compile(r'[a-z](?:live|demo|deluxe|remix)|(?:live|demo|deluxe|remix)[a-z]')
+# standalone "demos", e.g. 'The Demos' but not "Demos'" or 'Demos(...)'
+DEMOS_PATTERN = re.compile(r"\bdemos\b(?![\w'()])")
+
+
+# label each album as live, demo, deluxe, remix or original
+def classify_album_edition(album_names):
+    """This function labels album names as 'live', 'demo', 'deluxe', 'remix' or 'original'.
+    An album is labeled with the first edition keyword in its name, unless one of the keywords
+    is part of another word ('The Demon Album', 'Delivered', 'Remixed Feelings'), in which case
+    it is 'original'. Albums with a standalone 'demos' in their name are labeled 'demo'.
+
+    Args:
+        album_names (pandas.Series): album names
+
+    Returns:
+        pandas.Series: categorical album edition labels, with the same index as album_names
+    """
+    names = pd.Series(album_names).str.lower()
+    keyword = names.str.extract(EDITION_KEYWORD_PATTERN, expand=False)
+    in_word = names.str.contains(EDITION_IN_WORD_PATTERN, na=False)
+    demos = names.str.contains(DEMOS_PATTERN, na=False)
+
+    album_edition = pd.Series('original', index=names.index, name='album_edition')
+    album_edition = album_edition.mask(demos, 'demo')
+    album_edition = album_edition.mask(keyword.notna() & ~in_word, keyword)
+    return album_edition.astype(pd.CategoricalDtype(ALBUM_EDITIONS))
 
 
 # removing live, remix, deluxe and demo albums, without dropping any original album in the process
@@ -181,6 +659,7 @@ def album_selection_vol1(df):
     containing 'live,' 'demo,' or 'remix' in their actual names. 
     For example, it won't exclude albums with names like
     'The Demon Album,' 'Delivered,' or 'Remixed Feelings.
+    The album_edition column, as given by classify_album_edition, is added if not present.
 
     Args:
         df (pandas.DataFrame): This is the albums_table 
@@ -189,123 +668,97 @@ def album_selection_vol1(df):
     Returns:
         pandas.DataFrame: The albums_table without live, demo and remix albums
     """
+    if 'album_edition' not in df.columns:
+        df = df.assign(album_edition=classify_album_edition(df['album_name']))
+    # keep original albums only
+    df_alb = df[df['album_edition'] == 'original'].copy()
+    return df_alb
 
-    # Function to check the conditions
-    def check_album_conditions(string, pattern):
-        """This function detects albums that contain "live" in their original names
 
-        Args:
-            string (string): album name to check
+# album and track names without edition suffixes, e.g. "Rumours (Super Deluxe)" -> "Rumours"
+def original_names(names, separators):
+    """Cuts every name at the first of the separators and strips whitespace, the same as
+    name.split(separator)[0].strip() for each separator in turn, as one column operation.
+    Used for album names ('(' and '[') and track names ('-').
 
-        Returns:
-            bool: True if the condition is met
-        """
-        # Regular expression pattern
-        #pattern1 = r'(.*live[a-z].*|.*[a-z]live.*)|(.*demo[a-z].*|.*[a-z]demo.*)|(.*remix[a-z].*|.*[a-z]remix.*)'
-        return bool(re.search(pattern, string, re.IGNORECASE) )  #and not bool(re.match(pattern2, string, re.IGNORECASE))
-
-
-
-    # album names containing string "live", "demo" or "remix"
-    df_cont = df[(df['album_name'].str.contains('live', case=False)) |
-                      (df['album_name'].str.contains('demo', case=False))|
-                      (df['album_name'].str.contains('deluxe', case=False))|
-                      (df['album_name'].str.contains('remix', case=False))].copy()
-    # album names without the strings
-    df_to_keep = df[~(
-        (df['album_name'].str.contains('live', case=False)) |
-                      (df['album_name'].str.contains('demo', case=False))|
-                      (df['album_name'].str.contains('deluxe', case=False))|
-                      (df['album_name'].str.contains('remix', case=False))
-                      )].copy()
-    
-    # Apply the function check_album_conditions to the 'album_name' column
-    pattern = r'(.*live[a-z].*|.*[a-z]live.*)|(.*demo[a-z].*|.*[a-z]demo.*)|(.*remix[a-z].*|.*[a-z]remix.*)|(.*deluxe[a-z].*|.*[a-z]deluxe.*)'
-    df_cont['matches_condition'] = df_cont['album_name'].apply(check_album_conditions, pattern=pattern)
-    
-    # keep only albums that contain 'live', 'demo' , 'deluxe' or 'remix' strings in their original name
-    df_cont = df_cont[df_cont['matches_condition']==True].drop(columns=['matches_condition'], axis=1)
-    
-    # concat to get albums
-    df_alb = pd.concat([df_to_keep, df_cont], axis=0)
-    
-    # also we check for 'demos', bcs some albums include it, and we did not remove those yet
-    # again, we want to keep albums that contain 'demos' string as a part of their name
-    # album_names containing string "demos"
-    df_cont = df_alb[df_alb['album_name'].str.contains('demos', case=False)].copy()
-    
-    # albums without the string
-    df_to_keep = df_alb[~df_alb['album_name'].str.contains('demos', case=False)].copy()
-    
-    # apply the funtion check_album_conditions
-    pattern =  r'\bdemos\b(?![\w\'()])' # we want NOT to match with this condition
-    df_cont['matches_condition'] = df_cont['album_name'].apply(check_album_conditions, pattern=pattern)
-    
-    # keep only albums that contain 'demos' in their original name, remember we want NOT to match, thus we set False
-    df_cont = df_cont[df_cont['matches_condition']==False].drop(columns=['matches_condition'], axis=1)
-    # concat to get albums
-    df_alb = pd.concat([df_to_keep, df_cont], axis=0)
-    
-    return df_alb
+    Args:
+        names (pandas.Series): album or track names
+        separators (str or list): e.g. '-' or ['(', '[']
 
+    Returns:
+        pandas.Series: the cut names, missing names stay missing
+    """
+    if isinstance(separators, str):
+        separators = [separators]
+    if pa is not None:
+        cut = pa.array(names, pa.string(), from_pandas=True)
+        for separator in separators:
+            cut = pc.list_element(pc.split_pattern(cut, separator, max_splits=1), 0)
+        return pd.Series(pc.utf8_trim_whitespace(cut).to_pandas().to_numpy(), index=names.index, name=names.name)
+
+    def cut(name):
+        if not isinstance(name, str):
+            return name
+        for separator in separators:
+            name = name.partition(separator)[0]
+        return name.strip()
+    return pd.Series([cut(name) for name in names.tolist()], index=names.index, name=names.name, dtype=object)
+
+
+# track length as minutes:seconds, e.g. 215000 -> "3:35", seconds are not zero-padded
+def duration_display(duration_ms):
+    """Formats durations in milliseconds as "minutes:seconds", as one column operation.
 
-# select only the most popular version for each album
-def album_selection_vol2(albums_table, artists_table):
-    """This function removes the non original albums. Calls album_selection_vol1 to 
-    remove live, demo, deluxe and remix albums. Then for the remaining albums, keeps album versions
-    with the highest album popularity.
+    Args:
+        duration_ms (pandas.Series): integer durations in milliseconds
+
+    Returns:
+        pandas.Series: formatted durations, missing durations stay missing
+    """
+    if pa is not None:
+        seconds = pc.divide(pa.array(duration_ms, pa.int64(), from_pandas=True), 1000)
+        minutes = pc.divide(seconds, 60)
+        seconds = pc.subtract(seconds, pc.multiply(minutes, 60))
+        formatted = pc.binary_join_element_wise(pc.cast(minutes, pa.string()), pc.cast(seconds, pa.string()), ':')
+        return pd.Series(formatted.to_pandas().to_numpy(), index=duration_ms.index, name=duration_ms.name)
+
+    missing = duration_ms.isna().to_numpy()
+    minutes, seconds = np.divmod(duration_ms.fillna(0).to_numpy(dtype=np.int64) // 1000, 60)
+    return pd.Series([None if missing_ else f'{minutes_}:{seconds_}'
+                      for minutes_, seconds_, missing_ in zip(minutes.tolist(), seconds.tolist(), missing.tolist())],
+                     index=duration_ms.index, name=duration_ms.name, dtype=object)
+
+
+# most popular version of every album
+def most_popular_versions(album_ids, album_cache):
+    """Groups album versions by album name, e.g. "Rumours" and "Rumours (Super Deluxe)",
+    and keeps the version with the highest album popularity. Albums with the same name
+    released in different years are kept apart where needed ("Fleetwood Mac").
 
     Args:
-        albums_table (pd.DataFrame): albums_table as given by extract_albums_table function
-        artists_table (pd.DataFrame): We also include this table to have a better inspection of the data transformatin process.
-        
+        album_ids (list): candidate album IDs, on ties the first one is kept
+        album_cache (AlbumCache): cache holding the candidate albums
+
     Returns:
-        pandas.DataFrame: A DataFrame containing only the original albums from each artist
+        list: the album IDs of the most popular versions
     """
-    
-    albums_artists = albums_table.merge(right=artists_table, on='artist_id')
+    # collect one row per album
+    data = {'album_id': [], 'album_name': [], 'album_release_date': [], 'album_popularity': []}
+    for album_id in album_ids:
+        album = album_cache.get(album_id)
+        if album is None:
+            continue
+        data['album_id'].append(album_id)
+        data['album_name'].append(album['name'])
+        data['album_release_date'].append(album['release_date'])
+        data['album_popularity'].append(album['popularity'])
+    if not data['album_id']:
+        return []
+    df_albums_names_pop = pd.DataFrame(data)
 
-    # we create new_album_name column with the the original album name
-    filtered_albums = album_selection_vol1(albums_artists)
-    
-    # we filter albums with tracks less than 50. Albums above 50 are not original albums. 
-    filtered_albums = filtered_albums[filtered_albums['album_total_tracks']<50]
-    # we want to get only the original albums.
-    # there are for example "remaster" and "deluxe" versions of the same album
-    #  We will keep the version with the highest album popularity 
-    # Function to get album popularity information
-    def get_album_info(artist_name, album_id):
-        # acces spotipy
-        sp = get_spotify_client()
-        # get data
-        try:
-            album = sp.album(album_id)
-            album_name = album['name']
-            album_popularity = album['popularity']
-            album_release_date = album['release_date']
-            return pd.DataFrame({'artist_name': [artist_name], 'album_id': [album_id], 
-                'album_name': [album_name], 'album_release_date': [album_release_date], 'album_popularity': [album_popularity]})
-        except Exception as e:
-            print("Exception raised for artist_id: {artist_name}, album_id: {album_id}: {e}")
-        
-    
-    # get album popularity to select the most popular version of each ablum
-    df_artist_album_pop = pd.DataFrame(columns=['artist_name', 'album_id', 'album_name', 'album_release_date', 'album_popularity'])
-    for artist_name in filtered_albums['artist_name'].unique():
-        for album_id in filtered_albums[filtered_albums['artist_name']==artist_name]['album_id']: 
-            df_new = get_album_info(artist_name, album_id)
-            df_artist_album_pop = pd.concat([df_artist_album_pop, df_new], axis=0, ignore_index=True)
-        
     # we create new_album_name with the the actual album name
-    df_albums_names_pop = df_artist_album_pop['album_name'].apply(lambda x: 
-                                            str(
-                                                x.split('(')[0].strip()
-                                            )
-                                        ).reset_index().drop('index', axis=1).rename({'album_name':
-                                                                                        'new_album_name'},
-                                                                                        axis=1)
-    df_albums_names_pop = pd.concat((df_albums_names_pop,df_artist_album_pop), axis=1)   
-    
+    df_albums_names_pop.insert(0, 'new_album_name', original_names(df_albums_names_pop['album_name'], '('))
+
     # concat release date next to album name. There are albums with the same name ,
     # e.g there are two "Fleetwood Mac" albums, released in different years
     df_albums_names_pop['album_release_date'] = pd.to_datetime(df_albums_names_pop['album_release_date'], format='ISO8601').dt.year
@@ -332,18 +785,51 @@ def album_selection_vol2(albums_table, artists_table):
     max_pop_indices = df_albums_names_pop.groupby('new_album_name')['album_popularity'].idxmax()
 
     # Use the obtained indices to extract the corresponding album_id
-    album_ids = df_albums_names_pop.loc[max_pop_indices, 'album_id'].tolist()  
+    return df_albums_names_pop.loc[max_pop_indices, 'album_id'].tolist()
+
+
+# select only the most popular version for each album
+def album_selection_vol2(albums_table, artists_table, album_cache=None):
+    """This function removes the non original albums. Calls album_selection_vol1 to 
+    remove live, demo, deluxe and remix albums. Then for the remaining albums, keeps album versions
+    with the highest album popularity.
+
+    Args:
+        albums_table (pd.DataFrame): albums_table as given by extract_albums_table function
+        artists_table (pd.DataFrame): We also include this table to have a better inspection of the data transformatin process.
+        album_cache (AlbumCache, optional): cache of full album objects, filled with the selected albums' candidates.
+        
+    Returns:
+        pandas.DataFrame: A DataFrame containing only the original albums from each artist
+    """
     
+    albums_artists = albums_table.merge(right=artists_table, on='artist_id')
+
+    # we create new_album_name column with the the original album name
+    filtered_albums = album_selection_vol1(albums_artists)
+    
+    # we filter albums with tracks less than 50. Albums above 50 are not original albums. 
+    filtered_albums = filtered_albums[filtered_albums['album_total_tracks']<50]
+    # we want to get only the original albums.
+    # there are for example "remaster" and "deluxe" versions of the same album
+    #  We will keep the version with the highest album popularity 
+    # get album popularity to select the most popular version of each ablum
+    if album_cache is None:
+        album_cache = AlbumCache()
+    album_cache.fetch(filtered_albums['album_id'].unique().tolist())
+
+    # candidate versions grouped by artist
+    candidate_ids = [album_id
+                     for artist_name, artist_albums in filtered_albums.groupby('artist_name', sort=False)
+                     for album_id in artist_albums['album_id']]
+    album_ids = most_popular_versions(candidate_ids, album_cache)
+
     # select the most popular album version
     df_albums = (filtered_albums[filtered_albums['album_id'].isin(album_ids)]
-                 .drop(columns=['artist_name'])
+                 .drop(columns=['artist_name', 'album_edition'])
     )
     # column with original album name
-    df_albums['original_album_name'] = df_albums['album_name'].apply(lambda x: 
-                                            str(
-                                                x.split('(')[0].strip()
-                                            )
-                                        )
+    df_albums['original_album_name'] = original_names(df_albums['album_name'], '(')
     
     return df_albums
 
@@ -373,10 +859,12 @@ are removed from the albums_table.
     
 
 # exract album popularity
-def extract_albums_popularity_table(album_ids):
+def extract_albums_popularity_table(album_ids, checkpoint=None, failures=None):
     """ This function extracts track popularity given a list of track IDs
     Args:
         track_ids (list): A list of tracks IDs
+        checkpoint (checkpoint.RunCheckpoint, optional): completed batches are saved to and skipped from it.
+        failures (FailedIds, optional): ids that could not be extracted are recorded in it.
 
     Returns:
         pandas.DataFrame: A dataframe containing track popularity and the current date
@@ -384,41 +872,45 @@ def extract_albums_popularity_table(album_ids):
     # acces spotipy
     sp = get_spotify_client()
     
-    df_album_pop = pd.DataFrame()
-    request_cnt = 0
+    album_pop = ColumnAccumulator(POPULARITY_COLUMNS)
     # we can use a maximum of 20 album ids each time
-    for i in range(0,len(album_ids),20):
-        request_cnt += 1
-        # get 20 albums in each iteration
-        #print(f"i = {i}, request_cnt = {request_cnt}")
+    for album_batch, album_rows, e in map_batches(sp.albums, batches(album_ids, 20), 'albums_popularity',
+                                                  checkpoint, failures,
+                                                  rows=lambda response: popularity_rows(response['albums'])):
+        if e is not None:
+            log_extraction_error('albums_popularity', f'album_ids {album_batch}: {e}')
+            continue
+        record_missing_ids('albums_popularity', album_batch, [row['id'] for row in album_rows], failures)
         try:
-            album_info = sp.albums(album_ids[i:i+20])
-            # create temporary datafame
-            df_temp = pd.DataFrame(album_info['albums'])[['id', 'popularity']]
-            df_album_pop = pd.concat((df_album_pop, df_temp), axis=0, ignore_index=True)
+            album_pop.extend(album_rows)
         except Exception as e:
-            print(e)
-        # sleep for 5 seconds for every 10 requests
-        if request_cnt % 10 == 0:
-            time.sleep(5)
-    df_album_pop['date'] = datetime.now().date()
+            log_extraction_error('albums_popularity', f'album_ids {album_batch}: {e}')
+            if failures is not None:
+                failures.add('albums_popularity', album_batch, e)
+    df_album_pop = album_pop.to_frame()
+    df_album_pop['date'] = pd.Timestamp(datetime.now().date())
     df_album_pop = df_album_pop.rename({'id': 'album_id',
                                         'popularity': 'album_popularity'}, axis=1)
-    return df_album_pop
+    return apply_schema(df_album_pop, 'albums_popularity_table')
 
 
 # extract tracks
-def extract_tracks_data(album_ids):
+def extract_tracks_data(album_ids, album_cache=None, failures=None):
     """This function extracts data for every track from every album
     
     Args:
         album_ids (list or pandas.Series): A list of album IDs
+        album_cache (AlbumCache, optional): cache of full album objects. Albums missing from it are fetched.
+        failures (FailedIds, optional): albums that could not be fetched are recorded in it,
+            when no album_cache is given. Otherwise they are recorded in the failures of the cache.
 
     Returns:
         pandas.DataFrame: dataframe containing the tracks in each album
     """
-    # acces spotipy
-    sp = get_spotify_client()
+    # albums already fetched during album selection are not requested again
+    if album_cache is None:
+        album_cache = AlbumCache(failures=failures)
+    album_cache.fetch(album_ids)
     
     # basic information
     track_id_list = []
@@ -431,33 +923,21 @@ def extract_tracks_data(album_ids):
     
     # Loop through each album ID
     for album_id in album_ids:
-        try:
-            # Get album tracks
-            album_tracks = sp.album_tracks(album_id)
-        
-            # Loop through each track in the album
-            for track in album_tracks['items']:
-                track_id = track['id']
-                track_name = track['name']
-                track_duration_ms = track['duration_ms']
-                track_spotify_url = track['external_urls']['spotify']
-                track_preview_url = track['preview_url']
-                
-                # Append data to lists
-                track_id_list.append(track_id)
-                album_id_list.append(album_id)
-                track_name_list.append(track_name)
-                track_duration_list.append(track_duration_ms)
-                track_spotify_url_list.append(track_spotify_url)
-                track_preview_url_list.append(track_preview_url)
-        except Exception as e:
-            print(f'Exception raised: {e}')
-        
-            # stop code for 30 seconds to avoid time limit
-            #time.sleep(10)
+        album = album_cache.get(album_id)
+        if album is None:
+            log_extraction_error('tracks', f'album_id \'{album_id}\' could not be extracted')
+            continue
+        # Loop through each track in the album
+        for track in album['tracks']['items']:
+            track_id_list.append(track['id'])
+            album_id_list.append(album_id)
+            track_name_list.append(track['name'])
+            track_duration_list.append(track['duration_ms'])
+            track_spotify_url_list.append(track['external_urls']['spotify'])
+            track_preview_url_list.append(track['preview_url'])
             
     # Create a DataFrame
-        data = {
+    data = {
         'track_id': track_id_list,
         'album_id': album_id_list,
         'track_name': track_name_list,
@@ -466,16 +946,19 @@ def extract_tracks_data(album_ids):
         'track_preview_url': track_preview_url_list
         }
 
-    tracks_df = pd.DataFrame(data)
-    return tracks_df
+    # object columns, so a chunk without tracks still has string columns, the durations are cast by the schema
+    tracks_df = pd.DataFrame(data, dtype=object)
+    return apply_schema(tracks_df, 'tracks_table')
 
 
 
 # get track popularity
-def extract_tracks_popularity_table(track_ids):
+def extract_tracks_popularity_table(track_ids, checkpoint=None, failures=None):
     """ This function extracts track popularity given a list of track IDs
     Args:
         track_ids (list): A list of tracks IDs
+        checkpoint (checkpoint.RunCheckpoint, optional): completed batches are saved to and skipped from it.
+        failures (FailedIds, optional): ids that could not be extracted are recorded in it.
 
     Returns:
         pandas.DataFrame: A dataframe containing track popularity and the current date
@@ -483,37 +966,36 @@ def extract_tracks_popularity_table(track_ids):
     # acces spotipy
     sp = get_spotify_client()
     
-    df_track_pop = pd.DataFrame()
-    request_cnt = 0
+    track_pop = ColumnAccumulator(POPULARITY_COLUMNS)
     # we can use a maximum of 50 track ids each time
-    for i in range(0,len(track_ids),50):
-        request_cnt += 1
-        # get 50 tracks in each iteration
-        #print(f"i = {i}, request_cnt = {request_cnt}")
+    for track_batch, track_rows, e in map_batches(sp.tracks, batches(track_ids, 50), 'tracks_popularity',
+                                                  checkpoint, failures,
+                                                  rows=lambda response: popularity_rows(response['tracks'])):
+        if e is not None:
+            log_extraction_error('tracks_popularity', f'track_ids {track_batch}: {e}')
+            continue
+        record_missing_ids('tracks_popularity', track_batch, [row['id'] for row in track_rows], failures)
         try:
-            track_info = sp.tracks(track_ids[i:i+50])
-            # make sure that there is not None
-            #track_info = [item for item in track_info if item is not None]
-            # create temporary datafame
-            df_temp = pd.DataFrame(track_info['tracks'])[['id', 'popularity']]
-            df_track_pop = pd.concat((df_track_pop, df_temp), axis=0, ignore_index=True)
+            track_pop.extend(track_rows)
         except Exception as e:
-            print(e)
-        # sleep for 5 seconds for every 10 requests
-        if request_cnt % 10 == 0:
-            time.sleep(5)
-    df_track_pop['date'] = datetime.now().date()
+            log_extraction_error('tracks_popularity', f'track_ids {track_batch}: {e}')
+            if failures is not None:
+                failures.add('tracks_popularity', track_batch, e)
+    df_track_pop = track_pop.to_frame()
+    df_track_pop['date'] = pd.Timestamp(datetime.now().date())
     df_track_pop = df_track_pop.rename({'id': 'track_id',
                                         'popularity': 'track_popularity'}, axis=1)
-    return df_track_pop
+    return apply_schema(df_track_pop, 'tracks_popularity_table')
 
 
 # extract acoustic features
-def extract_tracks_acoustic_features(track_ids):
+def extract_tracks_acoustic_features(track_ids, checkpoint=None, failures=None):
     """This function extracts acoustic features data for every track
     
     Args:
         track_ids (list or pandas.Series): A list of track IDs
+        checkpoint (checkpoint.RunCheckpoint, optional): completed batches are saved to and skipped from it.
+        failures (FailedIds, optional): ids that could not be extracted are recorded in it.
 
     Returns:
         pandas.DataFrame: dataframe containing acoustic features for each track
@@ -521,29 +1003,42 @@ def extract_tracks_acoustic_features(track_ids):
     """
     # acces spotipy
     sp = get_spotify_client()
-    
-    df = pd.DataFrame()
-    request_cnt = 0
+
+    # features stored by earlier runs, tracks without features are cached as None
+    response_cache = get_response_cache()
+    track_features_by_id = {}
+    if response_cache is not None:
+        track_features_by_id = response_cache.get_many('audio_features', track_ids)
+    missing_ids = [track_id for track_id in dict.fromkeys(track_ids) if track_id not in track_features_by_id]
+
+    fetched = {}
     # we can use a maximum of 100 track ids each time
-    for i in range(0,len(track_ids),100):
-        request_cnt += 1
-        # get 100 tracks in each iteration
-        print(f"i = {i}, request_cnt = {request_cnt}")
+    for track_batch, track_features, e in map_batches(sp.audio_features, batches(missing_ids, 100),
+                                                      'audio_features', checkpoint, failures):
+        if e is not None:
+            log_extraction_error('audio_features', f'track_ids {track_batch}: {e}')
+            continue
+        # the response has one item per requested id
+        fetched.update(zip(track_batch, track_features))
+    if response_cache is not None:
+        response_cache.set_many('audio_features', fetched)
+    track_features_by_id.update(fetched)
+
+    features = ColumnAccumulator(AUDIO_FEATURES_COLUMNS)
+    for track_id in track_ids:
+        item = track_features_by_id.get(track_id)
+        # be sure that there is not None response
+        if item is None:
+            continue
         try:
-            track_features = sp.audio_features(track_ids[i:i+100])
-            # be sure that there is not None response
-            track_features = [item for item in track_features if item is not None]
-            # store in temporary DataFrame
-            df_temp = pd.DataFrame(track_features)
-            # concat
-            df = pd.concat((df, df_temp), axis=0, ignore_index=True)
+            features.append(item)
         except Exception as e:
-            print(e)
-        # sleep for 5 seconds for every 10 requests
-        if request_cnt % 10 == 0:
-            time.sleep(5)
+            log_extraction_error('audio_features', f'track_id \'{track_id}\': {e}')
+            if failures is not None:
+                failures.add('audio_features', [track_id], e)
+    df = features.to_frame()
     df = df.rename({'id': 'track_id'}, axis=1)
-    return df
+    return apply_schema(df, 'tracks_features_table')
     
 
 # clean tracks table
@@ -558,14 +1053,10 @@ def final_trans_tracks_table(tracks_table):
         pandas.DataFrame: Tracks' static data table
         
     """
-    def ms_to_minutes_seconds(duration):
-        duration_tuple = divmod(duration // 1000, 60)
-        duration_display = f"{duration_tuple[0]}:{duration_tuple[1]}"
-        return duration_display
-    # apply function
-    tracks_table['track_duration_display'] = tracks_table['track_duration_ms'].apply(ms_to_minutes_seconds)
+    # duration as minutes:seconds
+    tracks_table['track_duration_display'] = duration_display(tracks_table['track_duration_ms'])
     # clean track_name column
-    tracks_table['original_track_name'] = tracks_table['track_name'].apply(lambda x: x.split('-')[0].strip())
+    tracks_table['original_track_name'] = original_names(tracks_table['track_name'], '-')
     return tracks_table
 
 
@@ -581,7 +1072,7 @@ def final_trans_albums_table(albums_table):
         
     """
     # keep the original name by removin [...]
-    albums_table['original_album_name'] = albums_table['original_album_name'].apply(lambda x: x.split('[')[0].strip())
+    albums_table['original_album_name'] = original_names(albums_table['original_album_name'], '[')
     return albums_table
 
 
@@ -590,39 +1081,258 @@ def final_trans_tracks_features_table(tracks_features_table):
     return tracks_features_table
 
 
+# artists per chunk of the streaming static build, more artists fill more multi-id requests
+ARTISTS_PER_CHUNK = 10
+# chunks waiting between two stages of the static build
+STAGE_QUEUE_SIZE = 2
+
+_STAGES_DONE = object()
+
+
+# run chunks through a chain of stage threads
+def run_stages(chunks, stages, queue_size=STAGE_QUEUE_SIZE):
+    """Runs every chunk through the stages, each stage in its own thread, connected by bounded queues.
+    While a stage works on a chunk, the previous stage already works on the next one, so the
+    network time of different stages overlaps. Every stage's wall time is recorded as 'static:<name>'.
+
+    Args:
+        chunks (iterable): inputs of the first stage
+        stages (list): (name, function) pairs, every function takes the output of the previous stage
+        queue_size (int): chunks waiting between two stages
+
+    Returns:
+        list: outputs of the last stage, in the order of chunks
+    """
+    # the last queue is unbounded, it is drained after every chunk is fed
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages] + [queue.Queue()]
+    errors = []
+
+    def worker(name, fn, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _STAGES_DONE:
+                outbox.put(_STAGES_DONE)
+                return
+            # keep draining after a failure, so the previous stage never blocks
+            if errors:
+                continue
+            try:
+                with stage(f'static:{name}'):
+                    output = fn(item)
+                outbox.put(output)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(name, fn, queues[i], queues[i + 1]),
+                                name=f'static-{name}', daemon=True)
+               for i, (name, fn) in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        for chunk in chunks:
+            if errors:
+                break
+            queues[0].put(chunk)
+    finally:
+        queues[0].put(_STAGES_DONE)
+    outputs = []
+    while True:
+        output = queues[-1].get()
+        if output is _STAGES_DONE:
+            break
+        outputs.append(output)
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return outputs
+
+
 # Extract and Transform static data
-def get_static_tables(artists_list):
+def get_static_tables(artists_list, previous_tables=None, seen_album_ids=None, checkpoint=None,
+                      artists_per_chunk=ARTISTS_PER_CHUNK, failures=None):
     """This function extracts all static tables, i.e tables that do not get updated daily.
+    Artists go through the extraction in chunks of artists_per_chunk, as a pipeline: while the albums
+    of one chunk are selected, the next chunk's album lists are extracted and the artists of the
+    chunk after that are searched, and so on for tracks and acoustic features. Multi-id requests
+    are filled with the ids of every artist in a chunk. Album versions are finally compared across
+    chunks too, so the selected albums are the same as when every stage runs on all artists at once.
+    If the previously loaded static tables are given, only new artists and albums not seen before
+    are extracted and then merged with the existing rows, see update_static_tables.
 
     Args:
         artists_list (list): A list of artists.
+        previous_tables (tuple, optional): artists_table, albums_table, tracks_table and
+            tracks_features_table as loaded in the database.
+        seen_album_ids (set, optional): album ids processed by earlier runs, selected or rejected,
+            e.g. from db_loader.read_processed_album_ids. The album ids processed by this run are
+            added to it, so they can be saved for the next run with db_loader.save_processed_album_ids.
+        checkpoint (checkpoint.RunCheckpoint, optional): checkpoint of the run. Batches completed by
+            an earlier attempt of the same run are not requested again.
+        artists_per_chunk (int): artists flowing through the pipeline together.
+        failures (FailedIds, optional): ids whose requests still failed after the retries are recorded in it.
 
     Returns:
         tuple: ever static table in pd.DataFrame form.
         
          
     """
+    if previous_tables is not None:
+        return update_static_tables(artists_list, *previous_tables, seen_album_ids=seen_album_ids,
+                                    checkpoint=checkpoint, failures=failures)
+    # albums that could not be fetched are not marked as processed
+    if failures is None:
+        failures = FailedIds()
+    # every album is fetched once, for selection and tracks
+    album_cache = AlbumCache(checkpoint=checkpoint, failures=failures)
+
     # get artists
-    artists_table = extract_artists_table(artists_list)
-    # albums_table initial form
-    albums_table = extract_albums_table(artist_id_list=artists_table['artist_id'].to_list())
-    # album selection by removing live, demo, deluxe versions
-    albums_table = album_selection_vol1(albums_table)
-    albums_table = album_selection_vol2(albums_table=albums_table, artists_table=artists_table)
-    tracks_table = extract_tracks_data(album_ids=albums_table['album_id'].to_list())
+    def search_artists(artist_names):
+        return {'artists_table': extract_artists_table(artist_names, failures=failures)}
+
+    # albums_table initial form, without live, demo, deluxe versions
+    def extract_albums(chunk):
+        albums_table = extract_albums_table(artist_id_list=chunk['artists_table']['artist_id'].to_list(),
+                                            checkpoint=checkpoint, failures=failures)
+        return dict(chunk, albums_table=album_selection_vol1(albums_table),
+                    listed_ids=albums_table['album_id'].astype(str).to_list())
+
+    # most popular version of every album of the chunk
+    def select_albums(chunk):
+        albums_table = album_selection_vol2(albums_table=chunk['albums_table'], artists_table=chunk['artists_table'],
+                                            album_cache=album_cache)
+        return dict(chunk, albums_table=albums_table, selected_ids=albums_table['album_id'].to_list())
+
     # remove live albums where the string "Live" is not present in their names
-    # get final track_table as well
-    albums_table, tracks_table = album_selection_vol3(tracks_table=tracks_table, albums_table=albums_table)
-    # get acoustic features 
-    tracks_features_table = extract_tracks_acoustic_features(track_ids=tracks_table['track_id'].to_list())
-    # apply final transformations
-    albums_table = final_trans_albums_table(albums_table)
-    tracks_table = final_trans_tracks_table(tracks_table)
-    tracks_features_table = final_trans_tracks_features_table(tracks_features_table)
+    def extract_tracks(chunk):
+        tracks_table = extract_tracks_data(album_ids=chunk['selected_ids'], album_cache=album_cache)
+        albums_table, tracks_table = album_selection_vol3(tracks_table=tracks_table, albums_table=chunk['albums_table'])
+        return dict(chunk, albums_table=albums_table, tracks_table=tracks_table)
+
+    # get acoustic features
+    def extract_features(chunk):
+        tracks_features_table = extract_tracks_acoustic_features(track_ids=chunk['tracks_table']['track_id'].to_list(),
+                                                                 checkpoint=checkpoint, failures=failures)
+        return dict(chunk, tracks_features_table=tracks_features_table)
+
+    artist_chunks = [artists_list[i:i+artists_per_chunk] for i in range(0, len(artists_list), artists_per_chunk)]
+    chunks = run_stages(artist_chunks, [('extract_artists_table', search_artists),
+                                        ('extract_albums_table', extract_albums),
+                                        ('album_selection', select_albums),
+                                        ('extract_tracks_data', extract_tracks),
+                                        ('extract_tracks_acoustic_features', extract_features)])
+
+    with stage('static:final_trans'):
+        # versions of the same album selected in different chunks, keep the most popular one
+        selected_ids = set(most_popular_versions([album_id for chunk in chunks for album_id in chunk['selected_ids']],
+                                                 album_cache))
+        artists_table = concat_tables([chunk['artists_table'] for chunk in chunks], 'artists_table')
+        albums_table = concat_tables([chunk['albums_table'] for chunk in chunks], 'albums_table')
+        tracks_table = concat_tables([chunk['tracks_table'] for chunk in chunks], 'tracks_table')
+        tracks_features_table = concat_tables([chunk['tracks_features_table'] for chunk in chunks],
+                                              'tracks_features_table')
+        albums_table = albums_table[albums_table['album_id'].isin(selected_ids)]
+        tracks_table = tracks_table[tracks_table['album_id'].isin(selected_ids)]
+        tracks_features_table = tracks_features_table[tracks_features_table['track_id'].isin(tracks_table['track_id'])]
+        # apply final transformations
+        albums_table = final_trans_albums_table(albums_table.reset_index(drop=True))
+        tracks_table = final_trans_tracks_table(tracks_table.reset_index(drop=True))
+        tracks_features_table = final_trans_tracks_features_table(tracks_features_table.reset_index(drop=True))
+    if seen_album_ids is not None:
+        seen_album_ids.update(processed_album_ids([album_id for chunk in chunks for album_id in chunk['listed_ids']],
+                                                  failures))
     # return every static table
     return artists_table, albums_table, tracks_table, tracks_features_table
 
 
+# album ids of a static run that do not have to be looked at again
+def processed_album_ids(album_ids, failures):
+    """Returns the listed album ids, selected or rejected, except the albums whose fetch failed,
+    so the next incremental run tries them again.
+
+    Args:
+        album_ids (list): album ids listed by extract_albums_table
+        failures (FailedIds): failures of the run
+
+    Returns:
+        set: processed album ids
+    """
+    failed = set(failures.ids('albums')) | set(failures.ids('album_tracks'))
+    return set(album_ids) - failed
+
+
+# Incremental update of static data
+def update_static_tables(artists_list, artists_table, albums_table, tracks_table, tracks_features_table,
+                         seen_album_ids=None, checkpoint=None, failures=None):
+    """Incremental version of get_static_tables. Artists whose normalized name is not in artists_table
+    are searched, and only albums not seen before go through album selection, track extraction and
+    acoustic features.
+    New albums with the same original name as an already selected album of the artist are skipped,
+    so existing selections stay unchanged. The new rows are appended to the given tables.
+
+    Args:
+        artists_list (list): A list of artists.
+        artists_table (pandas.DataFrame): artists_table as loaded in the database.
+        albums_table (pandas.DataFrame): albums_table as loaded in the database.
+        tracks_table (pandas.DataFrame): tracks_table as loaded in the database.
+        tracks_features_table (pandas.DataFrame): tracks_features_table as loaded in the database.
+        seen_album_ids (set, optional): every album id processed by earlier runs, including rejected albums.
+            The album ids processed by this run are added to it. Defaults to the album ids of albums_table,
+            then rejected albums are processed again by every run.
+        checkpoint (checkpoint.RunCheckpoint, optional): checkpoint of the run.
+        failures (FailedIds, optional): ids whose requests still failed after the retries are recorded in it.
+
+    Returns:
+        tuple: ever static table in pd.DataFrame form.
+    """
+    if seen_album_ids is None:
+        seen_album_ids = set(albums_table['album_id'].astype(str))
+    # albums that could not be fetched are not marked as processed
+    if failures is None:
+        failures = FailedIds()
+
+    # search only new artists, Spotify names can differ from the list in case and punctuation
+    known_artists = set(normalize_artist_name(name) for name in artists_table['artist_name'])
+    new_artists = [artist for artist in artists_list if normalize_artist_name(artist) not in known_artists]
+    if new_artists:
+        new_artists_table = extract_artists_table(new_artists, failures=failures)
+        new_artists_table = new_artists_table[~new_artists_table['artist_id'].isin(artists_table['artist_id'])]
+        artists_table = concat_tables([artists_table, new_artists_table], 'artists_table')
+
+    # listing artist albums is needed to discover new releases
+    new_albums = extract_albums_table(artist_id_list=artists_table['artist_id'].to_list(), checkpoint=checkpoint,
+                                      failures=failures)
+    new_albums = new_albums[~new_albums['album_id'].isin(seen_album_ids)]
+    listed_ids = new_albums['album_id'].astype(str).to_list()
+    new_albums = album_selection_vol1(new_albums)
+    # skip new versions of albums that are already selected
+    selected = set(zip(albums_table['artist_id'], albums_table['original_album_name']))
+    new_names = original_names(new_albums['album_name'], ['(', '['])
+    new_albums = new_albums[pd.Series([key not in selected for key in zip(new_albums['artist_id'], new_names)],
+                                      index=new_albums.index, dtype=bool)]
+    if new_albums.empty:
+        seen_album_ids.update(listed_ids)
+        return artists_table, albums_table, tracks_table, tracks_features_table
+
+    album_cache = AlbumCache(checkpoint=checkpoint, failures=failures)
+    new_albums = album_selection_vol2(albums_table=new_albums, artists_table=artists_table, album_cache=album_cache)
+    new_tracks = extract_tracks_data(album_ids=new_albums['album_id'].to_list(), album_cache=album_cache)
+    new_albums, new_tracks = album_selection_vol3(tracks_table=new_tracks, albums_table=new_albums)
+    new_tracks = new_tracks[~new_tracks['track_id'].isin(tracks_table['track_id'])]
+    new_tracks_features = extract_tracks_acoustic_features(
+        track_ids=new_tracks.loc[~new_tracks['track_id'].isin(tracks_features_table['track_id']), 'track_id'].to_list(),
+        checkpoint=checkpoint, failures=failures)
+
+    # apply final transformations to the new rows and merge
+    albums_table = concat_tables([albums_table, final_trans_albums_table(new_albums.copy())], 'albums_table')
+    tracks_table = concat_tables([tracks_table, final_trans_tracks_table(new_tracks.copy())], 'tracks_table')
+    tracks_features_table = concat_tables([tracks_features_table,
+                                           final_trans_tracks_features_table(new_tracks_features)],
+                                          'tracks_features_table')
+    seen_album_ids.update(processed_album_ids(listed_ids, failures))
+    return artists_table, albums_table, tracks_table, tracks_features_table
+
+
 
 
 
@@ -1,54 +1,183 @@
 # pip install pyodbc
 #import pypyodbc as odbc
-import sqlalchemy
-import pandas as pd
-from dotenv import load_dotenv
+# only light modules are imported here, pandas, sqlalchemy and spotipy are imported on first use
+import time
+_MODULE_STARTED = time.perf_counter()
 import os
-# imort functions to extract dat from Spotify API
-from extract_transform_data import extract_artists_followers_table, extract_artists_popularity_table, extract_albums_popularity_table, extract_tracks_popularity_table
+import logging
+import threading
+from datetime import date
+from dotenv import load_dotenv
 
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # connect to database
 # specify server and DB name
 server = "spotifyrockdb.database.windows.net"
 database = "SpotifyRockDB"
 
-# load credentials
-load_dotenv()
-password = os.getenv("password")
-
-
-# set connection string
-connection_string = 'Driver={ODBC Driver 18 for SQL Server};Server=tcp:spotifyrockdb.database.windows.net,1433;Database=SpotifyRockDB;Uid=sqladmin;Pwd='+password+';Encrypt=yes;TrustServerCertificate=no;Connection Timeout=2000;'
-
-# Using SQLAlcehmy engine to load data with pandas
-engine = sqlalchemy.create_engine(f'mssql+pyodbc:///?odbc_connect={connection_string}')
-
-# get artist_ids, album_ids, track_ids lists
-query = f'SELECT artist_id FROM artists_table'
-artist_ids = pd.read_sql(query, engine)['artist_id'].to_list() 
-
-query = f'SELECT album_id FROM albums_table'
-album_ids = pd.read_sql(query, engine)['album_id'].to_list() 
-
-query = f'SELECT track_id FROM tracks_table'
-track_ids = pd.read_sql(query, engine)['track_id'].to_list() 
-
-# Load into DB
-df_artists_followers_table = extract_artists_followers_table(artist_ids=artist_ids)
-df_artists_followers_table.to_sql('artists_followers_table', con=engine, if_exists='append', index=False)
-
-df_artists_popularity_table = extract_artists_popularity_table(artist_ids=artist_ids)
-df_artists_popularity_table.to_sql('artists_popularity_table', con=engine, if_exists='append', index=False)
-
-df_albums_popularity_table = extract_albums_popularity_table(album_ids=album_ids)
-df_albums_popularity_table.to_sql('albums_popularity_table', con=engine, if_exists='append', index=False)
-
-df_tracks_popularity_table = extract_tracks_popularity_table(track_ids=track_ids)
-df_tracks_popularity_table.to_sql('tracks_popularity_table', con=engine, if_exists='append', index=False)
-
-# close SQLAlchemy engine
-engine.dispose()
-
-
-
+# seconds the ids of the static tables are reused by warm invocations
+IDS_TTL_SECONDS = 6 * 3600
+# failed ids above which a shard is left incomplete, so the next run resumes it
+MAX_FAILED_IDS = 100
+
+# kept across warm invocations of the function
+_engine = None
+_checkpoint_store = None
+_ids_cache = {}
+_globals_lock = threading.Lock()
+_invocations = 0
+
+
+def get_connection_url():
+    # load credentials
+    load_dotenv()
+    password = os.getenv("password")
+    # set connection string
+    connection_string = 'Driver={ODBC Driver 18 for SQL Server};Server=tcp:spotifyrockdb.database.windows.net,1433;Database=SpotifyRockDB;Uid=sqladmin;Pwd='+password+';Encrypt=yes;TrustServerCertificate=no;Connection Timeout=2000;'
+    return f'mssql+pyodbc:///?odbc_connect={connection_string}'
+
+
+def get_engine():
+    """Returns the SQLAlchemy engine, created on the first call and reused by warm invocations.
+    Pooled connections are checked before use, since Azure SQL closes idle connections.
+    DATABASE_URL overrides the Azure SQL connection, e.g. with a local database.
+    """
+    global _engine
+    if _engine is None:
+        with _globals_lock:
+            if _engine is None:
+                # chunked, executemany based loading into the database
+                from db_loader import create_db_engine
+                _engine = create_db_engine(os.getenv("DATABASE_URL") or get_connection_url(),
+                                           pool_pre_ping=True, pool_recycle=1800)
+    return _engine
+
+
+def get_checkpoint_store():
+    """Returns the checkpoint store, opened on the first call."""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        with _globals_lock:
+            if _checkpoint_store is None:
+                # completed batches, so a retried run resumes where the failed one stopped
+                from checkpoint import CheckpointStore
+                # env CHECKPOINT_PATH or a file in the temp directory of this instance
+                _checkpoint_store = CheckpointStore()
+    return _checkpoint_store
+
+
+def read_ids_cached(con, table_name, id_column, chunksize):
+    """read_ids for run_daily_pipeline, reusing the id chunks of a static table for IDS_TTL_SECONDS
+    (env IDS_TTL_SECONDS), so warm invocations do not query the ids again.
+    """
+    from daily_pipeline import read_ids_in_chunks
+    ttl = float(os.getenv("IDS_TTL_SECONDS", IDS_TTL_SECONDS))
+    key = (table_name, id_column, chunksize)
+    cached = _ids_cache.get(key)
+    if cached is None or time.monotonic() - cached[0] > ttl:
+        cached = (time.monotonic(), list(read_ids_in_chunks(con, table_name, id_column, chunksize=chunksize)))
+        _ids_cache[key] = cached
+    return iter(cached[1])
+
+
+# function entry point, e.g. of a timer trigger
+def main(mytimer=None, shard_index=None, shard_count=None):
+    """Extracts the daily tables chunk by chunk and loads each chunk while the next one is extracted.
+    With shard_count > 1 every instance processes a disjoint slice of the ids, partitioned by a
+    stable hash, and records a completion marker once its slice has landed.
+    Modules, the database engine, the Spotify client and the ids of the static tables are set up
+    on the first invocation and reused by warm ones. The setup time is logged and recorded
+    in the metrics as 'startup:setup', with cold_start telling if this was the first invocation.
+    Ids still failing after the retries, and ids the API did not find, are saved to the
+    daily_failed_ids table. With more than MAX_FAILED_IDS (env MAX_FAILED_IDS) failed ids, not
+    counting the ones not found, the checkpoint is kept, the shard is not marked complete and
+    RuntimeError is raised, so a re-run requests only the missing ids.
+
+    Args:
+        mytimer (azure.functions.TimerRequest, optional): timer of a timer trigger, not used
+        shard_index (int, optional): shard of this instance, defaults to env SHARD_INDEX or 0
+        shard_count (int, optional): number of instances, defaults to env SHARD_COUNT or 1
+
+    Returns:
+        dict: rows written per daily table, only the changed rows with DAILY_WRITE_MODE=changes
+    """
+    global _invocations
+    shard_index = int(os.getenv("SHARD_INDEX", 0)) if shard_index is None else shard_index
+    shard_count = int(os.getenv("SHARD_COUNT", 1)) if shard_count is None else shard_count
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f'shard_index must be between 0 and {shard_count - 1}, got {shard_index}')
+    setup_started = time.perf_counter()
+    cold_start = _invocations == 0
+    _invocations += 1
+
+    # request, sleep, load and stage timings, logged as JSON
+    from metrics import stage, emit_metrics, reset_metrics, get_metrics
+    reset_metrics()
+    # streaming extract and load of the daily tables
+    from daily_pipeline import (run_daily_pipeline, get_daily_load, shard_reader, mark_shard_complete,
+                                all_shards_complete, save_failed_ids)
+    # Parquet copy of the daily tables, when SNAPSHOT_STORE_PATH is set
+    from snapshot_store import get_snapshot_store
+    from schema import SNAPSHOT_KEYS
+    # shared Spotify client, one token and connection pool per process
+    from spotify_client import get_spotify_client
+    # ids still failing after the retries of the extract functions
+    from extract_transform_data import FailedIds, NOT_FOUND
+    engine = get_engine()
+    get_spotify_client()
+    # every shard resumes and clears only its own batches
+    run_id = 'daily' if shard_count == 1 else f'daily-{shard_index}-of-{shard_count}'
+    checkpoint = get_checkpoint_store().run(run_id)
+    setup_seconds = time.perf_counter() - setup_started
+    get_metrics().record_stage('startup:setup', setup_seconds)
+    if cold_start:
+        get_metrics().record_stage('startup:module_to_first_invocation', setup_started - _MODULE_STARTED)
+    logger.info(f'startup: cold_start={cold_start}, setup {setup_seconds:.2f} s')
+
+    read_ids = read_ids_cached if shard_count == 1 else shard_reader(read_ids_cached, shard_index, shard_count)
+    failures = FailedIds()
+    snapshot_store = get_snapshot_store()
+    with stage('daily:run'):
+        # DAILY_WRITE_MODE=changes writes only rows whose values changed since the last run
+        rows_written = run_daily_pipeline(engine, load=get_daily_load(), checkpoint=checkpoint,
+                                          snapshot_store=snapshot_store, read_ids=read_ids, failures=failures)
+    # saved on every run, so a re-run that extracted the ids clears them
+    save_failed_ids(engine, failures, shard_index, shard_count)
+    failed = failures.to_frame()
+    if len(failed):
+        logger.warning(f'{len(failed)} ids could not be extracted after retries, saved to daily_failed_ids: '
+                       f'{failed.groupby("stage").size().to_dict()}')
+    # ids the API did not find are not found by a re-run either
+    retryable = int((failed['error'] != NOT_FOUND).sum())
+    max_failed_ids = int(os.getenv("MAX_FAILED_IDS", MAX_FAILED_IDS))
+    if retryable > max_failed_ids:
+        # the checkpoint is kept and the shard not marked complete, the next run requests only the missing ids
+        emit_metrics()
+        raise RuntimeError(f'shard {shard_index} of {shard_count}: {retryable} failed ids, '
+                           f'more than MAX_FAILED_IDS={max_failed_ids}, the shard is left incomplete')
+    # the run is complete, a new run on the same day starts from scratch
+    checkpoint.clear()
+    mark_shard_complete(engine, shard_index, shard_count, rows_written=sum(rows_written.values()))
+    landed = shard_count == 1 or all_shards_complete(engine, shard_count)
+    if shard_count > 1 and landed:
+        logger.info(f'all {shard_count} shards of the daily run have landed')
+    if landed and snapshot_store is not None:
+        # one Parquet file per table for the day instead of one per chunk
+        with stage('daily:compact_snapshots'):
+            for table_name in SNAPSHOT_KEYS:
+                snapshot_store.compact(table_name, [date.today()])
+    emit_metrics()
+    return rows_written
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Daily extract and load of the Spotify tables')
+    parser.add_argument('--shard-index', type=int, default=None)
+    parser.add_argument('--shard-count', type=int, default=None)
+    args = parser.parse_args()
+    main(shard_index=args.shard_index, shard_count=args.shard_count)
+    # close SQLAlchemy engine
+    get_engine().dispose()
@@ -0,0 +1,177 @@
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class Metrics:
+    """Counters of one process: Spotify requests per endpoint (count, latency histogram,
+    ids per request, bytes received, status codes), time spent sleeping for the rate limit,
+    database writes per table, wall time per pipeline stage, ids retried or given up on
+    and errors logged per extraction stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.endpoints = {}
+        self.loads = {}
+        self.stages = {}
+        self.retries = {}
+        self.errors = {}
+        self.sleep_seconds = 0.0
+
+    def record_request(self, endpoint, seconds, n_ids=1, n_bytes=0, status=200):
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'ids': 0, 'bytes': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'throttled': 0, 'errors': 0,
+                'latency_ms_buckets': [0] * len(LATENCY_BUCKETS_MS)})
+            stats['requests'] += 1
+            stats['ids'] += n_ids
+            stats['bytes'] += n_bytes
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if status == 429:
+                stats['throttled'] += 1
+            elif status >= 400:
+                stats['errors'] += 1
+            latency_ms = seconds * 1000
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if latency_ms <= bound:
+                    stats['latency_ms_buckets'][i] += 1
+                    break
+
+    def record_sleep(self, seconds):
+        with self._lock:
+            self.sleep_seconds += seconds
+
+    def record_load(self, table_name, rows, seconds):
+        with self._lock:
+            stats = self.loads.setdefault(table_name, {'loads': 0, 'rows': 0, 'seconds': 0.0})
+            stats['loads'] += 1
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            stats = self.stages.setdefault(name, {'runs': 0, 'seconds': 0.0})
+            stats['runs'] += 1
+            stats['seconds'] += seconds
+
+    def record_retry(self, stage, retried_ids, failed_ids=0):
+        with self._lock:
+            stats = self.retries.setdefault(stage, {'retried_ids': 0, 'failed_ids': 0})
+            stats['retried_ids'] += retried_ids
+            stats['failed_ids'] += failed_ids
+
+    def record_error(self, stage, count=1):
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + count
+
+    def to_dict(self):
+        """Returns every counter, with derived averages, as a JSON serializable dict."""
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self.endpoints.items():
+                endpoints[endpoint] = dict(
+                    stats,
+                    latency_ms_buckets=dict(zip(map(str, LATENCY_BUCKETS_MS), stats['latency_ms_buckets'])),
+                    mean_seconds=stats['seconds'] / stats['requests'],
+                    ids_per_request=stats['ids'] / stats['requests'])
+            loads = {table_name: dict(stats, rows_per_second=stats['rows'] / stats['seconds'] if stats['seconds'] else None)
+                     for table_name, stats in self.loads.items()}
+            return {
+                'wall_seconds': time.time() - self.started_at,
+                'sleep_seconds': self.sleep_seconds,
+                'endpoints': endpoints,
+                'loads': loads,
+                'stages': {name: dict(stats) for name, stats in self.stages.items()},
+                'retries': {name: dict(stats) for name, stats in self.retries.items()},
+                'errors': dict(self.errors),
+            }
+
+
+def get_metrics():
+    """Returns the process-wide metrics."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+def reset_metrics():
+    """Starts new metrics, e.g. at the start of a function invocation."""
+    global _metrics
+    with _metrics_lock:
+        _metrics = Metrics()
+
+
+@contextmanager
+def stage(name):
+    """Records the wall time of a pipeline stage.
+
+    Example:
+        with stage('extract_albums_table'):
+            albums_table = extract_albums_table(artist_ids)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().record_stage(name, time.perf_counter() - start)
+
+
+def emit_metrics():
+    """Logs the metrics as one JSON line, e.g. for Application Insights.
+
+    Returns:
+        dict: the logged metrics
+    """
+    data = get_metrics().to_dict()
+    logger.info(json.dumps({'metrics': data}))
+    return data
+
+
+# ids in API paths, e.g. albums/<album id>/tracks
+_ID_SEGMENT = re.compile(r'^[0-9A-Za-z]{22}$')
+
+
+def spotify_endpoint(url):
+    """Endpoint name of a Spotify API url, with ids replaced, e.g. 'albums/{id}/tracks'.
+
+    Returns:
+        tuple: (endpoint, number of ids in the request)
+    """
+    parsed = urlparse(url)
+    if 'accounts.spotify.com' in parsed.netloc:
+        return 'token', 0
+    segments = [segment for segment in parsed.path.split('/') if segment and segment != 'v1']
+    n_ids = sum(1 for segment in segments if _ID_SEGMENT.match(segment))
+    endpoint = '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in segments)
+    ids = parse_qs(parsed.query).get('ids')
+    if ids:
+        n_ids += len(ids[0].split(','))
+    return endpoint, n_ids
+
+
+def record_spotify_response(response, *args, **kwargs):
+    """requests response hook recording every Spotify API call."""
+    endpoint, n_ids = spotify_endpoint(response.url)
+    get_metrics().record_request(endpoint, response.elapsed.total_seconds(), n_ids=n_ids,
+                                 n_bytes=len(response.content), status=response.status_code)
+    return response
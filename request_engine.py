@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from spotipy.exceptions import SpotifyException
+from metrics import get_metrics
+
+
+# default request budget, can be overridden with environment variables
+MAX_REQUESTS_PER_SECOND = 10.0
+MAX_IN_FLIGHT = 4
+# how many times a single request is retried after a 429 response
+MAX_RETRIES = 5
+# seconds to wait after a 429 response without a Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Token bucket limiter. Tokens are added at `rate` per second, up to `capacity`,
+    and every request takes one token.
+
+    Args:
+        rate (float): tokens added per second.
+        capacity (float): maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def acquire(self):
+        """Blocks until a token is available.
+
+        Returns:
+            float: seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RequestEngine:
+    """Runs Spotify API calls within a request budget. Calls go through a token bucket,
+    at most `max_in_flight` of them run at the same time, also across concurrent map calls,
+    and 429 responses pause every caller for the `Retry-After` period and halve the request rate.
+    The rate then grows back towards `max_rate` with every successful call.
+
+    Args:
+        max_rate (float): upper limit of requests per second.
+        max_in_flight (int): maximum number of concurrent requests.
+        max_retries (int): retries for a single call after 429 responses.
+        min_rate (float): lower limit of requests per second after backing off.
+    """
+
+    def __init__(self, max_rate=MAX_REQUESTS_PER_SECOND, max_in_flight=MAX_IN_FLIGHT,
+                 max_retries=MAX_RETRIES, min_rate=0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate=max_rate, capacity=max(1.0, max_rate))
+        self.sleep_seconds = 0.0
+        self.throttled_cnt = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def _wait_for_pause(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def _on_success(self):
+        rate = self.bucket.rate
+        if rate < self.max_rate:
+            # additive increase
+            self.bucket.set_rate(min(self.max_rate, rate + self.max_rate / 20))
+
+    def _on_throttled(self, retry_after):
+        with self._lock:
+            self.throttled_cnt += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        # multiplicative decrease
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+
+    def call(self, fn, *args, **kwargs):
+        """Calls fn(*args, **kwargs) within the request budget, retrying on 429 responses.
+        Other errors are raised right away, see is_rate_limited.
+
+        Returns:
+            The return value of fn.
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = self._wait_for_pause() + self.bucket.acquire()
+            with self._lock:
+                self.sleep_seconds += waited
+            get_metrics().record_sleep(waited)
+            try:
+                with self._in_flight:
+                    result = fn(*args, **kwargs)
+            except SpotifyException as e:
+                # other errors, e.g. server errors left after the retries of the session, are for
+                # the caller to retry, they must not pause every worker
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self._on_throttled(retry_after_seconds(e, attempt))
+                continue
+            self._on_success()
+            return result
+
+    def map(self, fn, items):
+        """Calls fn(item) for every item, running up to max_in_flight calls concurrently.
+
+        Args:
+            fn (callable): function taking one item, e.g. sp.tracks.
+            items (list): e.g. batches of ids.
+
+        Yields:
+            tuple: (item, result, error) in the order of items. error is None on success,
+                otherwise the raised exception and result is None.
+        """
+        def run(item):
+            try:
+                return item, self.call(fn, item), None
+            except Exception as e:
+                return item, None, e
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            for output in executor.map(run, items):
+                yield output
+
+
+def is_rate_limited(exception):
+    """True for a 429 response of the API. spotipy also raises a 429 SpotifyException when the
+    session runs out of retries after server errors, that one has no response headers
+    (None or empty), while a response always has some.
+
+    Args:
+        exception (SpotifyException): the raised exception.
+
+    Returns:
+        bool: True when the request was throttled.
+    """
+    return exception.http_status == 429 and bool(exception.headers)
+
+
+def retry_after_seconds(exception, attempt=0):
+    """Reads the Retry-After header of a 429 response.
+
+    Args:
+        exception (SpotifyException): the raised exception.
+        attempt (int): number of previous attempts, used for backoff when the header is missing.
+
+    Returns:
+        float: seconds to wait before the next request.
+    """
+    headers = exception.headers or {}
+    try:
+        return float(headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER * 2 ** attempt
+
+
+def batches(ids, size):
+    """Splits a list of ids into consecutive batches of at most `size` ids."""
+    ids = list(ids)
+    return [ids[i:i+size] for i in range(0, len(ids), size)]
+
+
+def get_request_engine():
+    """Returns the process-wide request engine. The request budget is read from
+    SPOTIFY_MAX_RPS and SPOTIFY_MAX_IN_FLIGHT when set.
+
+    Returns:
+        RequestEngine: request engine shared by every extract function.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RequestEngine(
+                    max_rate=float(os.getenv("SPOTIFY_MAX_RPS", MAX_REQUESTS_PER_SECOND)),
+                    max_in_flight=int(os.getenv("SPOTIFY_MAX_IN_FLIGHT", MAX_IN_FLIGHT)),
+                )
+    return _engine
+
+
+def reset_request_engine():
+    """Drops the process-wide request engine, so the next get_request_engine call
+    reads the request budget again.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = None
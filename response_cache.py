@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# cache file of a ResponseCache created without a path, the shared cache is only used when
+# SPOTIFY_CACHE_PATH is set
+CACHE_PATH = '.spotify_cache.sqlite'
+# seconds a response stays valid, per endpoint
+DEFAULT_TTLS = {
+    # short, new releases show up in the album lists
+    'artist_albums': 24 * 3600,
+    # short, album objects carry the popularity that album selection compares
+    'albums': 24 * 3600,
+    'audio_features': 365 * 24 * 3600,
+    'search': 90 * 24 * 3600,
+}
+# least recently used responses are evicted above this size
+MAX_BYTES = 512 * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class ResponseCache:
+    """Persistent SQLite cache of Spotify API responses, keyed by endpoint and id.
+    Responses expire after the TTL of their endpoint, and the least recently used ones
+    are evicted when the cache grows above max_bytes. Hits and misses are counted per endpoint.
+
+    Args:
+        path (str): SQLite file
+        ttls (dict): endpoint -> seconds. Endpoints without a TTL never expire.
+        max_bytes (int): maximum total size of the cached responses
+    """
+
+    def __init__(self, path=CACHE_PATH, ttls=None, max_bytes=MAX_BYTES):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'endpoint TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'stored_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL, '
+            'PRIMARY KEY (endpoint, key))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, endpoint, keys):
+        """Returns the cached, not expired responses for the given ids.
+
+        Args:
+            endpoint (str): e.g. 'albums'
+            keys (list): ids
+
+        Returns:
+            dict: id -> response, only for ids found in the cache
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        ttl = self.ttls.get(endpoint)
+        min_stored_at = now - ttl if ttl is not None else float('-inf')
+        found = {}
+        with self._lock:
+            # stay below SQLite's limit of bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self._conn.execute(
+                    f'SELECT key, value, stored_at FROM responses '
+                    f'WHERE endpoint = ? AND key IN ({", ".join("?" * len(chunk))})',
+                    [endpoint, *chunk]).fetchall()
+                for key, value, stored_at in rows:
+                    if stored_at >= min_stored_at:
+                        found[key] = json.loads(value)
+            self._conn.executemany('UPDATE responses SET accessed_at = ? WHERE endpoint = ? AND key = ?',
+                                   [(now, endpoint, key) for key in found])
+            self._conn.commit()
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + len(found)
+            self.misses[endpoint] = self.misses.get(endpoint, 0) + len(keys) - len(found)
+        return found
+
+    def get(self, endpoint, key, default=None):
+        return self.get_many(endpoint, [key]).get(key, default)
+
+    def set_many(self, endpoint, items):
+        """Stores responses and evicts the least recently used ones if the cache is too large.
+
+        Args:
+            endpoint (str): e.g. 'albums'
+            items (dict): id -> JSON serializable response
+        """
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            value = json.dumps(value)
+            rows.append((endpoint, key, value, now, now, len(value)))
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+            self._evict()
+
+    def set(self, endpoint, key, value):
+        self.set_many(endpoint, {key: value})
+
+    def size(self):
+        with self._lock:
+            return self._size()
+
+    def _size(self):
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        excess = self._size() - self.max_bytes
+        if excess <= 0:
+            return
+        # evict down to 90% of max_bytes, oldest access first
+        excess += self.max_bytes // 10
+        evicted = 0
+        keys = []
+        for endpoint, key, size in self._conn.execute(
+                'SELECT endpoint, key, size FROM responses ORDER BY accessed_at'):
+            if evicted >= excess:
+                break
+            keys.append((endpoint, key))
+            evicted += size
+        self._conn.executemany('DELETE FROM responses WHERE endpoint = ? AND key = ?', keys)
+        self._conn.commit()
+
+    def stats(self):
+        """Returns hits and misses per endpoint since the cache was opened.
+
+        Returns:
+            dict: endpoint -> {'hits': int, 'misses': int}
+        """
+        with self._lock:
+            endpoints = set(self.hits) | set(self.misses)
+            return {endpoint: {'hits': self.hits.get(endpoint, 0), 'misses': self.misses.get(endpoint, 0)}
+                    for endpoint in sorted(endpoints)}
+
+
+def get_response_cache():
+    """Returns the process-wide response cache, stored at SPOTIFY_CACHE_PATH. The cache is opt-in,
+    without SPOTIFY_CACHE_PATH, or with an empty one, every response comes from the API.
+
+    Returns:
+        ResponseCache: the shared cache, or None
+    """
+    global _cache
+    path = os.getenv('SPOTIFY_CACHE_PATH')
+    if not path:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(path)
+    return _cache
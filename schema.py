@@ -0,0 +1,135 @@
+import pandas as pd
+import sqlalchemy
+from pandas.api.types import union_categoricals
+
+# ids repeat across rows and snapshots, Arrow strings when pyarrow is installed, categories otherwise
+try:
+    import pyarrow  # noqa: F401
+    ID_DTYPE = 'string[pyarrow]'
+except ImportError:
+    ID_DTYPE = 'category'
+# Spotify ids are 22 base62 characters, key columns are stored with this length, since SQL Server
+# cannot index the VARCHAR(max) columns pandas creates for strings
+ID_LENGTH = 22
+# snapshot dates, stored as SQL DATE
+DATE_DTYPE = 'datetime64[ns]'
+DATE_COLUMNS = ('date',)
+
+# compact dtype of every column of the extracted tables, columns not listed stay as they are
+TABLE_SCHEMAS = {
+    'artists_table': {'artist_id': ID_DTYPE},
+    'artists_snapshot': {'artist_id': ID_DTYPE, 'followers': 'int32', 'artist_popularity': 'int8',
+                         'date': DATE_DTYPE},
+    'artists_followers_table': {'artist_id': ID_DTYPE, 'followers': 'int32', 'date': DATE_DTYPE},
+    'artists_popularity_table': {'artist_id': ID_DTYPE, 'artist_popularity': 'int8', 'date': DATE_DTYPE},
+    'albums_table': {'album_id': ID_DTYPE, 'artist_id': ID_DTYPE, 'album_release_date': 'int16',
+                     'album_total_tracks': 'int16'},
+    'albums_popularity_table': {'album_id': ID_DTYPE, 'album_popularity': 'int8', 'date': DATE_DTYPE},
+    'processed_albums_table': {'album_id': ID_DTYPE},
+    'tracks_table': {'track_id': ID_DTYPE, 'album_id': ID_DTYPE, 'track_duration_ms': 'int32'},
+    'tracks_popularity_table': {'track_id': ID_DTYPE, 'track_popularity': 'int8', 'date': DATE_DTYPE},
+    'tracks_features_table': {'track_id': ID_DTYPE, 'danceability': 'float32', 'energy': 'float32',
+                              'key': 'int8', 'track_key': 'int8', 'loudness': 'float32', 'mode': 'int8',
+                              'speechiness': 'float32', 'acousticness': 'float32',
+                              'instrumentalness': 'float32', 'liveness': 'float32', 'valence': 'float32',
+                              'tempo': 'float32', 'duration_ms': 'int32', 'time_signature': 'int8'},
+}
+
+# a row of a daily snapshot table is identified by id and date
+SNAPSHOT_KEYS = {
+    'artists_followers_table': ['artist_id', 'date'],
+    'artists_popularity_table': ['artist_id', 'date'],
+    'albums_popularity_table': ['album_id', 'date'],
+    'tracks_popularity_table': ['track_id', 'date'],
+}
+
+
+def apply_schema(df, table_name):
+    """Casts the columns of a table to the compact dtypes of TABLE_SCHEMAS.
+    Integer columns with missing values get the nullable integer dtype of the same size.
+    Tables without a schema are returned unchanged.
+
+    Args:
+        df (pandas.DataFrame): extracted table, or a table read back from the database
+        table_name (str): key of TABLE_SCHEMAS, e.g. 'tracks_popularity_table'
+
+    Returns:
+        pandas.DataFrame: the table with compact dtypes
+    """
+    schema = TABLE_SCHEMAS.get(table_name, {})
+    dtypes = {}
+    for column, dtype in schema.items():
+        if column not in df.columns or str(df[column].dtype) == dtype:
+            continue
+        if dtype.startswith('int') and df[column].isna().any():
+            dtype = dtype.capitalize()
+        dtypes[column] = dtype
+    if not dtypes:
+        return df
+    df = df.copy(deep=False)
+    for column, dtype in dtypes.items():
+        if dtype == DATE_DTYPE:
+            df[column] = pd.to_datetime(df[column]).astype(DATE_DTYPE)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def concat_tables(frames, table_name):
+    """Concatenates tables of the same kind, e.g. daily snapshots of a backfill, keeping the
+    compact dtypes. Plain pd.concat turns categories that differ between frames into objects.
+    Empty frames, e.g. of a chunk without artists, are left out when another frame has rows,
+    so their column order and dtypes do not change the result.
+
+    Args:
+        frames (list): DataFrames of one table
+        table_name (str): key of TABLE_SCHEMAS
+
+    Returns:
+        pandas.DataFrame: the concatenated table
+    """
+    frames = [apply_schema(frame, table_name) for frame in frames]
+    if not frames:
+        return pd.DataFrame()
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    for column in frames[0].columns:
+        if not all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames if column in frame):
+            continue
+        categories = union_categoricals([frame[column] for frame in frames if column in frame]).categories
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)})
+                  if column in frame else frame for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_sql_frame(df, key_columns=()):
+    """Prepares a table with compact dtypes for DataFrame.to_sql, so the database schema and the
+    stored values are the same as before the compact dtypes. Categorical and Arrow string columns
+    become plain strings, float32 columns the float64 of their decimal value, e.g. 120.047 and not
+    120.0469970703125, and integer columns int64 (BIGINT), nullable ones Int64.
+    Date columns are written as SQL DATE.
+    String key columns are written as VARCHAR(ID_LENGTH), so they can be indexed.
+
+    Args:
+        df (pandas.DataFrame): table to write
+        key_columns (list): columns identifying a row, e.g. id and date
+
+    Returns:
+        tuple: (DataFrame, dtype argument of to_sql)
+    """
+    upcast = {}
+    for column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype) or isinstance(dtype, pd.StringDtype):
+            upcast[column] = object
+        elif dtype == 'float32':
+            # through the shortest decimal repr, a plain cast stores 120.047 as 120.0469970703125
+            df = df.assign(**{column: df[column].astype(str).astype('float64')})
+        elif pd.api.types.is_integer_dtype(dtype) and dtype != 'int64' and dtype != 'Int64':
+            upcast[column] = 'Int64' if pd.api.types.is_extension_array_dtype(dtype) else 'int64'
+    if upcast:
+        df = df.astype(upcast)
+    dtype = {column: sqlalchemy.Date() for column in DATE_COLUMNS
+             if column in df.columns and pd.api.types.is_datetime64_any_dtype(df[column])}
+    dtype.update({column: sqlalchemy.String(ID_LENGTH) for column in key_columns
+                  if column in df.columns and column not in dtype and pd.api.types.is_object_dtype(df[column])})
+    return df, dtype
@@ -0,0 +1,173 @@
+import os
+import time
+from datetime import date
+import pandas as pd
+from checkpoint import batch_key
+from schema import SNAPSHOT_KEYS, TABLE_SCHEMAS, apply_schema
+
+# optional dependency, only needed when the snapshot store is used
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# column of the stored files with the write time in nanoseconds, rows of later writes win
+WRITTEN_AT = '_written_at'
+
+
+class SnapshotStore:
+    """Parquet store of the daily snapshot tables, partitioned by table (entity type) and date:
+
+        <root>/tracks_popularity_table/date=2024-01-31/part-<key>.parquet
+
+    Every write of a chunk creates one file per date, named after the chunk's ids, so writing
+    the same chunk again on the same day replaces the file. Rows carry their write time, so when
+    chunks with other boundaries hold the same id and date, reads return the row written last,
+    and compact merges the files of a date into one. Reads prune partitions outside the
+    date range, read only the requested columns and skip row groups without the requested ids.
+
+    Args:
+        root (str): directory of the store, local or a mounted blob container
+        filesystem (pyarrow.fs.FileSystem, optional): e.g. a pyarrow Azure filesystem,
+            root is then a path within it. Defaults to the local filesystem.
+    """
+
+    def __init__(self, root, filesystem=None):
+        if pa is None:
+            raise ImportError('SnapshotStore requires pyarrow, pip install pyarrow')
+        self.filesystem = filesystem or pafs.LocalFileSystem()
+        self.root = root.rstrip('/') if filesystem else os.path.abspath(root)
+
+    def _table_dir(self, table_name):
+        if table_name not in SNAPSHOT_KEYS:
+            raise ValueError(f'{table_name} is not a snapshot table, expected one of {list(SNAPSHOT_KEYS)}')
+        return f'{self.root}/{table_name}'
+
+    def write(self, df, table_name):
+        """Writes a chunk of a snapshot table, e.g. as extracted by the daily job.
+
+        Args:
+            df (pandas.DataFrame): rows with an id column and a date column
+            table_name (str): e.g. 'tracks_popularity_table'
+
+        Returns:
+            list: paths of the written files
+        """
+        df = apply_schema(df, table_name).assign(**{WRITTEN_AT: time.time_ns()})
+        return [self._write_part(part, table_name, day.date()) for day, part in df.groupby('date', sort=True)]
+
+    def _write_part(self, part, table_name, day):
+        id_column = SNAPSHOT_KEYS[table_name][0]
+        # sorted ids keep the row group statistics useful for id filters
+        part = part.drop(columns='date').sort_values(id_column)
+        ids = part[id_column].astype(str)
+        # ids are stored as plain strings, parquet dictionary-encodes them on disk
+        part = part.assign(**{id_column: ids})
+        partition_dir = self._partition_dir(table_name, day)
+        self.filesystem.create_dir(partition_dir, recursive=True)
+        name = f'part-{batch_key(ids)}.parquet'
+        path = f'{partition_dir}/{name}'
+        # write then move, so readers never see a partial file. Hidden files are not read
+        pq.write_table(pa.Table.from_pandas(part, preserve_index=False), f'{partition_dir}/.{name}',
+                       filesystem=self.filesystem)
+        self.filesystem.move(f'{partition_dir}/.{name}', path)
+        return path
+
+    def _partition_dir(self, table_name, day):
+        return f'{self._table_dir(table_name)}/date={day.isoformat()}'
+
+    def read(self, table_name, start=None, end=None, ids=None, columns=None):
+        """Reads a date range and/or a set of ids of a snapshot table.
+
+        Args:
+            table_name (str): e.g. 'tracks_popularity_table'
+            start (datetime.date, optional): first date, inclusive
+            end (datetime.date, optional): last date, inclusive
+            ids (list, optional): ids to read, defaults to every id
+            columns (list, optional): columns to read besides the id and the date,
+                defaults to every column
+
+        Returns:
+            pandas.DataFrame: rows ordered by date and id, with the compact dtypes of schema.py
+        """
+        keys = SNAPSHOT_KEYS[table_name]
+        id_column = keys[0]
+        df = self._latest_rows(table_name, start, end, ids, columns)
+        if df is None:
+            empty_columns = TABLE_SCHEMAS[table_name] if columns is None else keys + list(columns)
+            return apply_schema(pd.DataFrame(columns=list(dict.fromkeys(empty_columns))), table_name)
+        df = df.drop(columns=WRITTEN_AT).sort_values(['date', id_column], ignore_index=True)
+        if columns is None:
+            df = df[keys + [column for column in df.columns if column not in keys]]
+        return apply_schema(df, table_name)
+
+    def _latest_rows(self, table_name, start=None, end=None, ids=None, columns=None):
+        # the rows of the last write of every id and date, with their write time, None without files
+        keys = SNAPSHOT_KEYS[table_name]
+        id_column = keys[0]
+        table_dir = self._table_dir(table_name)
+        if self.filesystem.get_file_info(table_dir).type == pafs.FileType.NotFound:
+            return None
+        dataset = ds.dataset(table_dir, filesystem=self.filesystem, format='parquet',
+                             partitioning=ds.partitioning(pa.schema([('date', pa.date32())]), flavor='hive'))
+        condition = None
+        for expression in [ds.field('date') >= pa.scalar(start, pa.date32()) if start else None,
+                           ds.field('date') <= pa.scalar(end, pa.date32()) if end else None,
+                           ds.field(id_column).isin(pa.array(list(ids), pa.string())) if ids is not None else None]:
+            if expression is not None:
+                condition = expression if condition is None else condition & expression
+        if columns is not None:
+            columns = keys + [column for column in columns if column not in keys + [WRITTEN_AT]] + [WRITTEN_AT]
+        df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+        # a chunk written again with different chunk boundaries leaves duplicate rows, the last write wins
+        return df.sort_values(WRITTEN_AT, kind='stable').drop_duplicates(subset=keys, keep='last')
+
+    def compact(self, table_name, dates=None):
+        """Merges the files of every date into one file holding the last written row of every id,
+        and removes the merged files. Should run while nothing writes to the table, e.g. once
+        every shard of the daily run has landed.
+
+        Args:
+            table_name (str): e.g. 'tracks_popularity_table'
+            dates (list, optional): dates to compact, defaults to every stored date
+
+        Returns:
+            int: number of files removed
+        """
+        removed = 0
+        for day in (self.dates(table_name) if dates is None else dates):
+            partition_dir = self._partition_dir(table_name, day)
+            selector = pafs.FileSelector(partition_dir, allow_not_found=True)
+            paths = [info.path for info in self.filesystem.get_file_info(selector)
+                     if info.type == pafs.FileType.File and info.base_name.startswith('part-')]
+            if len(paths) < 2:
+                continue
+            # rows keep their write time, so a compacted row never wins over a later write
+            merged = self._write_part(self._latest_rows(table_name, day, day), table_name, day)
+            for path in paths:
+                if path != merged:
+                    self.filesystem.delete_file(path)
+                    removed += 1
+        return removed
+
+    def dates(self, table_name):
+        """Returns the dates stored for a snapshot table, in ascending order."""
+        selector = pafs.FileSelector(self._table_dir(table_name), allow_not_found=True)
+        return sorted(date.fromisoformat(info.base_name.split('=', 1)[1])
+                      for info in self.filesystem.get_file_info(selector)
+                      if info.type == pafs.FileType.Directory and info.base_name.startswith('date='))
+
+
+def get_snapshot_store():
+    """Returns the snapshot store at SNAPSHOT_STORE_PATH, or None when SNAPSHOT_STORE_PATH is not set.
+
+    Returns:
+        SnapshotStore: the store, or None
+    """
+    path = os.getenv('SNAPSHOT_STORE_PATH')
+    if not path:
+        return None
+    return SnapshotStore(path)
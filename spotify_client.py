@@ -0,0 +1,99 @@
+import os
+import threading
+import requests
+import urllib3
+import spotipy
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+from dotenv import load_dotenv
+# every API response is recorded in the process metrics
+from metrics import record_spotify_response
+
+
+# keep-alive connections kept open to api.spotify.com
+POOL_MAXSIZE = 32
+# seconds to wait for a response
+REQUESTS_TIMEOUT = 10
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _build_session(pool_maxsize=POOL_MAXSIZE):
+    """Creates a requests session with a pooled keep-alive adapter,
+    retrying on server errors the same way spotipy does by default.
+
+    Args:
+        pool_maxsize (int): Maximum number of connections kept open per host.
+
+    Returns:
+        requests.Session: the HTTP session shared by the Spotify client and its token manager.
+    """
+    session = requests.Session()
+    retry = urllib3.Retry(
+        total=spotipy.Spotify.max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST']),
+        status=spotipy.Spotify.max_retries,
+        backoff_factor=0.3,
+        # 429 responses are left to request_engine, which honors Retry-After and slows
+        # every worker down, urllib3 must not sleep and retry them on its own
+        status_forcelist=(500, 502, 503, 504),
+        respect_retry_after_header=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize,
+                                            max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.hooks['response'].append(record_spotify_response)
+    return session
+
+
+def _create_spotify_client():
+    load_dotenv()
+    client_id = os.getenv("CLIENT_ID")
+    client_secret = os.getenv("CLIENT_SECRET")
+    session = _build_session()
+    # the token is kept in memory and only refreshed when it expires
+    client_credentials_manager = SpotifyClientCredentials(
+        client_id=client_id, client_secret=client_secret,
+        cache_handler=MemoryCacheHandler(),
+        requests_session=session,
+    )
+    sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager,
+                         requests_session=session,
+                         requests_timeout=REQUESTS_TIMEOUT)
+    # other API and token urls, e.g. a local mock API for benchmarks
+    if os.getenv("SPOTIFY_API_URL"):
+        sp.prefix = os.getenv("SPOTIFY_API_URL")
+    if os.getenv("SPOTIFY_TOKEN_URL"):
+        client_credentials_manager.OAUTH_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL")
+    return sp
+
+
+# access Spotify
+def get_spotify_client():
+    """Returns the process-wide Spotify client. The client is created on the first call,
+    using CLIENT_ID and CLIENT_SECRET (and optionally SPOTIFY_API_URL and SPOTIFY_TOKEN_URL)
+    from the environment, and reused afterwards,
+    so the OAuth token and the HTTP connections are shared by every caller.
+
+    Returns:
+        spotipy.Spotify: Spotify client object.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_spotify_client()
+    return _client
+
+
+def reset_spotify_client():
+    """Drops the cached Spotify client, e.g. after the credentials have changed.
+    The next get_spotify_client call creates a new one.
+    """
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,43 @@
+import os
+import sys
+import pytest
+
+# the modules live at the repository root, next to main.py, the mock Spotify API in benchmarks/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def mock_spotify(monkeypatch):
+    """Starts the mock Spotify API of benchmarks/mock_spotify.py and points the shared client at it,
+    without the persistent response cache and with a request budget that does not slow tests down.
+    Tests can change the catalog, bad_ids and outages of the returned MockSpotify.
+    """
+    from mock_spotify import Catalog, MockSpotify
+    import extract_transform_data
+    from metrics import reset_metrics
+    from request_engine import reset_request_engine
+    from spotify_client import reset_spotify_client
+    mock = MockSpotify(Catalog(n_artists=4, albums_per_artist=8, tracks_per_album=3)).start()
+    for key, value in mock.environ.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setenv('SPOTIFY_CACHE_PATH', '')
+    monkeypatch.setenv('SPOTIFY_MAX_RPS', '1000')
+    monkeypatch.setenv('SPOTIFY_MAX_IN_FLIGHT', '4')
+    monkeypatch.setattr(extract_transform_data, 'RETRY_BACKOFF', 0.0)
+    reset_spotify_client()
+    reset_request_engine()
+    reset_metrics()
+    yield mock
+    mock.stop()
+    reset_spotify_client()
+    reset_request_engine()
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    from db_loader import create_db_engine
+    engine = create_db_engine(f'sqlite:///{tmp_path / "test.db"}')
+    yield engine
+    engine.dispose()
@@ -0,0 +1,74 @@
+import json
+from datetime import date
+import pytest
+import checkpoint as checkpoint_module
+from checkpoint import CheckpointStore, batch_key
+from extract_transform_data import extract_tracks_popularity_table, map_batches
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CheckpointStore(str(tmp_path / 'checkpoints.sqlite'))
+    yield store
+    store.close()
+
+
+def test_saved_batches_are_loaded_by_run_and_stage(store):
+    run = store.run('daily', date(2024, 3, 1))
+    run.save('tracks', 'k1', [1, 2])
+    run.save_many('tracks', {'k2': {'a': 1}, 'k3': None})
+    assert run.load_many('tracks', ['k1', 'k2', 'k3', 'k4']) == {'k1': [1, 2], 'k2': {'a': 1}, 'k3': None}
+    assert run.load_many('albums', ['k1']) == {}
+    assert store.run('daily', date(2024, 3, 2)).load_many('tracks', ['k1']) == {}
+    assert store.run('static', date(2024, 3, 1)).load_many('tracks', ['k1']) == {}
+    run.clear()
+    assert run.load_many('tracks', ['k1', 'k2']) == {}
+
+
+def test_batch_key_depends_on_ids_and_order():
+    assert batch_key(['a', 'b']) == batch_key(['a', 'b'])
+    assert batch_key(['a', 'b']) != batch_key(['b', 'a'])
+
+
+def test_path_defaults_to_env_or_temp_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('CHECKPOINT_PATH', str(tmp_path / 'env.sqlite'))
+    store = CheckpointStore()
+    assert store.path == str(tmp_path / 'env.sqlite')
+    store.close()
+    monkeypatch.delenv('CHECKPOINT_PATH')
+    assert not checkpoint_module.CHECKPOINT_PATH.startswith('.')
+
+
+def test_resume_skips_completed_batches(store):
+    run = store.run('static')
+    calls = []
+
+    def fn(batch):
+        calls.append(batch)
+        return [id_.upper() for id_ in batch]
+
+    id_batches = [['a', 'b'], ['c', 'd'], ['e']]
+    # the first attempt stops after two batches
+    first = map_batches(fn, id_batches, 'letters', checkpoint=run)
+    assert [next(first)[1], next(first)[1]] == [['A', 'B'], ['C', 'D']]
+    first.close()
+    calls.clear()
+    results = {tuple(batch): result for batch, result, e in map_batches(fn, id_batches, 'letters', checkpoint=run)}
+    assert calls == [['e']]
+    assert results == {('a', 'b'): ['A', 'B'], ('c', 'd'): ['C', 'D'], ('e',): ['E']}
+
+
+def test_checkpoint_stores_rows_instead_of_responses(mock_spotify, store):
+    run = store.run('daily')
+    track_ids = list(mock_spotify.catalog.tracks)[:60]
+    df = extract_tracks_popularity_table(track_ids, checkpoint=run)
+    payloads = run.load_many('tracks_popularity', [batch_key(track_ids[:50]), batch_key(track_ids[50:])])
+    assert len(payloads) == 2
+    assert all(set(row) == {'id', 'popularity'} for payload in payloads.values() for row in payload)
+    # a resumed run reads every batch from the checkpoint
+    requests_before = mock_spotify.request_cnt
+    resumed = extract_tracks_popularity_table(track_ids, checkpoint=run)
+    assert mock_spotify.request_cnt == requests_before
+    assert resumed.equals(df)
+    stored = store._conn.execute('SELECT payload FROM checkpoints').fetchall()
+    assert max(len(json.loads(payload)) for payload, in stored) == 50
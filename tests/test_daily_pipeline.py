@@ -0,0 +1,168 @@
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from daily_pipeline import (changed_rows, get_daily_load, load_daily_changes, load_daily_table, mark_shard_complete,
+                            read_daily_series, read_latest_values, run_daily_pipeline, shard_of, shard_reader,
+                            completed_shards, all_shards_complete)
+from db_loader import read_table
+from schema import apply_schema
+
+TABLE = 'tracks_popularity_table'
+START = date(2024, 3, 1)
+
+
+def snapshot(values, day):
+    return apply_schema(pd.DataFrame({'track_id': list(values), 'track_popularity': list(values.values()),
+                                      'date': pd.Timestamp(day)}), TABLE)
+
+
+def series_values(df):
+    return {(row.date.date(), row.track_id): row.track_popularity for row in df.itertuples()}
+
+
+def static_ids(con, catalog):
+    pd.DataFrame({'artist_id': list(catalog.artists)}).to_sql('artists_table', con, index=False)
+    pd.DataFrame({'album_id': list(catalog.albums)}).to_sql('albums_table', con, index=False)
+    pd.DataFrame({'track_id': list(catalog.tracks)}).to_sql('tracks_table', con, index=False)
+
+
+# popularity of tracks a, b and c on five days, c is removed after the third day
+DAYS = [{'a': 1, 'b': 2, 'c': 3}, {'a': 1, 'b': 5, 'c': 3}, {'a': 1, 'b': 5, 'c': 4}, {'a': 7, 'b': 5}, {'a': 7, 'b': 5}]
+
+
+@pytest.fixture
+def loaded(tmp_path):
+    from db_loader import create_db_engine
+    engines = {mode: create_db_engine(f'sqlite:///{tmp_path / mode}.db') for mode in ('full', 'changes')}
+    for offset, values in enumerate(DAYS):
+        load_daily_table(snapshot(values, START + timedelta(offset)), TABLE, engines['full'])
+        load_daily_changes(snapshot(values, START + timedelta(offset)), TABLE, engines['changes'])
+    yield engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def test_change_only_load_writes_changed_rows(loaded):
+    assert len(read_table(TABLE, loaded['full'])) == 13
+    changes = read_table(TABLE, loaded['changes'])
+    assert len(changes) == 6
+    latest = read_latest_values(loaded['changes'], TABLE, ['a', 'b', 'c', 'd'])
+    assert dict(zip(latest['track_id'], latest['track_popularity'])) == {'a': 7, 'b': 5, 'c': 4}
+
+
+def test_change_only_load_is_idempotent(loaded):
+    load_daily_changes(snapshot(DAYS[-1], START + timedelta(4)), TABLE, loaded['changes'])
+    load_daily_changes(snapshot({'a': 8, 'b': 5}, START + timedelta(4)), TABLE, loaded['changes'])
+    assert len(read_table(TABLE, loaded['changes'])) == 7
+
+
+def test_reconstruction_equals_the_full_table(loaded):
+    end = START + timedelta(4)
+    full = series_values(read_table(TABLE, loaded['full']))
+    reconstructed = series_values(read_daily_series(loaded['changes'], TABLE, START, end))
+    assert {key: reconstructed[key] for key in full} == full
+    # the removed track keeps its last value, the full table has no rows for it
+    assert set(reconstructed) - set(full) == {(START + timedelta(3), 'c'), (end, 'c')}
+    assert reconstructed[(end, 'c')] == 4
+    assert series_values(read_daily_series(loaded['changes'], TABLE, START, end, ids=['a', 'b'])) == \
+        {key: value for key, value in full.items() if key[1] != 'c'}
+
+
+def test_series_starts_from_the_last_row_before_start(loaded):
+    start = START + timedelta(3)
+    df = read_daily_series(loaded['changes'], TABLE, start, start + timedelta(1), ids=['b'])
+    assert df['date'].dt.date.tolist() == [start, start + timedelta(1)]
+    assert df['track_popularity'].tolist() == [5, 5]
+    assert read_daily_series(loaded['changes'], TABLE, START - timedelta(5), START - timedelta(1)).empty
+
+
+def test_days_without_a_run_are_not_filled(loaded):
+    engine = loaded['changes']
+    # runs recorded on every day but the fourth one
+    for offset in (0, 1, 2, 4):
+        mark_shard_complete(engine, 0, 1, run_date=START + timedelta(offset))
+    df = read_daily_series(engine, TABLE, START, START + timedelta(4))
+    # the fourth day has its written row only
+    assert series_values(df[df['date'] == pd.Timestamp(START + timedelta(3))]) == {(START + timedelta(3), 'a'): 7}
+    assert len(df[df['date'] == pd.Timestamp(START + timedelta(4))]) == 3
+
+
+def test_days_fill_only_the_shards_that_landed(loaded):
+    engine = loaded['changes']
+    for offset in range(5):
+        mark_shard_complete(engine, 0, 2, run_date=START + timedelta(offset))
+        if offset != 1:
+            mark_shard_complete(engine, 1, 2, run_date=START + timedelta(offset))
+    df = read_daily_series(engine, TABLE, START, START + timedelta(4))
+    second_day = df[df['date'] == pd.Timestamp(START + timedelta(1))]
+    # b changed on the second day, so its row is there whatever its shard
+    expected = {id_ for id_ in 'abc' if shard_of(id_, 2) == 0} | {'b'}
+    assert set(second_day['track_id']) == expected
+    assert completed_shards(engine, 2, START + timedelta(1)) == {0}
+    assert all_shards_complete(engine, 2, START)
+
+
+def test_changed_rows_compares_every_value_column():
+    latest = snapshot({'a': 1, 'b': 2}, START)
+    fresh = snapshot({'a': 1, 'b': 3, 'c': 4}, START + timedelta(1))
+    assert changed_rows(fresh, latest, TABLE)['track_id'].tolist() == ['b', 'c']
+    assert changed_rows(fresh, latest.iloc[:0], TABLE)['track_id'].tolist() == ['a', 'b', 'c']
+
+
+def test_shard_reader_partitions_ids():
+    def read_ids(con, table_name, id_column, chunksize):
+        ids = [f'id{i}' for i in range(100)]
+        for i in range(0, len(ids), chunksize):
+            yield ids[i:i + chunksize]
+
+    shards = [[id_ for chunk in shard_reader(read_ids, index, 3)(None, 'tracks_table', 'track_id', chunksize=7)
+               for id_ in chunk] for index in range(3)]
+    assert sorted(sum(shards, [])) == sorted(f'id{i}' for i in range(100))
+    assert all(shard_of(id_, 3) == index for index, shard in enumerate(shards) for id_ in shard)
+
+
+def test_get_daily_load(monkeypatch):
+    assert get_daily_load() is load_daily_table
+    monkeypatch.setenv('DAILY_WRITE_MODE', 'changes')
+    assert get_daily_load() is load_daily_changes
+    monkeypatch.setenv('DAILY_WRITE_MODE', 'other')
+    with pytest.raises(ValueError):
+        get_daily_load()
+
+
+def test_daily_pipeline_run_twice_upserts(mock_spotify, sqlite_engine):
+    static_ids(sqlite_engine, mock_spotify.catalog)
+    first = run_daily_pipeline(sqlite_engine, id_chunksize=10)
+    assert first == {'artists_followers_table': 4, 'artists_popularity_table': 4,
+                     'albums_popularity_table': 32, 'tracks_popularity_table': 96}
+    run_daily_pipeline(sqlite_engine, id_chunksize=10)
+    assert len(read_table(TABLE, sqlite_engine)) == 96
+    # nothing changed since the last run
+    assert run_daily_pipeline(sqlite_engine, load=load_daily_changes)['tracks_popularity_table'] == 96
+    assert run_daily_pipeline(sqlite_engine, load=load_daily_changes)['tracks_popularity_table'] == 0
+
+
+def test_daily_pipeline_loads_every_chunk_as_it_is_extracted(mock_spotify, sqlite_engine, tmp_path):
+    from snapshot_store import SnapshotStore
+    static_ids(sqlite_engine, mock_spotify.catalog)
+    loaded = []
+
+    def load(df, table_name, con):
+        loaded.append((table_name, len(df)))
+        return load_daily_table(df, table_name, con)
+
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    rows_written = run_daily_pipeline(sqlite_engine, load=load, id_chunksize=25, queue_size=1, snapshot_store=store)
+    assert [size for table_name, size in loaded if table_name == TABLE] == [25, 25, 25, 21]
+    assert rows_written[TABLE] == 96
+    assert len(store.read(TABLE)) == 96
+
+
+def test_daily_pipeline_raises_load_errors(mock_spotify, sqlite_engine):
+    static_ids(sqlite_engine, mock_spotify.catalog)
+
+    def load(df, table_name, con):
+        raise RuntimeError('database is gone')
+
+    with pytest.raises(RuntimeError, match='database is gone'):
+        run_daily_pipeline(sqlite_engine, load=load, id_chunksize=10, queue_size=1)
@@ -0,0 +1,113 @@
+import pandas as pd
+import pytest
+import sqlalchemy
+from pandas.io.sql import SQLDatabase, SQLTable
+from sqlalchemy.dialects import mssql
+from sqlalchemy.schema import CreateIndex, CreateTable
+from db_loader import bulk_load, read_table
+from schema import apply_schema, to_sql_frame
+
+
+def popularity(track_ids, values, day='2024-03-01'):
+    return apply_schema(pd.DataFrame({'track_id': track_ids, 'track_popularity': values,
+                                      'date': pd.Timestamp(day)}), 'tracks_popularity_table')
+
+
+def table_rows(engine, table_name):
+    return read_table(table_name, engine).sort_values(['date', 'track_id']).reset_index(drop=True)
+
+
+def test_keyed_load_is_idempotent(sqlite_engine):
+    df = popularity(['a', 'b', 'c'], [1, 2, 3])
+    bulk_load(df, 'tracks_popularity_table', sqlite_engine, key_columns=['track_id', 'date'])
+    bulk_load(df, 'tracks_popularity_table', sqlite_engine, key_columns=['track_id', 'date'])
+    rows = table_rows(sqlite_engine, 'tracks_popularity_table')
+    assert len(rows) == 3
+    assert rows['track_popularity'].tolist() == [1, 2, 3]
+
+
+def test_keyed_load_replaces_rows_of_the_same_key_only(sqlite_engine):
+    keys = ['track_id', 'date']
+    bulk_load(popularity(['a', 'b'], [1, 2], '2024-03-01'), 'tracks_popularity_table', sqlite_engine, key_columns=keys)
+    bulk_load(popularity(['a', 'b'], [5, 6], '2024-03-02'), 'tracks_popularity_table', sqlite_engine, key_columns=keys)
+    bulk_load(popularity(['b', 'c'], [7, 8], '2024-03-02'), 'tracks_popularity_table', sqlite_engine, key_columns=keys)
+    rows = table_rows(sqlite_engine, 'tracks_popularity_table')
+    assert list(zip(rows['track_id'], rows['date'].dt.day, rows['track_popularity'])) == [
+        ('a', 1, 1), ('b', 1, 2), ('a', 2, 5), ('b', 2, 7), ('c', 2, 8)]
+    # the staging tables are dropped
+    assert sqlalchemy.inspect(sqlite_engine).get_table_names() == ['tracks_popularity_table']
+
+
+def test_plain_and_staged_loads_append(sqlite_engine):
+    df = popularity(['a', 'b'], [1, 2])
+    stats = bulk_load(df, 'tracks_popularity_table', sqlite_engine)
+    bulk_load(df, 'tracks_popularity_table', sqlite_engine, staging=True)
+    assert stats.rows == 2
+    assert len(table_rows(sqlite_engine, 'tracks_popularity_table')) == 4
+
+
+@pytest.mark.parametrize('table_name, key_columns', [
+    ('tracks_popularity_table', ['track_id', 'date']),
+    ('tracks_popularity_table_latest', ['track_id']),
+])
+def test_staging_table_ddl_can_be_indexed_on_sql_server(sqlite_engine, table_name, key_columns):
+    df, dtype = to_sql_frame(popularity(['a'], [1]), key_columns)
+    table = SQLTable(f'{table_name}_staging', SQLDatabase(sqlite_engine), frame=df, index=False, dtype=dtype).table
+    dialect = mssql.dialect()
+    ddl = str(CreateTable(table).compile(dialect=dialect))
+    # without a length pandas creates VARCHAR(max), which SQL Server cannot index
+    assert 'track_id VARCHAR(22)' in ddl
+    assert 'max' not in ddl
+    index = sqlalchemy.Index('ix_staging', *[table.c[column] for column in key_columns])
+    assert 'CREATE INDEX ix_staging' in str(CreateIndex(index).compile(dialect=dialect))
+
+
+def test_non_key_strings_keep_the_default_type(sqlite_engine):
+    df = pd.DataFrame({'track_id': ['a'], 'track_name': ['Song']})
+    _, dtype = to_sql_frame(df, ['track_id'])
+    assert set(dtype) == {'track_id'}
+
+
+def test_compact_dtypes_are_written_with_the_previous_types_and_values(sqlite_engine):
+    df = apply_schema(pd.DataFrame({'track_id': ['a', 'b'], 'tempo': [120.047, 99.9], 'key': [3, 11],
+                                    'duration_ms': [215000, 180000]}), 'tracks_features_table')
+    assert str(df['tempo'].dtype) == 'float32' and str(df['key'].dtype) == 'int8'
+    bulk_load(df, 'tracks_features_table', sqlite_engine, key_columns=['track_id'])
+    with sqlite_engine.connect() as conn:
+        rows = conn.exec_driver_sql('SELECT tempo, "key", duration_ms FROM tracks_features_table '
+                                    'ORDER BY track_id').fetchall()
+    assert [tuple(row) for row in rows] == [(120.047, 3, 215000), (99.9, 11, 180000)]
+    types = {column['name']: column['type'] for column in
+             sqlalchemy.inspect(sqlite_engine).get_columns('tracks_features_table')}
+    assert isinstance(types['tempo'], sqlalchemy.Float) and not isinstance(types['tempo'], sqlalchemy.REAL)
+    assert isinstance(types['key'], sqlalchemy.BigInteger)
+    assert isinstance(types['duration_ms'], sqlalchemy.BigInteger)
+
+    frame, dtype = to_sql_frame(df, ['track_id'])
+    table = SQLTable('tracks_features_table', SQLDatabase(sqlite_engine), frame=frame, index=False,
+                     dtype=dtype).table
+    ddl = str(CreateTable(table).compile(dialect=mssql.dialect()))
+    assert 'tempo FLOAT(53)' in ddl
+    assert '[key] BIGINT' in ddl
+    assert 'SMALLINT' not in ddl and 'REAL' not in ddl
+
+
+def test_keyed_load_creates_the_target_table_with_a_key_index(sqlite_engine):
+    bulk_load(popularity(['a'], [1]), 'tracks_popularity_table', sqlite_engine, key_columns=['track_id', 'date'])
+    bulk_load(popularity(['b'], [2]), 'tracks_popularity_table', sqlite_engine, key_columns=['track_id', 'date'])
+    indexes = sqlalchemy.inspect(sqlite_engine).get_indexes('tracks_popularity_table')
+    assert [(index['name'], index['column_names']) for index in indexes] == [
+        ('ix_tracks_popularity_table_keys', ['track_id', 'date'])]
+    with sqlite_engine.connect() as conn:
+        plan = ' '.join(str(row) for row in conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN DELETE FROM tracks_popularity_table WHERE track_id = 'a' AND date = '2024-03-01'"))
+    assert 'ix_tracks_popularity_table_keys' in plan
+    # unkeyed loads create no index
+    bulk_load(popularity(['a'], [1]), 'other_table', sqlite_engine)
+    assert sqlalchemy.inspect(sqlite_engine).get_indexes('other_table') == []
+
+
+def test_load_rate_is_logged(sqlite_engine, caplog):
+    with caplog.at_level('INFO', logger='db_loader'):
+        bulk_load(popularity(['a', 'b'], [1, 2]), 'tracks_popularity_table', sqlite_engine)
+    assert any(record.getMessage().startswith('tracks_popularity_table: loaded 2 rows') for record in caplog.records)
@@ -0,0 +1,221 @@
+import pytest
+import pandas as pd
+from extract_transform_data import ColumnAccumulator
+
+
+def accumulator():
+    return ColumnAccumulator({'album_id': None, 'popularity': 'b', 'duration_ms': 'i'})
+
+
+def test_column_accumulator_builds_typed_columns():
+    columns = accumulator()
+    columns.extend([{'album_id': 'a', 'popularity': 10, 'duration_ms': 1000},
+                    {'album_id': 'b', 'popularity': 20, 'duration_ms': 2000}])
+    df = columns.to_frame()
+    assert df['album_id'].tolist() == ['a', 'b']
+    assert str(df['popularity'].dtype) == 'int8'
+    assert df['duration_ms'].tolist() == [1000, 2000]
+
+
+def test_column_accumulator_append_is_all_or_nothing():
+    columns = accumulator()
+    with pytest.raises(OverflowError):
+        columns.append({'album_id': 'a', 'popularity': 10, 'duration_ms': 2 ** 40})
+    assert len(columns) == 0
+    assert columns.to_frame().shape == (0, 3)
+
+
+@pytest.mark.parametrize('bad_record, error', [
+    ({'album_id': 'c', 'popularity': 1000, 'duration_ms': 1}, OverflowError),
+    ({'album_id': 'c', 'popularity': None, 'duration_ms': 1}, TypeError),
+    ({'album_id': 'c', 'duration_ms': 1}, KeyError),
+])
+def test_column_accumulator_extend_is_all_or_nothing(bad_record, error):
+    columns = accumulator()
+    columns.append({'album_id': 'a', 'popularity': 1, 'duration_ms': 1})
+    with pytest.raises(error):
+        columns.extend([{'album_id': 'b', 'popularity': 2, 'duration_ms': 2}, bad_record,
+                        {'album_id': 'd', 'popularity': 4, 'duration_ms': 4}])
+    df = columns.to_frame()
+    assert df['album_id'].tolist() == ['a']
+    assert df['popularity'].tolist() == [1]
+    assert df['duration_ms'].tolist() == [1]
+
+
+def test_extraction_errors_are_logged_and_counted_per_stage(mock_spotify, caplog):
+    from extract_transform_data import extract_tracks_popularity_table
+    from metrics import get_metrics
+    track_ids = list(mock_spotify.catalog.tracks)[:10]
+    mock_spotify.bad_ids = {track_ids[3]}
+    with caplog.at_level('WARNING', logger='extract_transform_data'):
+        df = extract_tracks_popularity_table(track_ids)
+    assert len(df) == 9
+    assert get_metrics().to_dict()['errors'] == {'tracks_popularity': 1}
+    assert any(track_ids[3] in record.getMessage() and record.getMessage().startswith('tracks_popularity:')
+               for record in caplog.records)
+
+
+def test_match_artist_prefers_exact_then_normalized_names():
+    from extract_transform_data import match_artist
+    items = [{'id': '1', 'name': 'Guns N Roses Tribute'}, {'id': '2', 'name': "Guns N' Roses"},
+             {'id': '3', 'name': "GUNS N'ROSES"}]
+    assert match_artist(items, "guns n'roses")['id'] == '3'
+    assert match_artist(items, 'Guns N Roses')['id'] == '2'
+    assert match_artist(items, 'Slash') is None
+    assert match_artist([], 'Slash') is None
+
+
+def test_unmatched_artist_names_are_recorded_not_cached(mock_spotify, tmp_path, monkeypatch):
+    import response_cache
+    from extract_transform_data import FailedIds, extract_artists_table
+    monkeypatch.setenv('SPOTIFY_CACHE_PATH', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(response_cache, '_cache', None)
+    # the mock search finds "Artist 00001" for this name, but the name does not match
+    mock_spotify.catalog.artist_names['unknown band'] = next(iter(mock_spotify.catalog.artists))
+    failures = FailedIds()
+    df = extract_artists_table(['Artist 00001', 'Unknown Band'], failures=failures)
+    assert df['artist_name'].tolist() == ['Artist 00001']
+    assert failures.ids('search') == ['Unknown Band']
+    cache = response_cache.get_response_cache()
+    assert cache.get_many('search', ['artist00001', 'unknownband']).keys() == {'artist00001'}
+    cache.close()
+    monkeypatch.setattr(response_cache, '_cache', None)
+
+
+@pytest.fixture
+def engine_env(monkeypatch):
+    import extract_transform_data
+    from metrics import reset_metrics
+    from request_engine import reset_request_engine
+    monkeypatch.setenv('SPOTIFY_MAX_RPS', '1000')
+    monkeypatch.setattr(extract_transform_data, 'RETRY_BACKOFF', 0.0)
+    reset_request_engine()
+    reset_metrics()
+    yield
+    reset_request_engine()
+
+
+def error(status):
+    from spotipy.exceptions import SpotifyException
+    return SpotifyException(status, -1, f'status {status}')
+
+
+def test_map_batches_splits_a_batch_down_to_the_invalid_ids(engine_env):
+    from extract_transform_data import FailedIds, batches, map_batches
+    ids = [f'id{i:02d}' for i in range(16)]
+    bad = {'id03', 'id12'}
+    requested = []
+
+    def fetch(batch):
+        requested.append(batch)
+        if bad & set(batch):
+            raise error(400)
+        return batch
+
+    failures = FailedIds()
+    results = list(map_batches(fetch, batches(ids, 8), 'test', failures=failures))
+    extracted = [id_ for batch, result, e in results if e is None for id_ in result]
+    assert sorted(extracted) == sorted(set(ids) - bad)
+    assert sorted(failures.ids('test')) == sorted(bad)
+    assert [batch for batch, result, e in results if e is not None] == [['id03'], ['id12']]
+    # every level of the split requests two halves of each failing batch
+    assert len(requested) == 2 + 2 * 2 * 3
+
+
+def outage(mock, responses):
+    # the next requests get 502 responses, 4 of them exhaust the retries of the session
+    with mock._lock:
+        mock._outage_left = responses
+
+
+@pytest.fixture
+def one_in_flight(mock_spotify, monkeypatch):
+    from request_engine import reset_request_engine
+    # requests one after the other, so an outage hits a known request
+    monkeypatch.setenv('SPOTIFY_MAX_IN_FLIGHT', '1')
+    reset_request_engine()
+    return mock_spotify
+
+
+def test_map_batches_retries_server_outages(one_in_flight):
+    from extract_transform_data import FailedIds, extract_tracks_popularity_table
+    from request_engine import get_request_engine
+    mock = one_in_flight
+    track_ids = list(mock.catalog.tracks)
+    failures = FailedIds()
+    outage(mock, 4)
+    df = extract_tracks_popularity_table(track_ids, failures=failures)
+    assert sorted(df['track_id'].astype(str)) == sorted(track_ids)
+    assert len(failures) == 0
+    assert mock.failed_cnt == 4
+    # the outage is not taken for throttling
+    assert get_request_engine().throttled_cnt == 0
+
+    outage(mock, 16)
+    df = extract_tracks_popularity_table(track_ids[:50], failures=failures)
+    assert df.empty
+    assert sorted(failures.ids('tracks_popularity')) == sorted(track_ids[:50])
+
+
+def test_ids_missing_from_responses_are_recorded(mock_spotify):
+    from extract_transform_data import NOT_FOUND, AlbumCache, FailedIds, extract_tracks_popularity_table
+    track_ids = list(mock_spotify.catalog.tracks)[:3] + ['0' * 22]
+    failures = FailedIds()
+    assert len(extract_tracks_popularity_table(track_ids, failures=failures)) == 3
+    album_cache = AlbumCache(failures=failures)
+    album_cache.fetch(list(mock_spotify.catalog.albums)[:2] + ['1' * 22])
+    assert len(album_cache) == 2
+    assert failures.to_frame().values.tolist() == [['tracks_popularity', '0' * 22, NOT_FOUND],
+                                                  ['albums', '1' * 22, NOT_FOUND]]
+
+
+def test_album_tracks_keep_their_order_when_a_page_is_retried(one_in_flight, monkeypatch):
+    from mock_spotify import Catalog
+    from extract_transform_data import AlbumCache
+    from spotify_client import get_spotify_client
+    mock = one_in_flight
+    mock.catalog = Catalog(n_artists=1, albums_per_artist=1, tracks_per_album=160)
+    album_id = next(iter(mock.catalog.albums))
+    sp = get_spotify_client()
+    album_tracks = sp.album_tracks
+    failed = []
+
+    def first_offset_50_page_fails(album_id, limit=50, offset=0):
+        if offset == 50 and not failed:
+            failed.append(offset)
+            outage(mock, 4)
+        return album_tracks(album_id, limit=limit, offset=offset)
+
+    monkeypatch.setattr(sp, 'album_tracks', first_offset_50_page_fails)
+    album_cache = AlbumCache()
+    album_cache.fetch([album_id])
+    assert failed and mock.failed_cnt == 4
+    names = [track['name'] for track in album_cache.get(album_id)['tracks']['items']]
+    assert names == [f'Song {t}' for t in range(160)]
+
+
+@pytest.mark.parametrize('name, edition', [
+    ('Rumours', 'original'), ('Rumours (Live)', 'live'), ('Back In Black - Live at Wembley', 'live'),
+    ('The Wall (Deluxe Edition)', 'deluxe'), ('Nevermind [Remix]', 'remix'), ('The Wall Demos', 'demo'),
+    ('The Wall (Demo Version)', 'demo'), ('The Demon Album', 'original'), ('Delivered', 'original'),
+    ('Remixed Feelings', 'original'), ('Alive', 'original'), ('Nevermind (Demos)', 'original'),
+])
+def test_classify_album_edition(name, edition):
+    from extract_transform_data import classify_album_edition
+    assert classify_album_edition(pd.Series([name])).tolist() == [edition]
+
+
+def test_album_selection_keeps_the_albums_of_the_previous_implementation():
+    from album_selection_benchmark import legacy_album_selection_vol1, synthetic_albums
+    from extract_transform_data import album_selection_vol1
+    df = synthetic_albums(5000)
+    selected = album_selection_vol1(df)
+    assert set(selected['album_id']) == set(legacy_album_selection_vol1(df)['album_id'])
+    # the input order is kept
+    assert selected['album_id'].is_monotonic_increasing
+
+
+def test_empty_accumulator_has_object_string_columns():
+    df = accumulator().to_frame()
+    assert df['album_id'].dtype == object
+    assert df['album_id'].str.lower().empty
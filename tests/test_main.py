@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+import main
+from daily_pipeline import completed_shards, read_failed_ids
+from db_loader import create_db_engine
+
+
+@pytest.fixture
+def database(mock_spotify, tmp_path, monkeypatch):
+    url = f'sqlite:///{tmp_path / "main.db"}'
+    engine = create_db_engine(url)
+    catalog = mock_spotify.catalog
+    pd.DataFrame({'artist_id': list(catalog.artists)}).to_sql('artists_table', engine, index=False)
+    pd.DataFrame({'album_id': list(catalog.albums)}).to_sql('albums_table', engine, index=False)
+    pd.DataFrame({'track_id': list(catalog.tracks)}).to_sql('tracks_table', engine, index=False)
+    monkeypatch.setenv('DATABASE_URL', url)
+    monkeypatch.setenv('CHECKPOINT_PATH', str(tmp_path / 'checkpoints.sqlite'))
+    monkeypatch.delenv('SNAPSHOT_STORE_PATH', raising=False)
+    for name, value in [('_engine', None), ('_checkpoint_store', None), ('_ids_cache', {})]:
+        monkeypatch.setattr(main, name, value)
+    yield engine
+    main.get_engine().dispose()
+    engine.dispose()
+
+
+def test_failed_ids_are_saved_and_the_shard_is_marked_complete(mock_spotify, database):
+    bad_id = list(mock_spotify.catalog.tracks)[5]
+    mock_spotify.bad_ids = {bad_id}
+    rows_written = main.main()
+    assert rows_written['tracks_popularity_table'] == len(mock_spotify.catalog.tracks) - 1
+    failed = read_failed_ids(database)
+    assert failed[['stage', 'id']].values.tolist() == [['tracks_popularity', bad_id]]
+    assert completed_shards(database, 1) == {0}
+
+
+def test_shard_is_left_incomplete_above_max_failed_ids(mock_spotify, database, monkeypatch):
+    monkeypatch.setenv('MAX_FAILED_IDS', '0')
+    bad_id = list(mock_spotify.catalog.tracks)[5]
+    mock_spotify.bad_ids = {bad_id}
+    with pytest.raises(RuntimeError, match='MAX_FAILED_IDS'):
+        main.main()
+    assert completed_shards(database, 1) == set()
+    assert len(read_failed_ids(database)) == 1
+
+    # the re-run requests only the missing id, the rows of the first run come from the checkpoint
+    mock_spotify.bad_ids = set()
+    requests_before = mock_spotify.request_cnt
+    main.main()
+    assert mock_spotify.request_cnt - requests_before == 1
+    assert completed_shards(database, 1) == {0}
+    assert read_failed_ids(database).empty
+
+
+def test_ids_not_found_are_saved_but_do_not_block_the_shard(mock_spotify, database, monkeypatch):
+    monkeypatch.setenv('MAX_FAILED_IDS', '0')
+    pd.DataFrame({'track_id': ['0' * 22]}).to_sql('tracks_table', database, index=False, if_exists='append')
+    main.main()
+    failed = read_failed_ids(database)
+    assert failed[['stage', 'id', 'error']].values.tolist() == [['tracks_popularity', '0' * 22, 'not found']]
+    assert completed_shards(database, 1) == {0}
@@ -0,0 +1,127 @@
+import threading
+import time
+import pytest
+from spotipy.exceptions import SpotifyException
+from request_engine import RequestEngine, batches, retry_after_seconds
+
+
+def throttled(retry_after='0'):
+    return SpotifyException(429, -1, 'too many requests', headers={'Retry-After': retry_after})
+
+
+def test_call_retries_429_and_halves_the_rate():
+    engine = RequestEngine(max_rate=100, max_in_flight=2)
+    responses = [throttled(), throttled(), 'ok']
+
+    def fn():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert engine.call(fn) == 'ok'
+    assert engine.throttled_cnt == 2
+    assert engine.bucket.rate < 100
+
+
+def test_call_raises_after_max_retries():
+    engine = RequestEngine(max_rate=100, max_retries=2)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise throttled()
+
+    with pytest.raises(SpotifyException):
+        engine.call(fn)
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_other_errors():
+    engine = RequestEngine(max_rate=100)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise SpotifyException(400, -1, 'invalid id')
+
+    with pytest.raises(SpotifyException):
+        engine.call(fn)
+    assert len(calls) == 1
+
+
+def test_map_keeps_the_order_and_returns_errors():
+    engine = RequestEngine(max_rate=1000, max_in_flight=4)
+
+    def fn(item):
+        if item == 3:
+            raise ValueError(item)
+        time.sleep(0.001 * (10 - item))
+        return item * 2
+
+    output = list(engine.map(fn, range(10)))
+    assert [item for item, _, _ in output] == list(range(10))
+    assert [result for item, result, _ in output if item != 3] == [i * 2 for i in range(10) if i != 3]
+    assert isinstance(output[3][2], ValueError)
+
+
+def test_map_limits_requests_in_flight():
+    engine = RequestEngine(max_rate=1000, max_in_flight=3)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def fn(item):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.005)
+        with lock:
+            running[0] -= 1
+
+    list(engine.map(fn, range(20)))
+    assert running[1] <= 3
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(throttled('7')) == 7.0
+    assert retry_after_seconds(SpotifyException(429, -1, 'too many requests'), attempt=2) == 20.0
+
+
+def test_batches():
+    assert batches(range(5), 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_call_raises_429_without_response_headers_right_away():
+    engine = RequestEngine(max_rate=100)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        # raised by spotipy when the session is out of retries after server errors
+        raise SpotifyException(429, -1, 'Max Retries', headers={})
+
+    with pytest.raises(SpotifyException):
+        engine.call(fn)
+    assert len(calls) == 1
+    assert engine.throttled_cnt == 0
+    assert engine.bucket.rate == 100
+
+
+def test_server_outages_do_not_pause_the_engine(mock_spotify):
+    from request_engine import get_request_engine, is_rate_limited
+    from spotify_client import get_spotify_client
+    sp = get_spotify_client()
+    track_ids = list(mock_spotify.catalog.tracks)[:5]
+    sp.tracks(track_ids)
+    # every request of the session and its retries gets a 502 response
+    mock_spotify.outage_every = 1
+    mock_spotify.outage_length = 50
+    engine = get_request_engine()
+    started = time.monotonic()
+    with pytest.raises(SpotifyException) as raised:
+        engine.call(sp.tracks, track_ids)
+    assert not is_rate_limited(raised.value)
+    assert engine.throttled_cnt == 0
+    assert engine.bucket.rate == engine.max_rate
+    assert time.monotonic() - started < 5
+    assert mock_spotify.failed_cnt > 1
@@ -0,0 +1,56 @@
+import time
+import pytest
+import response_cache
+from response_cache import DEFAULT_TTLS, ResponseCache, get_response_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttls={'albums': 60, 'audio_features': None})
+    yield cache
+    cache.close()
+
+
+def test_get_many_returns_stored_responses_and_counts_hits(cache):
+    cache.set_many('albums', {'a': {'id': 'a'}, 'b': {'id': 'b'}})
+    assert cache.get_many('albums', ['a', 'b', 'c']) == {'a': {'id': 'a'}, 'b': {'id': 'b'}}
+    assert cache.get('albums', 'c', 'missing') == 'missing'
+    assert cache.stats() == {'albums': {'hits': 2, 'misses': 2}}
+
+
+def test_responses_expire_after_the_ttl_of_their_endpoint(cache, monkeypatch):
+    cache.set('albums', 'a', {'id': 'a'})
+    cache.set('audio_features', 'x', {'id': 'x'})
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 120)
+    assert cache.get_many('albums', ['a']) == {}
+    # endpoints without a TTL never expire
+    assert cache.get_many('audio_features', ['x']) == {'x': {'id': 'x'}}
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_bytes=250)
+    for key in range(10):
+        cache.set('audio_features', str(key), {'id': key, 'padding': 'x' * 10})
+    cache.get('audio_features', '9')
+    assert cache.size() <= 250
+    assert cache.get('audio_features', '9') is not None
+    assert cache.get('audio_features', '0') is None
+    cache.close()
+
+
+def test_popularity_bearing_responses_have_a_short_ttl():
+    assert DEFAULT_TTLS['albums'] <= 24 * 3600
+
+
+def test_shared_cache_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, '_cache', None)
+    monkeypatch.delenv('SPOTIFY_CACHE_PATH', raising=False)
+    assert get_response_cache() is None
+    monkeypatch.setenv('SPOTIFY_CACHE_PATH', '')
+    assert get_response_cache() is None
+    monkeypatch.setenv('SPOTIFY_CACHE_PATH', str(tmp_path / 'cache.sqlite'))
+    cache = get_response_cache()
+    assert cache is not None and cache.path == str(tmp_path / 'cache.sqlite')
+    assert get_response_cache() is cache
+    cache.close()
@@ -0,0 +1,44 @@
+import pandas as pd
+import sqlalchemy
+from schema import ID_DTYPE, ID_LENGTH, apply_schema, concat_tables, to_sql_frame
+
+
+def test_apply_schema_casts_to_compact_dtypes():
+    df = apply_schema(pd.DataFrame({'track_id': ['a', 'b'], 'track_popularity': [1, 2],
+                                    'date': ['2024-03-01', '2024-03-02'], 'other': [1.5, 2.5]}),
+                      'tracks_popularity_table')
+    assert df.dtypes.to_dict() == {'track_id': pd.api.types.pandas_dtype(ID_DTYPE), 'track_popularity': 'int8',
+                                   'date': 'datetime64[ns]', 'other': 'float64'}
+    # integer columns with missing values become nullable
+    df = apply_schema(pd.DataFrame({'track_id': ['a'], 'track_popularity': [None]}), 'tracks_popularity_table')
+    assert str(df['track_popularity'].dtype) == 'Int8'
+    unknown = pd.DataFrame({'x': [1]})
+    assert apply_schema(unknown, 'unknown_table') is unknown
+
+
+def test_concat_tables_keeps_categories():
+    frames = [pd.DataFrame({'album_id': pd.Categorical(['a', 'b']), 'album_popularity': [1, 2]}),
+              pd.DataFrame({'album_id': pd.Categorical(['c']), 'album_popularity': [3]})]
+    df = concat_tables(frames, 'albums_popularity_table')
+    assert df['album_id'].astype(str).tolist() == ['a', 'b', 'c']
+    assert str(df['album_popularity'].dtype) == 'int8'
+    assert concat_tables([], 'albums_popularity_table').empty
+
+
+def test_to_sql_frame_writes_plain_strings_dates_and_bounded_keys():
+    df = apply_schema(pd.DataFrame({'track_id': ['a'], 'track_popularity': [1], 'date': ['2024-03-01']}),
+                      'tracks_popularity_table')
+    df, dtype = to_sql_frame(df, ['track_id', 'date'])
+    assert df['track_id'].dtype == object
+    assert isinstance(dtype['date'], sqlalchemy.Date)
+    assert isinstance(dtype['track_id'], sqlalchemy.String) and dtype['track_id'].length == ID_LENGTH
+    assert to_sql_frame(df)[1].keys() == {'date'}
+
+
+def test_concat_tables_leaves_out_empty_frames():
+    empty = pd.DataFrame({'album_popularity': pd.Series([], dtype=float), 'album_id': pd.Series([], dtype=float)})
+    frame = pd.DataFrame({'album_id': ['a'], 'album_popularity': [1]})
+    df = concat_tables([empty, frame], 'albums_popularity_table')
+    assert list(df.columns) == ['album_id', 'album_popularity']
+    assert str(df['album_popularity'].dtype) == 'int8'
+    assert concat_tables([empty], 'albums_popularity_table').empty
@@ -0,0 +1,65 @@
+import os
+from datetime import date
+import pandas as pd
+import pytest
+import snapshot_store
+from snapshot_store import SnapshotStore
+
+pytest.importorskip('pyarrow')
+
+
+def popularity(track_ids, values, day='2024-03-01'):
+    return pd.DataFrame({'track_id': track_ids, 'track_popularity': values, 'date': pd.Timestamp(day)})
+
+
+def part_files(root, day='2024-03-01'):
+    return sorted(os.listdir(os.path.join(root, 'tracks_popularity_table', f'date={day}')))
+
+
+def test_write_and_read_by_dates_ids_and_columns(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(pd.concat([popularity(['b', 'a'], [2, 1], '2024-03-01'),
+                           popularity(['a', 'c'], [3, 4], '2024-03-02')]), 'tracks_popularity_table')
+    df = store.read('tracks_popularity_table')
+    assert df.columns.tolist() == ['track_id', 'date', 'track_popularity']
+    assert list(zip(df['track_id'], df['track_popularity'])) == [('a', 1), ('b', 2), ('a', 3), ('c', 4)]
+    assert str(df['track_popularity'].dtype) == 'int8'
+    df = store.read('tracks_popularity_table', start=date(2024, 3, 2), ids=['a'], columns=['track_popularity'])
+    assert df[['track_id', 'track_popularity']].values.tolist() == [['a', 3]]
+    assert store.dates('tracks_popularity_table') == [date(2024, 3, 1), date(2024, 3, 2)]
+    assert store.read('albums_popularity_table').empty
+
+
+def test_writing_the_same_chunk_again_replaces_its_file(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(popularity(['a', 'b'], [1, 2]), 'tracks_popularity_table')
+    store.write(popularity(['a', 'b'], [5, 6]), 'tracks_popularity_table')
+    assert len(part_files(tmp_path)) == 1
+    assert store.read('tracks_popularity_table')['track_popularity'].tolist() == [5, 6]
+
+
+def test_latest_write_wins_whatever_the_file_order(tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path))
+    # the second write sorts before the first one by file name, the write time decides
+    for written_at, chunk in [(2, popularity(['a', 'b', 'c'], [1, 2, 3])), (3, popularity(['b'], [20])),
+                              (1, popularity(['a', 'b'], [99, 99], '2024-03-02'))]:
+        monkeypatch.setattr(snapshot_store.time, 'time_ns', lambda: written_at)
+        store.write(chunk, 'tracks_popularity_table')
+    df = store.read('tracks_popularity_table', end=date(2024, 3, 1))
+    assert df['track_popularity'].tolist() == [1, 20, 3]
+
+
+def test_compact_merges_the_files_of_a_date(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(popularity(['a', 'b', 'c'], [1, 2, 3]), 'tracks_popularity_table')
+    store.write(popularity(['b', 'd'], [20, 4]), 'tracks_popularity_table')
+    store.write(popularity(['a'], [7], '2024-03-02'), 'tracks_popularity_table')
+    before = store.read('tracks_popularity_table')
+    assert store.compact('tracks_popularity_table') == 2
+    assert len(part_files(tmp_path)) == 1
+    assert len(part_files(tmp_path, '2024-03-02')) == 1
+    pd.testing.assert_frame_equal(store.read('tracks_popularity_table'), before)
+    # a write after the compaction still wins
+    store.write(popularity(['b'], [30]), 'tracks_popularity_table')
+    assert store.read('tracks_popularity_table', end=date(2024, 3, 1))['track_popularity'].tolist() == [1, 30, 3, 4]
+    assert store.compact('tracks_popularity_table', [date(2024, 3, 5)]) == 0
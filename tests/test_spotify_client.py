@@ -0,0 +1,14 @@
+from spotify_client import _build_session
+
+
+def test_session_leaves_429_to_the_request_engine():
+    retry = _build_session().get_adapter('https://api.spotify.com/v1/artists').max_retries
+    assert 429 not in retry.status_forcelist
+    # urllib3 would otherwise sleep and retry 429 responses carrying Retry-After itself
+    assert retry.respect_retry_after_header is False
+    assert retry.total == retry.status
+
+
+def test_session_retries_server_errors():
+    retry = _build_session().get_adapter('https://api.spotify.com/v1/artists').max_retries
+    assert set(retry.status_forcelist) == {500, 502, 503, 504}
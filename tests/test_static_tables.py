@@ -0,0 +1,104 @@
+import random
+import time
+import pandas as pd
+import pytest
+from extract_transform_data import get_static_tables, run_stages
+from db_loader import read_processed_album_ids, save_processed_album_ids
+
+
+def artist_names(mock):
+    return [artist['name'] for artist in mock.catalog.artists.values()]
+
+
+def test_incremental_run_skips_processed_albums(mock_spotify):
+    names = artist_names(mock_spotify)
+    seen_album_ids = set()
+    tables = get_static_tables(names[:2], seen_album_ids=seen_album_ids)
+    # every listed album is processed, the rejected ones too
+    listed = {album_id for artist_id in tables[0]['artist_id'] for album_id in mock_spotify.catalog.artist_albums[artist_id]}
+    assert seen_album_ids == listed
+    assert len(tables[1]) < len(listed)
+
+    requests_before = mock_spotify.request_cnt
+    updated = get_static_tables(names[:2], previous_tables=tables, seen_album_ids=seen_album_ids)
+    # only the album lists of the two artists are requested, no album is fetched again
+    assert mock_spotify.request_cnt - requests_before == 2
+    for table, previous in zip(updated, tables):
+        assert len(table) == len(previous)
+
+
+def test_incremental_run_matches_artists_by_normalized_name(mock_spotify):
+    names = artist_names(mock_spotify)
+    seen_album_ids = set()
+    tables = get_static_tables(names[:2], seen_album_ids=seen_album_ids)
+    roster = [names[0].upper(), f' {names[1].lower()}.', names[2]]
+    artists_table, albums_table, tracks_table, _ = get_static_tables(roster, previous_tables=tables,
+                                                                      seen_album_ids=seen_album_ids)
+    assert artists_table['artist_name'].tolist() == names[:3]
+    assert set(albums_table['artist_id']) == set(artists_table['artist_id'])
+    assert seen_album_ids == set(mock_spotify.catalog.albums) - {
+        album_id for artist_id in list(mock_spotify.catalog.artist_albums)[3:]
+        for album_id in mock_spotify.catalog.artist_albums[artist_id]}
+    assert tracks_table['track_id'].is_unique
+
+
+def test_failed_albums_are_not_marked_as_processed(mock_spotify):
+    names = artist_names(mock_spotify)
+    bad_album = mock_spotify.catalog.artist_albums[next(iter(mock_spotify.catalog.artists))][0]
+    mock_spotify.bad_ids = {bad_album}
+    seen_album_ids = set()
+    get_static_tables(names[:1], seen_album_ids=seen_album_ids)
+    assert bad_album not in seen_album_ids
+    assert len(seen_album_ids) == len(mock_spotify.catalog.artist_albums[next(iter(mock_spotify.catalog.artists))]) - 1
+
+
+def test_processed_album_ids_round_trip(sqlite_engine):
+    assert read_processed_album_ids(sqlite_engine) == set()
+    save_processed_album_ids({'a', 'b'}, sqlite_engine)
+    save_processed_album_ids({'b', 'c'}, sqlite_engine)
+    assert read_processed_album_ids(sqlite_engine) == {'a', 'b', 'c'}
+    with sqlite_engine.connect() as conn:
+        assert conn.exec_driver_sql('SELECT COUNT(*) FROM processed_albums_table').scalar() == 3
+
+
+def test_run_stages_keeps_the_chunk_order():
+    def slow(offset):
+        def fn(chunk):
+            time.sleep(random.random() / 1000)
+            return chunk + [offset]
+        return fn
+
+    outputs = run_stages([[i] for i in range(20)], [('a', slow(1)), ('b', slow(2)), ('c', slow(3))], queue_size=2)
+    assert outputs == [[i, 1, 2, 3] for i in range(20)]
+
+
+def test_run_stages_raises_the_first_error():
+    def fail_on_three(chunk):
+        if chunk == 3:
+            raise ValueError('chunk 3')
+        return chunk
+
+    with pytest.raises(ValueError, match='chunk 3'):
+        run_stages(range(100), [('fail', fail_on_three), ('identity', lambda chunk: chunk)], queue_size=1)
+
+
+def test_chunked_run_equals_a_single_chunk(mock_spotify):
+    names = artist_names(mock_spotify)
+    chunked = get_static_tables(names, artists_per_chunk=1)
+    single = get_static_tables(names, artists_per_chunk=len(names))
+    for table, expected in zip(chunked, single):
+        pd.testing.assert_frame_equal(table, expected)
+
+
+def test_chunks_without_artists_or_albums_do_not_fail_the_run(mock_spotify):
+    names = artist_names(mock_spotify)
+    expected = get_static_tables(names[:2])
+    tables = get_static_tables(['Nobody One', 'Nobody Two'] + names[:2], artists_per_chunk=2)
+    for table, expected_table in zip(tables, expected):
+        pd.testing.assert_frame_equal(table.reset_index(drop=True), expected_table.reset_index(drop=True))
+    assert [len(table) for table in get_static_tables(['Nobody One'])] == [0, 0, 0, 0]
+    # the album listing of the first artist fails
+    mock_spotify.bad_ids = {next(iter(mock_spotify.catalog.artists))}
+    tables = get_static_tables(names[:2], artists_per_chunk=1)
+    assert len(tables[0]) == 2
+    assert set(tables[1]['artist_id']) == set(list(mock_spotify.catalog.artists)[1:2])
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from track_similarity import FEATURE_COLUMNS, SimilarityIndex, load_similarity_index
+
+
+def features(n, seed=0, prefix='t'):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.random((n, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    df['loudness'] = -60 * df['loudness']
+    df['tempo'] = 60 + 120 * df['tempo']
+    # rounded features give tied similarities
+    df = df.round(1)
+    return df.assign(track_id=[f'{prefix}{i:05d}' for i in range(n)])
+
+
+def brute_force(index, track_ids, k):
+    vectors = index.vectors(index.track_ids)
+    queries = index.vectors(track_ids)
+    rows, similarities = [], []
+    for query, track_id in zip(queries, track_ids):
+        scores = vectors @ query
+        scores[index.track_ids.index(track_id)] = -np.inf
+        # most similar first, ties by position in the index
+        order = np.lexsort((np.arange(len(scores)), -scores))[:k]
+        rows.append(order)
+        similarities.append(scores[order])
+    return np.array(rows), np.array(similarities)
+
+
+@pytest.mark.parametrize('n, k', [(300, 5), (3000, 5), (3000, 20)])
+def test_most_similar_equals_brute_force(n, k):
+    index = SimilarityIndex.from_table(features(n))
+    track_ids = index.track_ids[::37]
+    df = index.most_similar(track_ids, k=k, batch_size=16)
+    rows, similarities = brute_force(index, track_ids, k)
+    assert df['similar_track_id'].tolist() == [index.track_ids[row] for row in rows.ravel()]
+    np.testing.assert_allclose(df['similarity'].to_numpy(), similarities.ravel(), rtol=1e-6)
+    assert df['rank'].tolist() == list(range(1, k + 1)) * len(track_ids)
+    assert not (df['track_id'] == df['similar_track_id']).any()
+
+
+def test_added_tracks_are_found_and_updated():
+    index = SimilarityIndex.from_table(features(100))
+    assert index.add(features(5, seed=1, prefix='new')) == 5
+    assert len(index) == 105
+    # a track with the features of another one is its most similar track
+    copy = features(100).iloc[[7]].assign(track_id='new00000')
+    assert index.add(copy) == 0
+    assert len(index) == 105
+    assert index.most_similar('new00000', k=1)['similar_track_id'].tolist() == ['t00007']
+
+
+def test_most_similar_to_features_of_tracks_not_in_the_index():
+    table = features(500)
+    index = SimilarityIndex.from_table(table)
+    df = index.most_similar_to_features(table.iloc[[3, 40]].assign(track_id=['x', 'y']), k=3)
+    assert df['track_id'].tolist() == ['x'] * 3 + ['y'] * 3
+    assert df['similarity'].iloc[0] == pytest.approx(1.0)
+    assert 't00003' in df['similar_track_id'].iloc[:3].tolist()
+
+
+def test_k_is_capped_by_the_index_size():
+    index = SimilarityIndex.from_table(features(3))
+    assert len(index.most_similar('t00000', k=10)) == 2
+    with pytest.raises(KeyError):
+        index.most_similar('unknown')
+
+
+def test_load_similarity_index(sqlite_engine):
+    features(50).to_sql('tracks_features_table', sqlite_engine, index=False)
+    index = load_similarity_index(sqlite_engine)
+    assert len(index) == 50
+    assert 't00049' in index
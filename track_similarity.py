@@ -0,0 +1,262 @@
+import threading
+import numpy as np
+import pandas as pd
+from db_loader import read_table
+
+
+# audio features compared by the similarity index, key and mode are categorical and left out
+FEATURE_COLUMNS = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness',
+                   'instrumentalness', 'liveness', 'valence', 'tempo']
+# query tracks scored at a time, every batch holds a (batch_size x tracks) float32 matrix
+QUERY_BATCH_SIZE = 256
+# columns per block of the top k search
+TOP_K_BLOCK = 256
+# rows allocated on the first build and added when the matrix is full
+MIN_CAPACITY = 1024
+
+
+def feature_matrix(df, columns=FEATURE_COLUMNS):
+    """Returns the audio features of a tracks_features_table as a contiguous float32 matrix.
+
+    Args:
+        df (pandas.DataFrame): rows of tracks_features_table
+        columns (list): feature columns, in the order of the matrix columns
+
+    Returns:
+        tuple: (track ids as a list, matrix of shape (tracks, features))
+    """
+    matrix = np.ascontiguousarray(df[columns].to_numpy(dtype=np.float32, na_value=np.nan))
+    return df['track_id'].astype(str).tolist(), matrix
+
+
+def _top_k(scores, k):
+    """Columns and values of the k largest scores of every row, largest first, ties by column.
+    The k-th largest block maximum is a lower bound of the k-th largest score, so only the
+    blocks reaching it are searched instead of partitioning every row.
+    """
+    queries, n = scores.shape
+    maxima = np.maximum.reduceat(scores, np.arange(0, n, TOP_K_BLOCK), axis=1)
+    blocks = maxima.shape[1]
+    if blocks < k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.lexsort((top, -top_scores), axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+    threshold = np.partition(maxima, blocks - k, axis=1)[:, blocks - k]
+    block_rows, block_ids = np.nonzero(maxima >= threshold[:, None])
+    # the last block may be shorter, its columns are clipped to the last column
+    columns = np.minimum(block_ids[:, None] * TOP_K_BLOCK + np.arange(TOP_K_BLOCK), n - 1)
+    values = scores[block_rows[:, None], columns]
+    keep = values >= threshold[block_rows][:, None]
+    rows = np.broadcast_to(block_rows[:, None], columns.shape)[keep]
+    columns, values = columns[keep], values[keep]
+    order = np.lexsort((columns, -values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    unique = np.ones(len(rows), dtype=bool)
+    unique[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    rows, columns, values = rows[unique], columns[unique], values[unique]
+    # every row has at least k candidates, the k blocks reaching the threshold
+    pick = np.searchsorted(rows, np.arange(queries))[:, None] + np.arange(k)
+    return columns[pick], values[pick]
+
+
+def _neighbours_frame(track_ids, ids, rows, similarities):
+    # one row per query track and rank, ids are the similar tracks of rows.ravel()
+    k = rows.shape[1]
+    return pd.DataFrame({'track_id': np.repeat(np.array(track_ids, dtype=object), k),
+                         'rank': np.tile(np.arange(1, k + 1, dtype=np.int16), len(track_ids)),
+                         'similar_track_id': ids,
+                         'similarity': similarities.ravel()})
+
+
+class SimilarityIndex:
+    """In-memory cosine similarity index of tracks by their audio features.
+    Features are standardized with the mean and standard deviation of the tracks the index was
+    built from, so loudness and tempo do not outweigh the features between 0 and 1, and rows
+    are scaled to unit length, so the cosine similarity of two tracks is a dot product.
+    Queries are answered in batches with one matrix product per batch.
+    Tracks added later are standardized with the same statistics, build the index again
+    to take them into account.
+
+    Args:
+        mean (numpy.ndarray): mean of every feature column
+        std (numpy.ndarray): standard deviation of every feature column
+        columns (list): feature columns
+    """
+
+    def __init__(self, mean, std, columns=FEATURE_COLUMNS):
+        self.columns = list(columns)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        # constant columns carry no information, they standardize to 0
+        self.std = np.where(np.asarray(std, dtype=np.float32) > 0, std, 1).astype(np.float32)
+        self._vectors = np.zeros((0, len(self.columns)), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_table(cls, df, columns=FEATURE_COLUMNS):
+        """Builds an index of the tracks of a tracks_features_table, standardized with their own statistics.
+
+        Args:
+            df (pandas.DataFrame): rows of tracks_features_table
+            columns (list): feature columns
+
+        Returns:
+            SimilarityIndex: the index
+        """
+        _, matrix = feature_matrix(df, columns)
+        index = cls(np.nanmean(matrix, axis=0), np.nanstd(matrix, axis=0), columns)
+        index.add(df)
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, track_id):
+        return track_id in self._rows
+
+    @property
+    def track_ids(self):
+        return list(self._ids)
+
+    def _normalize(self, matrix):
+        vectors = (matrix - self.mean) / self.std
+        # a missing feature counts as the mean
+        np.nan_to_num(vectors, copy=False, nan=0.0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1)
+        return vectors
+
+    def add(self, df):
+        """Adds tracks to the index, e.g. the tracks extracted by a static run.
+        Tracks already in the index get their new features.
+
+        Args:
+            df (pandas.DataFrame): rows of tracks_features_table
+
+        Returns:
+            int: number of tracks added that were not in the index yet
+        """
+        track_ids, matrix = feature_matrix(df.drop_duplicates('track_id', keep='last'), self.columns)
+        vectors = self._normalize(matrix)
+        with self._lock:
+            new_ids = []
+            new_rows = []
+            for position, track_id in enumerate(track_ids):
+                row = self._rows.get(track_id)
+                if row is None:
+                    self._rows[track_id] = self._size + len(new_ids)
+                    new_ids.append(track_id)
+                    new_rows.append(position)
+                else:
+                    self._vectors[row] = vectors[position]
+            if not new_ids:
+                return 0
+            end = self._size + len(new_ids)
+            if end > len(self._vectors):
+                # grow geometrically, so adding tracks one run at a time copies the matrix rarely
+                grown = np.zeros((max(end, 2 * len(self._vectors), MIN_CAPACITY), len(self.columns)),
+                                 dtype=np.float32)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            self._vectors[self._size:end] = vectors[new_rows]
+            self._ids.extend(new_ids)
+            self._size = end
+            return len(new_ids)
+
+    def vectors(self, track_ids):
+        """Returns the normalized vectors of tracks of the index.
+
+        Args:
+            track_ids (list): ids of tracks in the index
+
+        Returns:
+            numpy.ndarray: matrix of shape (len(track_ids), features)
+        """
+        missing = [track_id for track_id in track_ids if track_id not in self._rows]
+        if missing:
+            raise KeyError(f'tracks not in the similarity index: {missing[:5]}')
+        return self._vectors[[self._rows[track_id] for track_id in track_ids]]
+
+    def search(self, vectors, k=10, exclude_rows=None, batch_size=QUERY_BATCH_SIZE):
+        """Top k most similar tracks of normalized query vectors.
+
+        Args:
+            vectors (numpy.ndarray): normalized query vectors, shape (queries, features)
+            k (int): number of similar tracks per query
+            exclude_rows (numpy.ndarray, optional): row of the index to leave out per query,
+                e.g. the query track itself, -1 for none
+            batch_size (int): queries scored at a time
+
+        Returns:
+            tuple: (rows of the index, similarities), both of shape (queries, k), most similar first
+        """
+        matrix = self._vectors[:self._size]
+        k = min(k, self._size - (exclude_rows is not None))
+        if k <= 0:
+            return np.zeros((len(vectors), 0), dtype=np.int64), np.zeros((len(vectors), 0), dtype=np.float32)
+        rows = np.empty((len(vectors), k), dtype=np.int64)
+        similarities = np.empty((len(vectors), k), dtype=np.float32)
+        for start in range(0, len(vectors), batch_size):
+            batch = slice(start, start + batch_size)
+            scores = vectors[batch] @ matrix.T
+            if exclude_rows is not None:
+                excluded = exclude_rows[batch]
+                queries = np.flatnonzero(excluded >= 0)
+                scores[queries, excluded[queries]] = -np.inf
+            rows[batch], similarities[batch] = _top_k(scores, k)
+        return rows, similarities
+
+    def most_similar(self, track_ids, k=10, batch_size=QUERY_BATCH_SIZE):
+        """Top k most similar tracks of one or many tracks of the index, leaving out the tracks themselves.
+
+        Args:
+            track_ids (str or list): id of a track, or ids of many tracks
+            k (int): number of similar tracks per track
+            batch_size (int): tracks scored at a time
+
+        Returns:
+            pandas.DataFrame: track_id, rank (from 1), similar_track_id and similarity,
+            ordered by the order of track_ids and rank
+        """
+        if isinstance(track_ids, str):
+            track_ids = [track_ids]
+        with self._lock:
+            queries = self.vectors(track_ids)
+            exclude_rows = np.array([self._rows[track_id] for track_id in track_ids], dtype=np.int64)
+            rows, similarities = self.search(queries, k, exclude_rows, batch_size)
+            ids = [self._ids[row] for row in rows.ravel()]
+        return _neighbours_frame(track_ids, ids, rows, similarities)
+
+    def most_similar_to_features(self, df, k=10, batch_size=QUERY_BATCH_SIZE):
+        """Top k most similar tracks of the index to tracks that are not in it, e.g. just extracted.
+
+        Args:
+            df (pandas.DataFrame): rows of tracks_features_table
+            k (int): number of similar tracks per row
+            batch_size (int): rows scored at a time
+
+        Returns:
+            pandas.DataFrame: same columns as most_similar
+        """
+        track_ids, matrix = feature_matrix(df, self.columns)
+        with self._lock:
+            rows, similarities = self.search(self._normalize(matrix), k, None, batch_size)
+            ids = [self._ids[row] for row in rows.ravel()]
+        return _neighbours_frame(track_ids, ids, rows, similarities)
+
+
+def load_similarity_index(con, table_name='tracks_features_table'):
+    """Builds the similarity index of every track in the database, e.g. once per app process,
+    instead of one SQL query per lookup.
+
+    Args:
+        con (sqlalchemy.engine.Engine): database engine
+        table_name (str): table with the audio features
+
+    Returns:
+        SimilarityIndex: the index
+    """
+    return SimilarityIndex.from_table(read_table(table_name, con, columns=['track_id'] + FEATURE_COLUMNS))